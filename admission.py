@@ -0,0 +1,201 @@
+"""
+Admission control for the gateway's HTTP routes.
+
+Requests are admitted before a worker is spawned, so when the backends slow
+down the excess gets a fast 503 instead of piling up behind a full worker
+pool. Every route has a concurrency limit and a bounded wait queue, and each
+route class may only use part of the gateway's capacity: full listings are
+shed first, then single reads, and writes last. A streamed response keeps
+its slot until the body has been sent (or the client went away).
+"""
+import functools
+import threading
+import time
+
+from nameko.extensions import DependencyProvider, SharedExtension
+from werkzeug.wrappers import Response
+
+from compression import Compression
+from logs import get_logger
+from serialization import dumps
+from web import JsonHttpRequestHandler
+
+logger = get_logger(__name__)
+
+# route class -> (concurrency limit per route, share of the gateway capacity
+# the class may fill before its requests are shed)
+DEFAULT_CLASSES = {
+    'write': {'limit': 8, 'shed_at': 1.0},
+    'read': {'limit': 6, 'shed_at': 0.8},
+    'list': {'limit': 2, 'shed_at': 0.5},
+}
+DEFAULT_QUEUE_SIZE = 20
+DEFAULT_QUEUE_TIMEOUT = 1.0
+DEFAULT_RETRY_AFTER = 1
+
+
+def route_class_for(method, url):
+    """POST/PUT/DELETE are writes, GETs without a path parameter are full listings."""
+    if method != 'GET':
+        return 'write'
+    return 'read' if '<' in url else 'list'
+
+
+class RouteState:
+
+    def __init__(self, route_class, limit):
+        self.route_class = route_class
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = {'overload': 0, 'queue_full': 0, 'timeout': 0}
+
+
+class AdmissionController(SharedExtension):
+    """
+    One per gateway container, shared by all its AdmittedHttpRequestHandler
+    entrypoints. Settings come from ADMISSION in config.yml; capacity
+    defaults to the container's max_workers.
+    """
+
+    def setup(self):
+        config = self.container.config.get('ADMISSION', {})
+        self.capacity = config.get('capacity', self.container.config.get('max_workers', 10))
+        self.queue_size = config.get('queue_size', DEFAULT_QUEUE_SIZE)
+        self.queue_timeout = config.get('queue_timeout', DEFAULT_QUEUE_TIMEOUT)
+        self.retry_after = config.get('retry_after', DEFAULT_RETRY_AFTER)
+        self.classes = {
+            name: dict(settings, **config.get('classes', {}).get(name, {}))
+            for name, settings in DEFAULT_CLASSES.items()
+        }
+        self.routes = {}
+        self.in_flight = 0
+        self._changed = threading.Condition()
+
+    def _route(self, route, route_class):
+        state = self.routes.get(route)
+        if state is None:
+            state = self.routes[route] = RouteState(route_class, self.classes[route_class]['limit'])
+        return state
+
+    def _over_share(self, state):
+        return self.in_flight >= self.capacity * self.classes[state.route_class]['shed_at']
+
+    def _can_run(self, state):
+        return state.in_flight < state.limit and not self._over_share(state)
+
+    def acquire(self, route, route_class):
+        """
+        Admits the request or returns the reason it was shed: 'overload'
+        (its class may use less than the whole capacity and that share is
+        used up), 'queue_full' or 'timeout' (it waited queue_timeout seconds
+        without a slot). A class with the whole capacity waits instead.
+        """
+        with self._changed:
+            state = self._route(route, route_class)
+            if not self._can_run(state):
+                if self._over_share(state) and self.classes[route_class]['shed_at'] < 1:
+                    return self._shed(state, route, 'overload')
+                if state.waiting >= self.queue_size:
+                    return self._shed(state, route, 'queue_full')
+                state.waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while not self._can_run(state):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return self._shed(state, route, 'timeout')
+                        self._changed.wait(remaining)
+                finally:
+                    state.waiting -= 1
+            state.in_flight += 1
+            state.admitted += 1
+            self.in_flight += 1
+            return None
+
+    def release(self, route):
+        with self._changed:
+            self.routes[route].in_flight -= 1
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def _shed(self, state, route, reason):
+        state.shed[reason] += 1
+        logger.warning("Gateway: shedding %s (%s, %s in flight)", route, reason, self.in_flight)
+        return reason
+
+    def snapshot(self):
+        with self._changed:
+            return {
+                'capacity': self.capacity,
+                'in_flight': self.in_flight,
+                'routes': {
+                    route: {
+                        'class': state.route_class,
+                        'limit': state.limit,
+                        'in_flight': state.in_flight,
+                        'queue_depth': state.waiting,
+                        'admitted': state.admitted,
+                        'shed': dict(state.shed),
+                    }
+                    for route, state in self.routes.items()
+                },
+            }
+
+
+class AdmittedHttpRequestHandler(JsonHttpRequestHandler):
+    """
+    The gateway's http entrypoint (web.http) behind the AdmissionController.
+    The route class is derived from the method and URL unless given as
+    route_class; pass route_class=None to exempt a route (e.g. /metrics).
+    Responses go through Compression on the way out.
+    """
+
+    controller = AdmissionController()
+    compression = Compression()
+
+    def __init__(self, method, url, route_class='auto', **kwargs):
+        self.route = f'{method} {url}'
+        self.route_class = route_class_for(method, url) if route_class == 'auto' else route_class
+        super().__init__(method, url, **kwargs)
+
+    def handle_request(self, request):
+        return self.compression.apply(request, self._admit(request))
+
+    def _admit(self, request):
+        if self.route_class is None:
+            return super().handle_request(request)
+        shed = self.controller.acquire(self.route, self.route_class)
+        if shed:
+            return Response(
+                dumps({"error": "Service is overloaded, retry later.", "reason": shed}),
+                status=503,
+                headers={'Retry-After': str(self.controller.retry_after)},
+                mimetype='application/json',
+            )
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self.controller.release(self.route)
+            raise
+        if response.is_streamed:
+            # a streamed body is produced after the worker has returned, so
+            # the slot is held until the response is closed, which also
+            # happens when the body is never iterated (HEAD)
+            response.call_on_close(functools.partial(self.controller.release, self.route))
+        else:
+            self.controller.release(self.route)
+        return response
+
+
+http = AdmittedHttpRequestHandler.decorator
+
+
+class Admission(DependencyProvider):
+    """Gives the service the AdmissionController, for its metrics."""
+
+    controller = AdmissionController()
+
+    def get_dependency(self, worker_ctx):
+        return self.controller
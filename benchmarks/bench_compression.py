@@ -0,0 +1,99 @@
+"""
+CPU against bytes for gateway response compression, on payloads shaped
+like the real listings (rows from benchmarks/dataset.py, encoded with
+serialization.dumps as the gateway does).
+
+For every payload and setting it prints the compressed size, compression
+time, and the resulting time to deliver the body over a link of --mbit
+Mbit/s (compression time + transfer time). "stream" rows compress the
+ndjson listing in STREAM_BATCH_SIZE chunks with a flush per chunk, as the
+gateway does for ?stream=ndjson.
+
+    python benchmarks/bench_compression.py --rows 10000 --mbit 10
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import compression  # noqa: E402
+import serialization  # noqa: E402
+from dataset import Dataset  # noqa: E402
+from dependencies import ORDER_COLUMNS, ORDER_DETAIL_COLUMNS  # noqa: E402
+from gateway import STREAM_BATCH_SIZE  # noqa: E402
+
+
+def payloads(rows):
+    orders, details = [], []
+    detail_id = 0
+    for order, order_details, _ in Dataset(rows * 3):
+        if len(orders) < rows:
+            orders.append(dict(zip(ORDER_COLUMNS, order[:7] + (0,)), created_at=order[7]))
+        for line in order_details:
+            detail_id += 1
+            if len(details) < rows:
+                details.append(dict(zip(ORDER_DETAIL_COLUMNS, (detail_id, order[0]) + line)))
+        if len(orders) >= rows and len(details) >= rows:
+            break
+    return [
+        (f"orders x{len(orders)}", orders),
+        (f"order_details x{len(details)}", details),
+        ("order_details x20 (chef poll)", details[:20]),
+    ]
+
+
+def settings():
+    result = [('identity', None, None)]
+    result += [(f'gzip-{level}', 'gzip', dict(gzip_level=level)) for level in (1, 6, 9)]
+    if 'br' in compression.supported_encodings():
+        result += [(f'br-{quality}', 'br', dict(brotli_quality=quality)) for quality in (1, 5, 11)]
+    return result
+
+
+def compress_once(body, coding, options):
+    if coding is None:
+        return body
+    return compression.StreamCompressor(coding, **options).compress(body)
+
+
+def compress_stream(chunks, coding, options):
+    compressor = compression.StreamCompressor(coding, **options)
+    return b''.join(compressor.chunk(chunk) for chunk in chunks) + compressor.finish()
+
+
+def report(name, label, size, raw_size, seconds, mbit):
+    transfer = size * 8 / (mbit * 1000000)
+    print(f"{name:<32} {label:<16} {size:>10} bytes ({size / raw_size:6.1%})  "
+          f"cpu {seconds * 1000:8.2f} ms  delivered {(seconds + transfer) * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mbit', type=float, default=10.0, help='link speed for the delivered time')
+    args = parser.parse_args()
+
+    print(f"encodings available: {', '.join(compression.supported_encodings())}")
+    for name, rows in payloads(args.rows):
+        body = serialization.dumps(rows)
+        for label, coding, options in settings():
+            seconds = min(timeit.repeat(lambda: compress_once(body, coding, options), number=1, repeat=args.repeat))
+            report(name, label, len(compress_once(body, coding, options)), len(body), seconds, args.mbit)
+
+        if len(rows) > STREAM_BATCH_SIZE:
+            chunks = [
+                b'\n'.join(serialization.dumps(row) for row in rows[i:i + STREAM_BATCH_SIZE]) + b'\n'
+                for i in range(0, len(rows), STREAM_BATCH_SIZE)
+            ]
+            raw_size = sum(len(chunk) for chunk in chunks)
+            for label, coding, options in settings()[1:]:
+                seconds = min(timeit.repeat(lambda: compress_stream(chunks, coding, options), number=1, repeat=args.repeat))
+                report(name, f'stream {label}', len(compress_stream(chunks, coding, options)), raw_size, seconds, args.mbit)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Encoder comparison on gateway-shaped payloads: stdlib json, orjson (when
+installed) and serialization.dumps, which the gateway uses.
+
+    python benchmarks/bench_json_encoding.py --rows 10000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import serialization  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def order_rows(count):
+    return [{
+        'order_id': i,
+        'user_id': i % 500,
+        'reservasi_id': i % 50,
+        'event_id': i % 20,
+        'voucher_id': None,
+        'order_type': 1,
+        'total_payment': Decimal('125000.00') + i,
+        'version': 0,
+        'created_at': datetime.datetime(2024, 1, 1, 12, 0) + datetime.timedelta(minutes=i),
+    } for i in range(1, count + 1)]
+
+
+def detail_rows(count):
+    return [{
+        'order_detail_id': i,
+        'order_id': i // 4,
+        'menu_id': i % 120,
+        'chef_id': i % 12,
+        'quantity': 1 + i % 3,
+        'note': 'no onions' if i % 5 == 0 else None,
+        'status': ('PENDING', 'ON DELIVERY', 'COMPLETED')[i % 3],
+    } for i in range(1, count + 1)]
+
+
+def full_order():
+    return {'order': order_rows(1)[0], 'order_details': detail_rows(40), 'order_packages': []}
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=serialization._default).encode()
+
+
+def run(name, payload, repeat):
+    encoders = [('json', stdlib_dumps), ('serialization', serialization.dumps)]
+    if orjson is not None:
+        encoders.insert(1, ('orjson', lambda obj: orjson.dumps(obj, default=serialization._default)))
+    for encoder, func in encoders:
+        seconds = min(timeit.repeat(lambda: func(payload), number=1, repeat=repeat))
+        print(f"{name:<22} {encoder:<14} {seconds * 1000:9.2f} ms  {len(func(payload)):>10} bytes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"serialization.dumps uses {serialization.ENCODER}")
+    run(f"orders x{args.rows}", order_rows(args.rows), args.repeat)
+    run(f"order_details x{args.rows}", detail_rows(args.rows), args.repeat)
+    run("full order (40 lines)", full_order(), args.repeat * 100)
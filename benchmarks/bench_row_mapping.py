@@ -0,0 +1,88 @@
+"""
+Row mapping cost of the DatabaseWrapper read paths, without a database.
+
+Compares, for the orders table, the old path (SELECT * through a
+dictionary cursor, then copying each row into a second dict) with the
+path every read takes now (projected tuple cursor -> dicts). The cached
+lookups take it too, once per load; a cache hit returns the dicts as they
+are.
+
+Time is the median of --repeat runs with the garbage collector on, as in
+the services; peak memory comes from a separate run under tracemalloc,
+which would distort the timings.
+
+    python benchmarks/bench_row_mapping.py --rows 100000
+"""
+import argparse
+import datetime
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dependencies import ORDER_COLUMNS, wire_rows  # noqa: E402
+
+# SELECT * also returns columns the listing never uses
+ALL_COLUMNS = ORDER_COLUMNS + ('created_at',)
+
+
+def fake_fetchall(rows, columns):
+    created_at = datetime.datetime(2024, 1, 1, 12, 0)
+    return [
+        (i, i % 500, i % 50, i % 20, None, 1, Decimal('125000.00'), 0, created_at)[:len(columns)]
+        for i in range(1, rows + 1)
+    ]
+
+
+def old_path(raw):
+    # what a dictionary cursor hands back, followed by the per-key copy
+    dict_rows = [dict(zip(ALL_COLUMNS, row)) for row in raw]
+    result = []
+    for row in dict_rows:
+        result.append({
+            'order_id': row['order_id'],
+            'user_id': row['user_id'],
+            'reservasi_id': row['reservasi_id'],
+            'event_id': row['event_id'],
+            'voucher_id': row['voucher_id'],
+            'order_type': row['order_type'],
+            'total_payment': row['total_payment'],
+            'version': row['version'],
+        })
+    return result
+
+
+def listing_path(raw):
+    return wire_rows(ORDER_COLUMNS, raw)
+
+
+def measure(name, func, raw, repeat):
+    gc.collect()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(raw)
+        samples.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    func(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} {statistics.median(samples) * 1000:9.1f} ms (min {min(samples) * 1000:.1f})"
+          f"  peak {peak / 1024 / 1024:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.rows} order rows")
+    measure('select *', old_path, fake_fetchall(args.rows, ALL_COLUMNS), args.repeat)
+    measure('listing', listing_path, fake_fetchall(args.rows, ORDER_COLUMNS), args.repeat)
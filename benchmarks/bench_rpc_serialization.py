@@ -0,0 +1,55 @@
+"""
+Message size and encode/decode time of the RPC serializers: json (the
+nameko default) against order-msgpack (rpc_serialization).
+
+    python benchmarks/bench_rpc_serialization.py --rows 10000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import rpc_serialization  # noqa: E402
+import serialization  # noqa: E402
+from bench_json_encoding import detail_rows, full_order, order_rows  # noqa: E402
+
+
+def json_dumps(obj):
+    return json.dumps(obj, default=serialization._default).encode()
+
+
+def json_loads(data):
+    return json.loads(data)
+
+
+SERIALIZERS = [
+    ('json', json_dumps, json_loads),
+    ('order-msgpack', rpc_serialization.dumps, rpc_serialization.loads),
+]
+
+
+def run(name, payload, repeat):
+    for serializer, dumps, loads in SERIALIZERS:
+        data = dumps(payload)
+        encode = min(timeit.repeat(lambda: dumps(payload), number=1, repeat=repeat))
+        decode = min(timeit.repeat(lambda: loads(data), number=1, repeat=repeat))
+        print(f"{name:<22} {serializer:<14} {len(data):>10} bytes  "
+              f"encode {encode * 1000:8.2f} ms  decode {decode * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    item_call = {'args': [], 'kwargs': {
+        'order_id': 1234, 'menu_id': 17, 'chef_id': 3, 'quantity': 2, 'note': 'no onions', 'status': 'PENDING'
+    }}
+    run(f"orders x{args.rows}", order_rows(args.rows), args.repeat)
+    run(f"order_details x{args.rows}", detail_rows(args.rows), args.repeat)
+    run("full order (40 lines)", full_order(), args.repeat * 100)
+    run("item RPC call", item_call, args.repeat * 1000)
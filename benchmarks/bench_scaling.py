@@ -0,0 +1,243 @@
+"""
+How every DatabaseWrapper method scales with the amount of data.
+
+For each scale the tables are refilled from benchmarks/dataset.py, every
+public wrapper method is timed against ids taken from the middle of the
+data, and the growth between scales is reported as an exponent k in
+time ~ lines^k. A method whose time grows faster than the rows it returns
+(k - rows_k above --max-growth) is flagged: that is a full scan or an O(N)
+step where an index should have been used. Methods in
+schema.FULL_SCAN_ALLOWED read whole tables on purpose and are timed once.
+
+    python benchmarks/bench_scaling.py --backend mysql --database abl_order_bench
+    python benchmarks/bench_scaling.py --backend memory --scales 10000 100000 --output scaling.json
+"""
+import argparse
+import inspect
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import schema  # noqa: E402
+from dataset import DEFAULT_SEED, Dataset, load_memory, load_mysql  # noqa: E402
+from dependencies import DatabaseWrapper  # noqa: E402
+from pagination import encode_cursor  # noqa: E402
+
+DEFAULT_SCALES = [10000, 1000000, 10000000]
+ITEMS = [(101, 7, 1, None, 'PENDING'), (102, 7, 2, 'no onion', 'PENDING'), (103, 12, 1, None, 'PENDING')]
+
+
+class Target:
+    """The ids a scale's calls are aimed at, all from the middle of the data."""
+
+    def __init__(self, orders, details, packages, chefs):
+        self.order_id = orders // 2
+        self.detail_id = details // 2
+        self.package_id = packages // 2
+        # a chef from the middle of the Zipf curve, not the busiest one
+        self.chef_id = max(chefs // 10, 1)
+        self.detail_ids = list(range(max(self.detail_id - 500, 1), self.detail_id + 500, 50))
+        self.package_ids = list(range(max(self.package_id - 500, 1), self.package_id + 500, 50))
+
+
+def victim(db):
+    """A fresh order for the destructive calls, so the dataset stays put."""
+    return db.add_order_with_items(1, None, None, None, 1, 0, '2024-06-01 12:00:00', ITEMS, ITEMS)
+
+
+# name -> (setup(db, target) or None, kwargs(target, setup_result))
+CALLS = {
+    'get_all_orders': (None, lambda t, v: {}),
+    'get_all_order_details': (None, lambda t, v: {}),
+    'get_all_order_packages': (None, lambda t, v: {}),
+    'get_orders_page': (None, lambda t, v: dict(limit=100, after=encode_cursor(t.order_id))),
+    'get_order_details_page': (None, lambda t, v: dict(limit=100, after=encode_cursor(t.detail_id))),
+    'get_order_packages_page': (None, lambda t, v: dict(limit=100, after=encode_cursor(t.package_id))),
+    'get_order_full': (None, lambda t, v: dict(order_id=t.order_id)),
+    'get_order_details_orderID': (None, lambda t, v: dict(order_id=t.order_id)),
+    'get_order_packages_orderID': (None, lambda t, v: dict(order_id=t.order_id)),
+    'get_order_details_chefID': (None, lambda t, v: dict(chef_id=t.chef_id)),
+    'get_order_packages_chefID': (None, lambda t, v: dict(chef_id=t.chef_id)),
+    'get_affected_keys': (None, lambda t, v: dict(table='order_details', column='order_id', value=t.order_id)),
+    'add_order': (None, lambda t, v: dict(
+        user_id=1, reservasi_id=None, event_id=None, voucher_id=None, order_type=1, total_payment=0,
+        created_at='2024-06-01 12:00:00')),
+    'add_order_with_items': (None, lambda t, v: dict(
+        user_id=1, reservasi_id=None, event_id=None, voucher_id=None, order_type=1, total_payment=0,
+        created_at='2024-06-01 12:00:00', details=ITEMS, packages=ITEMS)),
+    'add_order_details': (None, lambda t, v: dict(
+        order_id=t.order_id, menu_id=101, chef_id=7, quantity=1, note=None, status='PENDING')),
+    'add_order_packages': (None, lambda t, v: dict(
+        order_id=t.order_id, menu_package_id=201, chef_id=7, quantity=1, note=None, status='PENDING')),
+    'update_order': (None, lambda t, v: dict(order_id=t.order_id, update_data={'total_payment': 10})),
+    'change_order_details_status': (None, lambda t, v: dict(order_detail_id=t.detail_id, new_status='COMPLETED')),
+    'change_order_packages_status': (None, lambda t, v: dict(order_package_id=t.package_id, new_status='COMPLETED')),
+    'change_order_details_status_bulk': (None, lambda t, v: dict(order_detail_ids=t.detail_ids, new_status='COMPLETED')),
+    'change_order_packages_status_bulk': (None, lambda t, v: dict(order_package_ids=t.package_ids, new_status='COMPLETED')),
+    'change_order_details_quantity': (None, lambda t, v: dict(order_detail_id=t.detail_id, new_quantity=2)),
+    'change_order_packages_quantity': (None, lambda t, v: dict(order_package_id=t.package_id, new_quantity=2)),
+    'change_order_details_note': (None, lambda t, v: dict(order_detail_id=t.detail_id, new_note='less salt')),
+    'change_order_packages_note': (None, lambda t, v: dict(order_package_id=t.package_id, new_note='less salt')),
+    'claim_idempotency_key': (None, lambda t, v: dict(key=f'bench-{time.perf_counter_ns()}', request_hash='0' * 64, lease_seconds=60)),
+    'get_idempotency_key': (None, lambda t, v: dict(key='bench-missing')),
+    'complete_idempotency_key': (None, lambda t, v: dict(key='bench-missing', response='{}', ttl_seconds=60)),
+    'release_idempotency_key': (None, lambda t, v: dict(key='bench-missing')),
+    'purge_idempotency_keys': (None, lambda t, v: dict(limit=1000)),
+    'delete_order': (victim, lambda t, v: dict(order_id=v['order_id'])),
+    'delete_orders': (victim, lambda t, v: dict(order_ids=[v['order_id']])),
+    'delete_order_detail': (victim, lambda t, v: dict(order_detail_id=v['detail_ids'][0])),
+    'delete_order_package': (victim, lambda t, v: dict(order_package_id=v['package_ids'][0])),
+    'delete_order_details_by_order_id': (victim, lambda t, v: dict(order_id=v['order_id'])),
+    'delete_order_packages_by_order_id': (victim, lambda t, v: dict(order_id=v['order_id'])),
+}
+
+
+def wrapper_methods():
+    return [name for name, _ in inspect.getmembers(DatabaseWrapper, inspect.isfunction) if not name.startswith('_')]
+
+
+def row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict) and 'items' in result:
+        return len(result['items'])
+    if isinstance(result, dict) and 'order_details' in result:
+        return 1 + len(result['order_details']) + len(result['order_packages'])
+    return 1
+
+
+def time_method(db, name, target, repeat):
+    setup, kwargs = CALLS[name]
+    if name in schema.FULL_SCAN_ALLOWED:
+        repeat = 1
+    samples = []
+    rows = 0
+    for _ in range(repeat):
+        prepared = setup(db) if setup else None
+        args = kwargs(target, prepared)
+        started = time.perf_counter()
+        result = getattr(db, name)(**args)
+        samples.append(time.perf_counter() - started)
+        rows = row_count(result)
+    return {'seconds': statistics.median(samples), 'rows': rows}
+
+
+class MysqlBackend:
+
+    def __init__(self, database):
+        import mysql.connector
+        config = schema.load_mysql_config()
+        self.connection = mysql.connector.connect(**dict(config, database=database))
+        schema.clone_schema(self.connection, config['database'])
+        schema.migrate(self.connection)
+
+    def load(self, dataset):
+        return load_mysql(self.connection, dataset)
+
+    def wrapper(self):
+        return DatabaseWrapper(self.connection)
+
+    def close(self):
+        self.connection.close()
+
+
+class MemoryBackend:
+
+    def __init__(self):
+        self.store = None
+
+    def load(self, dataset):
+        from memorydb import MemoryStore
+        self.store = MemoryStore()
+        return load_memory(self.store, dataset)
+
+    def wrapper(self):
+        from memorydb import MemoryDatabaseWrapper
+        return MemoryDatabaseWrapper(self.store)
+
+    def close(self):
+        pass
+
+
+def growth(results, scales, max_growth, noise_floor):
+    """
+    Exponent of time and returned rows over each step between scales. Steps
+    where both timings are under noise_floor seconds are never flagged.
+    """
+    report = {}
+    for name in results[scales[0]]:
+        steps = []
+        for small, large in zip(scales, scales[1:]):
+            a, b = results[small][name], results[large][name]
+            span = math.log(large / small)
+            k = math.log(max(b['seconds'], 1e-9) / max(a['seconds'], 1e-9)) / span
+            rows_k = math.log(max(b['rows'], 1) / max(a['rows'], 1)) / span
+            noisy = max(a['seconds'], b['seconds']) < noise_floor
+            steps.append({'from': small, 'to': large, 'k': round(k, 3), 'rows_k': round(rows_k, 3), 'noisy': noisy})
+        flagged = name not in schema.FULL_SCAN_ALLOWED and any(
+            s['k'] - s['rows_k'] > max_growth and not s['noisy'] for s in steps
+        )
+        report[name] = {'steps': steps, 'flagged': flagged}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['mysql', 'memory'], default='mysql')
+    parser.add_argument('--database', default='abl_order_bench', help='MySQL database to fill (it is emptied first)')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='order lines per run')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--max-growth', type=float, default=0.5,
+                        help='flag methods whose time exponent exceeds their row exponent by this much')
+    parser.add_argument('--noise-floor-ms', type=float, default=0.1,
+                        help='do not flag steps where both timings are below this')
+    parser.add_argument('--output', help='also write the JSON report here')
+    args = parser.parse_args()
+
+    missing = set(wrapper_methods()) - set(CALLS)
+    if missing:
+        parser.error(f"no benchmark call for: {', '.join(sorted(missing))}")
+
+    backend = MysqlBackend(args.database) if args.backend == 'mysql' else MemoryBackend()
+    scales = sorted(args.scales)
+    results = {}
+    try:
+        for lines in scales:
+            dataset = Dataset(lines, args.seed)
+            started = time.perf_counter()
+            orders, details, packages = backend.load(dataset)
+            print(f"\n{lines} lines: {orders} orders, {details} details, {packages} packages "
+                  f"(loaded in {time.perf_counter() - started:.1f}s)")
+            target = Target(orders, details, packages, dataset.chefs)
+            db = backend.wrapper()
+            results[lines] = {}
+            for name in sorted(CALLS):
+                results[lines][name] = time_method(db, name, target, args.repeat)
+                print(f"  {name:<36} {results[lines][name]['seconds'] * 1000:10.3f} ms  "
+                      f"{results[lines][name]['rows']:>9} rows")
+    finally:
+        backend.close()
+
+    report = growth(results, scales, args.max_growth, args.noise_floor_ms / 1000) if len(scales) > 1 else {}
+    if report:
+        print("\nGrowth (time ~ lines^k):")
+        for name, entry in sorted(report.items()):
+            steps = "  ".join(f"{s['from']}->{s['to']}: k={s['k']:+.2f} rows_k={s['rows_k']:+.2f}" for s in entry['steps'])
+            print(f"  {'!' if entry['flagged'] else ' '} {name:<36} {steps}")
+        flagged = sorted(name for name, entry in report.items() if entry['flagged'])
+        print(f"\nFlagged: {', '.join(flagged) if flagged else 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': args.backend, 'seed': args.seed, 'results': results, 'growth': report}, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Resident memory of the services while a full listing goes out, buffered
+versus streamed (?stream=ndjson|json).
+
+The gateway and the RPC services run in a child process on the memory
+backend and memorybroker (as in loadtest.py), filled from dataset.py. The
+parent requests GET /order-details once, reads the body without keeping
+it and samples the child's resident set size (VmRSS) meanwhile. Every mode
+gets a fresh child: freed memory is rarely handed back to the OS, so an
+earlier peak would hide a later one. Linux only (reads /proc).
+
+    python benchmarks/bench_stream_memory.py --lines 300000
+"""
+import argparse
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+# query string of each mode
+MODES = {
+    'buffered': '',
+    'ndjson': '?stream=ndjson',
+    'json': '?stream=json',
+}
+SAMPLE_INTERVAL = 0.005
+
+
+def rss(pid):
+    """Resident set size of process pid in bytes."""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f"No VmRSS for process {pid}")
+
+
+def serve(port, lines, seed):
+    """Child: loads the dataset, starts the services and runs until killed."""
+    import eventlet
+
+    import loadtest
+    import memorydb
+    from dataset import Dataset, load_memory
+
+    load_memory(memorydb.shared_store(), Dataset(lines, seed))
+    loadtest.start_services(loadtest.load_config('memory://', port))
+    print('ready', flush=True)
+    while True:
+        eventlet.sleep(1)
+
+
+def start_server(port, lines, seed):
+    server = subprocess.Popen(
+        [sys.executable, __file__, '--serve', '--port', str(port), '--lines', str(lines), '--seed', str(seed)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    for line in server.stdout:
+        if line.strip() == 'ready':
+            break
+    else:
+        raise RuntimeError("Service process exited before it was ready")
+    # the first request pays for the worker and RPC reply machinery; keep it out of the baseline
+    requests.get(f'http://127.0.0.1:{port}/order-details?limit=1').raise_for_status()
+    return server
+
+
+def measure(port, pid, query):
+    baseline = peak = rss(pid)
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, rss(pid))
+            time.sleep(SAMPLE_INTERVAL)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    size = 0
+    started = time.perf_counter()
+    try:
+        # identity, so the numbers are about the listing and not about Compression
+        with requests.get(f'http://127.0.0.1:{port}/order-details{query}', stream=True,
+                          headers={'Accept-Encoding': 'identity'}) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(65536):
+                size += len(chunk)
+    finally:
+        elapsed = time.perf_counter() - started
+        done.set()
+        sampler.join()
+    return size, elapsed, baseline, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=300000, help='order_details + order_packages rows')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.lines, args.seed)
+        return
+
+    import loadtest
+
+    print(f"{args.lines} order lines, GET /order-details on the memory backend")
+    for mode in args.modes:
+        port = loadtest.free_port()
+        server = start_server(port, args.lines, args.seed)
+        try:
+            size, elapsed, baseline, peak = measure(port, server.pid, MODES[mode])
+        finally:
+            server.kill()
+            server.wait()
+        print(f"{mode:<10} {size / 1024 / 1024:8.1f} MiB body {elapsed:7.2f} s  "
+              f"rss {baseline / 1024 / 1024:7.1f} -> {peak / 1024 / 1024:7.1f} MiB  "
+              f"(+{(peak - baseline) / 1024 / 1024:.1f} MiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Deterministic synthetic order data: the same seed and line count always
+give the same rows.
+
+Shapes follow a real kitchen rather than uniform noise:
+  * chefs are Zipf-distributed, so a handful of chefs own most lines
+  * orders carry 1-12 items, most of them 1-4, about a fifth of them packages
+  * old orders are almost all COMPLETED, the most recent ones are still
+    PENDING or ON DELIVERY
+
+    python benchmarks/dataset.py --lines 1000000 --database abl_order_bench
+"""
+import argparse
+import bisect
+import datetime
+import itertools
+import os
+import random
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_CHEFS = 200
+DEFAULT_SEED = 1
+CHEF_SKEW = 1.1
+PACKAGE_SHARE = 0.2
+# share of orders, newest first, that are still being worked on
+OPEN_SHARE = 0.02
+
+ITEM_COUNTS = list(range(1, 13))
+ITEM_COUNT_WEIGHTS = [30, 25, 17, 10, 6, 4, 3, 2, 1, 1, 0.5, 0.5]
+NOTES = [None] * 8 + ['no onion', 'extra spicy', 'less salt', 'gift wrap']
+BASE_TIME = datetime.datetime(2024, 1, 1, 10, 0)
+
+
+class Dataset:
+    """
+    Iterates (order, details, packages) for `lines` order lines in total.
+    order is a tuple in ORDER_INSERT_COLUMNS order, details/packages are
+    (menu_id, chef_id, quantity, note, status) tuples as taken by
+    add_order_with_items. Order ids are 1..orders and line ids are handed out
+    in iteration order, so after loading into an empty table they match.
+    """
+
+    ORDER_INSERT_COLUMNS = ('order_id', 'user_id', 'reservasi_id', 'event_id', 'voucher_id',
+                            'order_type', 'total_payment', 'created_at')
+
+    def __init__(self, lines, seed=DEFAULT_SEED, chefs=DEFAULT_CHEFS):
+        self.lines = lines
+        self.seed = seed
+        self.chefs = chefs
+        self._chef_weights = list(itertools.accumulate(1 / rank ** CHEF_SKEW for rank in range(1, chefs + 1)))
+        # counted on the first full pass
+        self.orders = None
+        self.details = None
+        self.packages = None
+
+    def chef(self, rng):
+        return bisect.bisect_left(self._chef_weights, rng.random() * self._chef_weights[-1]) + 1
+
+    def status(self, rng, age):
+        """age runs from 0 for the newest order to 1 for the oldest."""
+        if age > OPEN_SHARE:
+            return 'COMPLETED' if rng.random() < 0.98 else 'ON DELIVERY'
+        return rng.choices(['PENDING', 'ON DELIVERY', 'COMPLETED'], [60, 30, 10])[0]
+
+    def __iter__(self):
+        rng = random.Random(self.seed)
+        # roughly, for the status age; the exact count is known after a pass
+        expected_orders = max(self.lines // 3, 1)
+        remaining = self.lines
+        order_id = details = packages = 0
+        while remaining > 0:
+            order_id += 1
+            count = min(rng.choices(ITEM_COUNTS, ITEM_COUNT_WEIGHTS)[0], remaining)
+            remaining -= count
+            age = max(1 - order_id / expected_orders, 0)
+            order = (
+                order_id, rng.randint(1, 100000), None, None, None, rng.choice((1, 1, 1, 2)),
+                Decimal(rng.randint(20, 2000) * 500) / 100,
+                BASE_TIME + datetime.timedelta(minutes=order_id // 4),
+            )
+            order_details, order_packages = [], []
+            for _ in range(count):
+                row = (rng.randint(1, 500), self.chef(rng), rng.randint(1, 4), rng.choice(NOTES), self.status(rng, age))
+                if rng.random() < PACKAGE_SHARE:
+                    order_packages.append(row)
+                else:
+                    order_details.append(row)
+            details += len(order_details)
+            packages += len(order_packages)
+            yield order, order_details, order_packages
+        self.orders, self.details, self.packages = order_id, details, packages
+
+    def count(self):
+        if self.orders is None:
+            for _ in self:
+                pass
+        return self.orders, self.details, self.packages
+
+
+def load_mysql(connection, dataset, batch_orders=2000):
+    """
+    Empties the three tables and bulk loads dataset into them with
+    multi-row INSERTs. Returns (orders, details, packages) counts.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in ('order_details', 'order_packages', 'orders'):
+            cursor.execute(f"TRUNCATE TABLE `{table}`")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+        order_sql = (f"INSERT INTO orders ({', '.join(Dataset.ORDER_INSERT_COLUMNS)}) "
+                     "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)")
+        detail_sql = "INSERT INTO order_details (order_id, menu_id, chef_id, quantity, note, status) VALUES (%s, %s, %s, %s, %s, %s)"
+        package_sql = "INSERT INTO order_packages (order_id, menu_package_id, chef_id, quantity, note, status) VALUES (%s, %s, %s, %s, %s, %s)"
+
+        rows = iter(dataset)
+        while True:
+            batch = list(itertools.islice(rows, batch_orders))
+            if not batch:
+                break
+            cursor.executemany(order_sql, [order for order, _, _ in batch])
+            details = [(order[0],) + row for order, order_details, _ in batch for row in order_details]
+            packages = [(order[0],) + row for order, _, order_packages in batch for row in order_packages]
+            if details:
+                cursor.executemany(detail_sql, details)
+            if packages:
+                cursor.executemany(package_sql, packages)
+            connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return dataset.count()
+
+
+def load_memory(store, dataset):
+    """Fills an empty memorydb.MemoryStore with dataset."""
+    with store.lock:
+        for order, details, packages in dataset:
+            store.orders.insert(dict(zip(Dataset.ORDER_INSERT_COLUMNS[1:], order[1:]), version=0))
+            for menu_id, chef_id, quantity, note, status in details:
+                store.order_details.insert(dict(
+                    order_id=order[0], menu_id=menu_id, chef_id=chef_id, quantity=quantity, note=note, status=status
+                ))
+            for menu_package_id, chef_id, quantity, note, status in packages:
+                store.order_packages.insert(dict(
+                    order_id=order[0], menu_package_id=menu_package_id, chef_id=chef_id, quantity=quantity, note=note, status=status
+                ))
+    return dataset.count()
+
+
+def main():
+    import mysql.connector
+
+    import schema
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=10000, help='order_details + order_packages rows')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--chefs', type=int, default=DEFAULT_CHEFS)
+    parser.add_argument('--database', default=None, help='defaults to the MYSQL database of config.yml')
+    args = parser.parse_args()
+
+    config = schema.load_mysql_config()
+    args.database = args.database or config['database']
+    connection = mysql.connector.connect(**dict(config, database=args.database))
+    try:
+        schema.clone_schema(connection, config['database'])
+        schema.migrate(connection)
+        orders, details, packages = load_mysql(connection, Dataset(args.lines, args.seed, args.chefs))
+        print(f"Loaded {orders} orders, {details} order details, {packages} order packages into {args.database}")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
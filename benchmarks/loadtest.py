@@ -0,0 +1,262 @@
+"""
+End-to-end HTTP load test of the gateway. GatewayService and the three RPC
+services run in-process as nameko containers on the in-memory database
+backend (DATABASE_BACKEND: memory), which they all share, and AMQP defaults
+to kombu's in-process memory transport (see memorybroker), so nothing
+outside this process is needed. Pass --amqp-uri to run over a real broker
+instead.
+
+    python benchmarks/loadtest.py --duration 30 --concurrency 20 --output run.json
+
+Clients replay a weighted mix of kitchen traffic (order creation with N
+items, chef polling, status flips, listings) and the run reports throughput
+and p50/p95/p99 latency per route as JSON, so runs can be diffed.
+"""
+import eventlet
+eventlet.monkey_patch()  # noqa: E402
+
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import sys
+import time
+
+import requests
+import yaml
+from nameko.containers import ServiceContainer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gateway import GatewayService  # noqa: E402
+import memorybroker  # noqa: E402
+from orderDetailService import orderDetailsService  # noqa: E402
+from orderPackageService import orderPackagesService  # noqa: E402
+from orderService import OrdersService  # noqa: E402
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'config.yml')
+
+STATUSES = ['PENDING', 'ON DELIVERY', 'COMPLETED']
+
+# (scenario, weight)
+DEFAULT_MIX = [
+    ('create_order', 20),
+    ('poll_chef_details', 25),
+    ('poll_chef_packages', 15),
+    ('flip_detail_status', 15),
+    ('flip_status_bulk', 10),
+    ('order_full', 5),
+    ('list_orders_page', 5),
+    ('list_details_stream', 5),
+]
+
+# Collapses concrete ids so that latencies group per route
+ROUTE_IDS = re.compile(r'/\d+(?=/|$)')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def load_config(amqp_uri, port):
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config.pop('LOGGING', None)
+    config['DATABASE_BACKEND'] = 'memory'
+    config['AMQP_URI'] = memorybroker.URI if amqp_uri == 'memory://' else amqp_uri
+    config['WEB_SERVER_ADDRESS'] = f'127.0.0.1:{port}'
+    return config
+
+
+def start_services(config):
+    containers = []
+    for service_cls in (OrdersService, orderDetailsService, orderPackagesService, GatewayService):
+        container = ServiceContainer(service_cls, config)
+        container.start()
+        containers.append(container)
+    return containers
+
+
+class Workload:
+    """
+    Shared state of one run: the ids created so far (so that status flips
+    and polls hit real rows) and the recorded latencies per route.
+    """
+
+    def __init__(self, base_url, items_per_order, chefs, seed):
+        self.base_url = base_url
+        self.items_per_order = items_per_order
+        self.chefs = chefs
+        self.random = random.Random(seed)
+        self.order_ids = []
+        self.detail_ids = []
+        self.samples = {}
+        self.errors = {}
+        # 503s from gateway admission control
+        self.shed = {}
+
+    def request(self, session, method, path, **kwargs):
+        route = f"{method} {ROUTE_IDS.sub('/<id>', path.split('?')[0])}"
+        started = time.perf_counter()
+        try:
+            response = session.request(method, self.base_url + path, timeout=30, **kwargs)
+            body = response.content
+            ok = response.status_code < 500
+        except requests.RequestException:
+            response, body, ok = None, b'', False
+        self.samples.setdefault(route, []).append(time.perf_counter() - started)
+        if response is not None and response.status_code == 503:
+            self.shed[route] = self.shed.get(route, 0) + 1
+        elif not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+        return response, body
+
+    def chef(self):
+        # a few chefs take most of the lines, like a real kitchen
+        return min(int(self.random.paretovariate(1.2)), self.chefs)
+
+    # --- scenarios --- #
+
+    def create_order(self, session):
+        items = []
+        for _ in range(self.items_per_order):
+            kind = 'menu_item' if self.random.random() < 0.8 else 'menu_package'
+            items.append({
+                'type': kind, 'id': self.random.randint(1, 500), 'quantity': self.random.randint(1, 4),
+                'chef_id': self.chef(), 'note': self.random.choice([None, 'no onion', 'extra spicy']),
+            })
+        response, _ = self.request(session, 'POST', '/orders/create_with_items', json={
+            'items': items, 'user_id': self.random.randint(1, 10000), 'order_type': 1,
+            'total_payment': round(self.random.uniform(5, 200), 2),
+        })
+        if response is not None and response.ok:
+            result = response.json()
+            self.order_ids.append(result['order_id'])
+            for entry in result['items_processing_results']:
+                if entry['item']['type'] == 'menu_item' and entry.get('result'):
+                    self.detail_ids.append(entry['result']['id'])
+
+    def poll_chef_details(self, session):
+        self.request(session, 'GET', f'/order-details/by-chef/{self.chef()}')
+
+    def poll_chef_packages(self, session):
+        self.request(session, 'GET', f'/order-packages/by-chef/{self.chef()}')
+
+    def flip_detail_status(self, session):
+        if not self.detail_ids:
+            return self.create_order(session)
+        detail_id = self.random.choice(self.detail_ids)
+        self.request(session, 'PUT', f'/order-details/{detail_id}/status',
+                     json={'new_status': self.random.choice(STATUSES)})
+
+    def flip_status_bulk(self, session):
+        if not self.detail_ids:
+            return self.create_order(session)
+        ids = self.random.sample(self.detail_ids, min(len(self.detail_ids), 20))
+        self.request(session, 'PUT', '/order-details/status',
+                     json={'ids': ids, 'new_status': self.random.choice(STATUSES)})
+
+    def order_full(self, session):
+        if not self.order_ids:
+            return self.create_order(session)
+        self.request(session, 'GET', f'/orders/{self.random.choice(self.order_ids)}/full')
+
+    def list_orders_page(self, session):
+        self.request(session, 'GET', '/orders?limit=100')
+
+    def list_details_stream(self, session):
+        self.request(session, 'GET', '/order-details?stream=ndjson')
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def report(workload, elapsed, args):
+    routes = {}
+    for route, samples in sorted(workload.samples.items()):
+        ordered = sorted(samples)
+        routes[route] = {
+            'requests': len(ordered),
+            'errors': workload.errors.get(route, 0),
+            'shed': workload.shed.get(route, 0),
+            'throughput_rps': round(len(ordered) / elapsed, 2),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'config': {
+            'duration': args.duration, 'concurrency': args.concurrency, 'items': args.items,
+            'seed_orders': args.seed_orders, 'chefs': args.chefs, 'seed': args.seed,
+            'amqp_uri': args.amqp_uri,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'shed': sum(route['shed'] for route in routes.values()),
+        'throughput_rps': round(total / elapsed, 2),
+        'routes': routes,
+    }
+
+
+def run(args):
+    port = free_port()
+    containers = start_services(load_config(args.amqp_uri, port))
+    workload = Workload(f'http://127.0.0.1:{port}', args.items, args.chefs, args.seed)
+    scenarios, weights = zip(*DEFAULT_MIX)
+    try:
+        with requests.Session() as session:
+            for _ in range(args.seed_orders):
+                workload.create_order(session)
+        # seeding is not part of the measurement
+        workload.samples.clear()
+        workload.errors.clear()
+        workload.shed.clear()
+
+        deadline = time.monotonic() + args.duration
+
+        def client():
+            with requests.Session() as session:
+                while time.monotonic() < deadline:
+                    scenario = workload.random.choices(scenarios, weights)[0]
+                    getattr(workload, scenario)(session)
+
+        started = time.perf_counter()
+        pool = eventlet.GreenPool(args.concurrency)
+        for _ in range(args.concurrency):
+            pool.spawn(client)
+        pool.waitall()
+        return report(workload, time.perf_counter() - started, args)
+    finally:
+        for container in containers:
+            container.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of measured traffic')
+    parser.add_argument('--concurrency', type=int, default=20, help='concurrent HTTP clients')
+    parser.add_argument('--items', type=int, default=5, help='items per created order')
+    parser.add_argument('--seed-orders', type=int, default=200, help='orders created before measuring')
+    parser.add_argument('--chefs', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--amqp-uri', default='memory://')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
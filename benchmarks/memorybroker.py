@@ -0,0 +1,29 @@
+"""
+kombu's in-process memory transport, set up for nameko, for the load test.
+
+nameko's RPC responder reads the request's content type from the message
+properties, which is where py-amqp puts it; kombu's virtual transports only
+keep it as message.content_type, so every RPC reply would fail. The virtual
+transports also poll their queues, once a second by default.
+
+Use it as AMQP_URI = URI (kombu's "<transport class>+<url>" form).
+"""
+from kombu.transport import memory, virtual
+
+URI = 'memorybroker:Transport+memory://'
+
+
+class Message(virtual.Message):
+
+    def __init__(self, payload, channel=None, **kwargs):
+        super().__init__(payload, channel=channel, **kwargs)
+        self.properties.setdefault('content_type', self.content_type)
+
+
+class Channel(memory.Channel):
+    Message = Message
+
+
+class Transport(memory.Transport):
+    Channel = Channel
+    polling_interval = 0.001
@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from nameko.extensions import DependencyProvider
+
+from serialization import dumps
+
+
+def etag_of(rows):
+    """ETag of a cached list of rows: a hash of the rows, so every instance agrees."""
+    return hashlib.sha1(dumps(rows)).hexdigest()[:20]
+
+
+class LookupCache:
+    """
+    LRU cache with a TTL for the by-order and by-chef reads.
+    Entries are keyed ('order', order_id) or ('chef', chef_id).
+
+    get_tagged() also gives the ETag of an entry for conditional GETs. It is
+    derived from the rows alone (no per-instance state), so a tag handed out
+    by one instance still matches on another that has the same rows.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped on every invalidation so that a load which raced with a
+        # write is not stored afterwards
+        self._generation = 0
+
+    def get_or_load(self, key, loader):
+        return self._lookup(key, loader)[1]
+
+    def get_tagged(self, key, loader):
+        """(value, etag) of key; the tag is computed once per loaded entry."""
+        entry = self._lookup(key, loader)
+        if entry[2] is None:
+            entry[2] = etag_of(entry[1])
+        return entry[1], entry[2]
+
+    def _lookup(self, key, loader):
+        """The [expires, value, etag] entry of key, loading it on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+
+        entry = [now + self.ttl, loader(), None]
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, order_ids=(), chef_ids=()):
+        with self._lock:
+            self._generation += 1
+            keys = [('order', order_id) for order_id in order_ids] + [('chef', chef_id) for chef_id in chef_ids]
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class Cache(DependencyProvider):
+    """
+    Gives every worker of a service instance the same LookupCache.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def setup(self):
+        self.cache = LookupCache(self.max_entries, self.ttl)
+
+    def get_dependency(self, worker_ctx):
+        return self.cache
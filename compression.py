@@ -0,0 +1,139 @@
+"""
+Response compression for the gateway, negotiated from Accept-Encoding.
+
+Buffered bodies are compressed in one go when they reach min_size bytes.
+Streamed (chunked) bodies are always compressed, chunk by chunk: every
+chunk is flushed so the client can decode rows as they arrive instead of
+waiting for the end of the listing.
+"""
+import zlib
+
+from nameko.extensions import SharedExtension
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/plain'}
+
+
+def supported_encodings():
+    """Content codings this process can produce, most preferred first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def parse_accept_encoding(header):
+    """{coding: q} of an Accept-Encoding header value."""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header, encodings):
+    """The first of encodings the client accepts, or None for identity."""
+    accepted = parse_accept_encoding(header)
+    for coding in encodings:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > 0:
+            return coding
+    return None
+
+
+class StreamCompressor:
+    """Incremental gzip or brotli with a flush after every chunk."""
+
+    def __init__(self, coding, gzip_level=DEFAULT_GZIP_LEVEL, brotli_quality=DEFAULT_BROTLI_QUALITY):
+        self.coding = coding
+        if coding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 16 + MAX_WBITS writes a gzip header and trailer
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data):
+        if self.coding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.coding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+    def compress(self, data):
+        """Whole body at once, for buffered responses."""
+        if self.coding == 'br':
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def _compress_stream(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.chunk(chunk if isinstance(chunk, bytes) else chunk.encode())
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class Compression(SharedExtension):
+    """
+    One per gateway container. Settings come from COMPRESSION in
+    config.yml: min_size, gzip_level, brotli_quality and encodings (a
+    subset of supported_encodings(), in order of preference).
+    """
+
+    def setup(self):
+        config = self.container.config.get('COMPRESSION', {})
+        self.min_size = config.get('min_size', DEFAULT_MIN_SIZE)
+        self.gzip_level = config.get('gzip_level', DEFAULT_GZIP_LEVEL)
+        self.brotli_quality = config.get('brotli_quality', DEFAULT_BROTLI_QUALITY)
+        self.encodings = [
+            coding for coding in config.get('encodings', supported_encodings())
+            if coding in supported_encodings()
+        ]
+
+    def apply(self, request, response):
+        """Compresses response in place when the client accepts it and it is worth it."""
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        coding = choose_encoding(request.headers.get('Accept-Encoding'), self.encodings)
+        if coding is None:
+            return response
+        compressor = StreamCompressor(coding, self.gzip_level, self.brotli_quality)
+        if response.is_streamed:
+            # the server only closes the outermost iterable, and may do so
+            # without iterating it (HEAD), so closing it closes the source too
+            chunks = response.response
+            response.response = ClosingIterator(_compress_stream(chunks, compressor), getattr(chunks, 'close', None))
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            response.set_data(compressor.compress(body))
+        response.headers['Content-Encoding'] = coding
+        # the compressed bytes differ from the identity representation
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
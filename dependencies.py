@@ -1,47 +1,420 @@
 from nameko.extensions import DependencyProvider
+import functools
+import threading
+import time
+
 import mysql.connector
+from collections import OrderedDict, deque, namedtuple
 from datetime import datetime
 
+from logs import get_logger
+from pagination import encode_cursor, decode_cursor
+
+logger = get_logger(__name__)
+slow_query_logger = get_logger('sql.slow')
+
+
+DB_CONFIG = {
+    'host': '127.0.0.1',
+    'port': "3306",
+    'database': 'abl_order',
+    'user': 'root',
+    'password': '',
+}
+
+
+def mysql_config(config):
+    """Connection settings: DB_CONFIG with the MYSQL overrides of config applied."""
+    return dict(DB_CONFIG, **config.get('MYSQL', {}))
+
+ORDER_COLUMNS = ('order_id', 'user_id', 'reservasi_id', 'event_id', 'voucher_id', 'order_type', 'total_payment', 'version')
+ORDER_UPDATABLE_COLUMNS = ('user_id', 'reservasi_id', 'event_id', 'voucher_id', 'order_type', 'total_payment')
+ORDER_DETAIL_COLUMNS = ('order_detail_id', 'order_id', 'menu_id', 'chef_id', 'quantity', 'note', 'status')
+ORDER_PACKAGE_COLUMNS = ('order_package_id', 'order_id', 'menu_package_id', 'chef_id', 'quantity', 'note', 'status')
+
+# The columns each read projects. Every read, listings and cached lookups
+# alike, turns the cursor tuples into JSON-ready dicts once (wire_rows): a
+# lookup's dicts are what the cache keeps, so a hit returns them as they are.
+OrderRow = namedtuple('OrderRow', ORDER_COLUMNS)
+OrderDetailRow = namedtuple('OrderDetailRow', ORDER_DETAIL_COLUMNS)
+OrderPackageRow = namedtuple('OrderPackageRow', ORDER_PACKAGE_COLUMNS)
+
+
+def to_id(value):
+    """
+    An id from an RPC argument: JSON clients may send "12" for 12, which
+    would never match the int keys of the caches and the kitchen feed.
+    Raises ValueError or TypeError when value is not an integer.
+    """
+    return None if value is None else int(value)
+
+
+def wire_rows(columns, rows):
+    """JSON-ready dicts straight from cursor tuples in columns order."""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+class SqlStats:
+    """
+    Per-statement call, error and row counts plus latency percentiles over
+    the last `samples` calls. Calls slower than slow_threshold seconds are
+    written to the sql.slow log with their parameters redacted.
+    """
+
+    def __init__(self, slow_threshold=0.2, samples=1024):
+        self.slow_threshold = slow_threshold
+        self.samples = samples
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed, rows, params, error=False):
+        with self._lock:
+            entry = self.statements.get(name)
+            if entry is None:
+                entry = self.statements[name] = {
+                    'calls': 0, 'errors': 0, 'rows': 0, 'seconds': 0.0, 'max': 0.0,
+                    'latencies': deque(maxlen=self.samples),
+                }
+            entry['calls'] += 1
+            entry['errors'] += 1 if error else 0
+            entry['rows'] += rows or 0
+            entry['seconds'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+            entry['latencies'].append(elapsed)
+        if elapsed >= self.slow_threshold:
+            slow_query_logger.warning("Slow statement %s took %.1f ms (%s)", name, elapsed * 1000, _redact(params))
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for name, entry in self.statements.items():
+                latencies = sorted(entry['latencies'])
+                stats = {key: value for key, value in entry.items() if key != 'latencies'}
+                for label, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                    stats[label] = latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+                result[name] = stats
+            return result
+
+
+def _redact(params):
+    """Parameter names and shapes only, never values."""
+    shapes = []
+    for name, value in params.items():
+        if isinstance(value, (list, tuple, dict)):
+            shapes.append(f"{name}=<{type(value).__name__} len={len(value)}>")
+        else:
+            shapes.append(f"{name}=<{type(value).__name__}>")
+    return ", ".join(shapes)
+
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict) and isinstance(result.get('items'), list):
+        return len(result['items'])
+    return None
+
+
+def _timed(name, method):
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        if self.sql_stats is None:
+            return method(self, *args, **kwargs)
+        params = dict(zip(method.__code__.co_varnames[1:], args), **kwargs)
+        started = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception as e:
+            self.sql_stats.record(name, time.perf_counter() - started, None, params, error=True)
+            if isinstance(e, mysql.connector.Error):
+                # the connection is checked before it is handed out again
+                self.failed = True
+            raise
+        self.sql_stats.record(name, time.perf_counter() - started, _row_count(result), params)
+        return result
+    return timed
+
+
+def instrument_statements(cls):
+    """
+    Times every public method of the class under its own name in the
+    instance's sql_stats (when it has one).
+    """
+    for name, member in list(vars(cls).items()):
+        if callable(member) and not name.startswith('_'):
+            setattr(cls, name, _timed(name, member))
+    return cls
+
+
+class StatementCache:
+    """
+    Prepared cursors of one physical connection, keyed by SQL text, so each
+    fixed-shape statement is parsed by the server once per connection.
+    connection_id is the server session they were prepared in.
+    """
+
+    def __init__(self, connection_id=None, max_statements=64):
+        self.connection_id = connection_id
+        self.max_statements = max_statements
+        self.cursors = OrderedDict()
+
+    def get(self, connection, sql):
+        cursor = self.cursors.get(sql)
+        if cursor is None:
+            cursor = connection.cursor(prepared=True)
+            self.cursors[sql] = cursor
+            while len(self.cursors) > self.max_statements:
+                self.cursors.popitem(last=False)[1].close()
+        else:
+            self.cursors.move_to_end(sql)
+        return cursor
+
+    def close(self):
+        for cursor in self.cursors.values():
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+        self.cursors.clear()
+
+
+class PreparedCursor:
+    """
+    Cursor facade for prepared mode: every execute() runs on the cached
+    prepared cursor for that SQL text. close() leaves those cursors open.
+    """
+
+    def __init__(self, connection, statements):
+        self._connection = connection
+        self._statements = statements
+        self._cursor = None
+
+    def execute(self, sql, params=()):
+        self._cursor = self._statements.get(self._connection, sql)
+        self._cursor.execute(sql, params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        pass
+
+
+@instrument_statements
 class DatabaseWrapper:
+    """
+    MySQL backend. Its public methods are the storage interface the services
+    use; memorydb.MemoryDatabaseWrapper implements the same methods with the
+    same return shapes.
+    """
 
     connection = None
+    # set when a statement raised a MySQL error
+    failed = False
 
-    def __init__(self, connection):
+    def __init__(self, connection, statements=None, sql_stats=None, pool_stats=None):
         self.connection = connection
+        # StatementCache of this connection when prepared mode is on
+        self.statements = statements
+        # SqlStats shared by every worker of the service
+        self.sql_stats = sql_stats
+        # callable returning the pool's checkout statistics
+        self.pool_stats = pool_stats
+
+    def _cursor(self):
+        """
+        Cursor for the fixed-shape statements: prepared when a statement cache
+        was given, a plain text cursor otherwise.
+        """
+        if self.statements is None:
+            return self.connection.cursor()
+        return PreparedCursor(self.connection, self.statements)
+
+    def _select_rows(self, table, row_type, where='', params=()):
+        """
+        Reads only row_type's columns through a plain tuple cursor and returns
+        them as a list of dicts (wire_rows).
+        """
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = f"SELECT {', '.join(row_type._fields)} FROM `{table}` {where}"
+            cursor.execute(sql, params)
+            return wire_rows(row_type._fields, cursor.fetchall())
+        except mysql.connector.Error as e:
+            logger.error("DatabaseWrapper._select_rows(%s) error: %s", table, e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    def _get_page(self, table, key, row_type, limit, after):
+        """
+        Keyset pagination on the primary key: one index range scan per page,
+        independent of how far into the table the page is. Items are dicts.
+        """
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = f"SELECT {', '.join(row_type._fields)} FROM `{table}` WHERE `{key}` > %s ORDER BY `{key}` LIMIT %s"
+            cursor.execute(sql, (decode_cursor(after) if after else 0, limit + 1))
+            rows = wire_rows(row_type._fields, cursor.fetchall())
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor(rows[-1][key])
+            return {"items": rows, "next_cursor": next_cursor}
+        except mysql.connector.Error as e:
+            logger.error("DatabaseWrapper._get_page(%s) error: %s", table, e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+
+    def get_affected_keys(self, table, column, value):
+        """
+        order_ids and chef_ids of the rows in table where column = value,
+        used to invalidate by-order and by-chef caches before a write.
+        """
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = f"SELECT DISTINCT order_id, chef_id FROM `{table}` WHERE `{column}` = %s"
+            cursor.execute(sql, (value,))
+            rows = cursor.fetchall()
+            return {
+                'order_ids': sorted({row[0] for row in rows if row[0] is not None}),
+                'chef_ids': sorted({row[1] for row in rows if row[1] is not None}),
+            }
+        except mysql.connector.Error as e:
+            logger.error("DatabaseWrapper.get_affected_keys error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
 
+    def _change_status_bulk(self, table, key, ids, new_status):
+        """
+        Sets the status of every row in ids with one UPDATE in one transaction.
+        Returns a per-id outcome plus the affected order and chef ids.
+        """
+        ids = list(dict.fromkeys(ids))
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+            placeholders = ', '.join(['%s'] * len(ids))
+            sql = f"SELECT `{key}`, order_id, chef_id FROM `{table}` WHERE `{key}` IN ({placeholders}) FOR UPDATE"
+            cursor.execute(sql, tuple(ids))
+            found = {row[0]: row for row in cursor.fetchall()}
 
+            if found:
+                placeholders = ', '.join(['%s'] * len(found))
+                sql = f"UPDATE `{table}` SET `status` = %s WHERE `{key}` IN ({placeholders})"
+                cursor.execute(sql, (new_status,) + tuple(found))
+            self.connection.commit()
+
+            return {
+                "success": True,
+                "results": [
+                    {"id": row_id, "success": True, "message": f"Status updated to {new_status}."}
+                    if row_id in found else
+                    {"id": row_id, "success": False, "message": "Not found."}
+                    for row_id in ids
+                ],
+                "order_ids": sorted({row[1] for row in found.values()}),
+                "chef_ids": sorted({row[2] for row in found.values() if row[2] is not None}),
+                # (id, order_id, chef_id) of every updated row
+                "lines": [list(found[row_id]) for row_id in dict.fromkeys(ids) if row_id in found],
+            }
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper._change_status_bulk(%s) error: %s", table, e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
 
     # ---     Order      --- #
 
     def get_all_orders(self):
+        return self._select_rows('orders', OrderRow)
+
+    def get_orders_page(self, limit, after=None):
+        return self._get_page('orders', 'order_id', OrderRow, limit, after)
+
+    def get_order_full(self, order_id):
+        """
+        The order header with all of its detail and package lines, read in one
+        query. Returns None when the order does not exist.
+        """
         cursor = None
         try:
             cursor = self.connection.cursor(dictionary=True)
-            result = []
-            sql = "SELECT * FROM `orders`"
-            cursor.execute(sql)
-            for row in cursor.fetchall():
-                result.append({
+            sql = """
+                SELECT o.order_id, o.user_id, o.reservasi_id, o.event_id, o.voucher_id,
+                       o.order_type, o.total_payment, o.version,
+                       l.line_type, l.line_id, l.item_id, l.chef_id, l.quantity, l.note, l.status
+                FROM orders o
+                LEFT JOIN (
+                    SELECT 'detail' AS line_type, order_detail_id AS line_id, order_id,
+                           menu_id AS item_id, chef_id, quantity, note, status
+                    FROM order_details WHERE order_id = %s
+                    UNION ALL
+                    SELECT 'package', order_package_id, order_id,
+                           menu_package_id, chef_id, quantity, note, status
+                    FROM order_packages WHERE order_id = %s
+                ) l ON l.order_id = o.order_id
+                WHERE o.order_id = %s
+                ORDER BY l.line_type, l.line_id
+            """
+            cursor.execute(sql, (order_id, order_id, order_id))
+            rows = cursor.fetchall()
+            if not rows:
+                return None
+
+            result = {
+                'order': {column: rows[0][column] for column in ORDER_COLUMNS},
+                'order_details': [],
+                'order_packages': [],
+            }
+            for row in rows:
+                line = {
                     'order_id': row['order_id'],
-                    'user_id': row['user_id'],
-                    'reservasi_id': row['reservasi_id'],
-                    'event_id': row['event_id'],
-                    'voucher_id': row['voucher_id'],
-                    'order_type': row['order_type'],
-                    'total_payment': row['total_payment']
-                })
+                    'chef_id': row['chef_id'],
+                    'quantity': row['quantity'],
+                    'note': row['note'],
+                    'status': row['status'],
+                }
+                if row['line_type'] == 'detail':
+                    line.update(order_detail_id=row['line_id'], menu_id=row['item_id'])
+                    result['order_details'].append(line)
+                elif row['line_type'] == 'package':
+                    line.update(order_package_id=row['line_id'], menu_package_id=row['item_id'])
+                    result['order_packages'].append(line)
             return result
         except mysql.connector.Error as e:
-            print(f"DatabaseWrapper.get_all_orders error: {e}")
+            logger.error("DatabaseWrapper.get_order_full error: %s", e)
             raise
         finally:
             if cursor:
                 cursor.close()
-    
+
     def add_order(self, user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at):
         cursor = None
         try:
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             sql = """
                 INSERT INTO `orders`
                 (user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at)
@@ -52,39 +425,105 @@ class DatabaseWrapper:
             self.connection.commit()
             # FIX: Changed cursor.lastrowid() to cursor.lastrowid
             new_order_id = cursor.lastrowid
-            print(f"Main order added with ID: {new_order_id}")
+            logger.debug("Main order added with ID: %s", new_order_id)
             return {"success": True, "order_id": new_order_id}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.add_order error: {e}")
+            logger.error("DatabaseWrapper.add_order error: %s", e)
             raise
         finally:
             if cursor:
                 cursor.close()
 
-    def update_order(self, order_id, update_data):
+    def add_order_with_items(self, user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at, details, packages):
+        """
+        Inserts the order header and all of its detail and package rows in a
+        single transaction. details/packages are lists of
+        (menu_id, chef_id, quantity, note, status) tuples.
+        Returns the new order id and the generated ids in input order.
+        """
         cursor = None
         try:
             cursor = self.connection.cursor()
+            sql = """
+                INSERT INTO `orders`
+                (user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """
+            cursor.execute(sql, (user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at))
+            new_order_id = cursor.lastrowid
 
-            set_clauses = []
-            values = []
-            for key, value in update_data.items():
-                set_clauses.append(f"{key} = %s")
-                values.append(value)
+            # executemany() rewrites these into one multi-row INSERT. Its ids are
+            # ascending in row order but not necessarily consecutive (they step
+            # by auto_increment_increment, and innodb_autoinc_lock_mode=2 may
+            # interleave them with other inserts), so they are read back; the
+            # order is new, so its rows are exactly the ones inserted here
+            detail_ids = []
+            if details:
+                sql = "INSERT INTO order_details (order_id, menu_id, chef_id, quantity, note, status) VALUES (%s, %s, %s, %s, %s, %s)"
+                cursor.executemany(sql, [(new_order_id,) + tuple(row) for row in details])
+                cursor.execute("SELECT order_detail_id FROM order_details WHERE order_id = %s ORDER BY order_detail_id", (new_order_id,))
+                detail_ids = [row[0] for row in cursor.fetchall()]
 
-            if not set_clauses:
-                return False
+            package_ids = []
+            if packages:
+                sql = "INSERT INTO order_packages (order_id, menu_package_id, chef_id, quantity, note, status) VALUES (%s, %s, %s, %s, %s, %s)"
+                cursor.executemany(sql, [(new_order_id,) + tuple(row) for row in packages])
+                cursor.execute("SELECT order_package_id FROM order_packages WHERE order_id = %s ORDER BY order_package_id", (new_order_id,))
+                package_ids = [row[0] for row in cursor.fetchall()]
+
+            self.connection.commit()
+            logger.debug("Order %s added with %s details and %s packages", new_order_id, len(details), len(packages))
+            return {"success": True, "order_id": new_order_id, "detail_ids": detail_ids, "package_ids": package_ids}
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper.add_order_with_items error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    def update_order(self, order_id, update_data, expected_version=None):
+        """
+        Updates an order in one conditional statement. When expected_version
+        is given the row is only written if its version still matches.
+        Returns status 'updated', 'not_found' or 'conflict' plus the new version.
+        """
+        invalid = [key for key in update_data if key not in ORDER_UPDATABLE_COLUMNS]
+        if invalid:
+            raise ValueError(f"Columns cannot be updated: {', '.join(invalid)}")
+        if not update_data:
+            raise ValueError("Nothing to update.")
+
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+
+            set_clauses = [f"`{key}` = %s" for key in update_data]
+            values = list(update_data.values())
+            # LAST_INSERT_ID(expr) hands the new version back through lastrowid
+            set_clauses.append("`version` = LAST_INSERT_ID(`version` + 1)")
 
-            values.append(order_id)
             sql = f"UPDATE orders SET {', '.join(set_clauses)} WHERE order_id = %s"
+            values.append(order_id)
+            if expected_version is not None:
+                sql += " AND version = %s"
+                values.append(expected_version)
             cursor.execute(sql, values)
             self.connection.commit()
-            return cursor.rowcount > 0
+            if cursor.rowcount > 0:
+                return {"success": True, "status": "updated", "version": cursor.lastrowid}
+
+            # Nothing written: a primary key lookup tells a missing order from a stale version
+            cursor.execute("SELECT version FROM orders WHERE order_id = %s", (order_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return {"success": False, "status": "not_found", "version": None}
+            return {"success": False, "status": "conflict", "version": row[0]}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.update_order error: {e}")
-            return False
+            logger.error("DatabaseWrapper.update_order error: %s", e)
+            raise
         finally:
             if cursor:
                 cursor.close()
@@ -92,121 +531,253 @@ class DatabaseWrapper:
     def delete_order(self, order_id):
         cursor = None
         try:
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             sql = "DELETE FROM orders WHERE order_id = %s"
             cursor.execute(sql, (order_id,))
             self.connection.commit()
             return cursor.rowcount > 0
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.delete_order error: {e}")
+            logger.error("DatabaseWrapper.delete_order error: %s", e)
             return False
         finally:
             if cursor:
                 cursor.close()
 
+    def delete_orders(self, order_ids):
+        """
+        Deletes many orders in one transaction. Their details and packages
+        go with them through ON DELETE CASCADE.
+        Returns the number of orders deleted and the chef ids whose lines were
+        removed, so callers can invalidate by-chef caches.
+        """
+        if not order_ids:
+            return {"success": True, "deleted": 0, "detail_chef_ids": [], "package_chef_ids": []}
+
+        cursor = None
+        try:
+            cursor = self.connection.cursor()
+            placeholders = ', '.join(['%s'] * len(order_ids))
+            chef_ids = {}
+            for table in ('order_details', 'order_packages'):
+                sql = f"SELECT DISTINCT chef_id FROM `{table}` WHERE order_id IN ({placeholders}) FOR UPDATE"
+                cursor.execute(sql, tuple(order_ids))
+                chef_ids[table] = sorted(row[0] for row in cursor.fetchall() if row[0] is not None)
+
+            sql = f"DELETE FROM orders WHERE order_id IN ({placeholders})"
+            cursor.execute(sql, tuple(order_ids))
+            deleted = cursor.rowcount
+            self.connection.commit()
+            return {
+                "success": True,
+                "deleted": deleted,
+                "detail_chef_ids": chef_ids['order_details'],
+                "package_chef_ids": chef_ids['order_packages'],
+            }
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper.delete_orders error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    # --- Idempotency keys --- #
+
+    def claim_idempotency_key(self, key, request_hash, lease_seconds):
+        """
+        Takes key for a new request: inserts it as in_flight for
+        lease_seconds, or takes over an existing entry that has expired.
+        Returns {"claimed": True} when the caller now owns the key, otherwise
+        the live entry as {"claimed": False, "status", "request_hash", "response"}.
+        """
+        cursor = None
+        try:
+            cursor = self._cursor()
+            # expires_at is assigned last so the IF()s before it still see the old value
+            sql = """
+                INSERT INTO `idempotency_keys` (idempotency_key, request_hash, status, response, expires_at)
+                VALUES (%s, %s, 'in_flight', NULL, NOW() + INTERVAL %s SECOND)
+                ON DUPLICATE KEY UPDATE
+                    request_hash = IF(expires_at < NOW(), VALUES(request_hash), request_hash),
+                    status = IF(expires_at < NOW(), 'in_flight', status),
+                    response = IF(expires_at < NOW(), NULL, response),
+                    expires_at = IF(expires_at < NOW(), VALUES(expires_at), expires_at)
+            """
+            cursor.execute(sql, (key, request_hash, lease_seconds))
+            # 1 = inserted, 2 = expired entry taken over, 0 = live entry left alone
+            claimed = cursor.rowcount > 0
+            if not claimed:
+                sql = "SELECT status, request_hash, response FROM `idempotency_keys` WHERE idempotency_key = %s"
+                cursor.execute(sql, (key,))
+                row = cursor.fetchone()
+            self.connection.commit()
+            if claimed or row is None:
+                return {"claimed": claimed}
+            return {"claimed": False, "status": row[0], "request_hash": row[1], "response": row[2]}
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper.claim_idempotency_key error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    def get_idempotency_key(self, key):
+        """
+        Reads the live entry of key as {"status", "request_hash", "response"},
+        or None when there is none (released, or its lease ran out). A plain
+        read, for retries waiting on an in_flight original.
+        """
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = """
+                SELECT status, request_hash, response FROM `idempotency_keys`
+                WHERE idempotency_key = %s AND expires_at >= NOW()
+            """
+            cursor.execute(sql, (key,))
+            row = cursor.fetchone()
+            # ends the read snapshot, so the next poll sees the original's commit
+            self.connection.commit()
+            if row is None:
+                return None
+            return {"status": row[0], "request_hash": row[1], "response": row[2]}
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper.get_idempotency_key error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    def complete_idempotency_key(self, key, response, ttl_seconds):
+        """Stores the serialized response of key and keeps it for ttl_seconds."""
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = """
+                UPDATE `idempotency_keys` SET status = 'done', response = %s, expires_at = NOW() + INTERVAL %s SECOND
+                WHERE idempotency_key = %s
+            """
+            cursor.execute(sql, (response, ttl_seconds, key))
+            self.connection.commit()
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper.complete_idempotency_key error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    def release_idempotency_key(self, key):
+        """Drops an in_flight claim so that a retry runs the request again."""
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = "DELETE FROM `idempotency_keys` WHERE idempotency_key = %s AND status = 'in_flight'"
+            cursor.execute(sql, (key,))
+            self.connection.commit()
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper.release_idempotency_key error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
+    def purge_idempotency_keys(self, limit=1000):
+        """Deletes up to limit expired keys. Returns how many went."""
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = "DELETE FROM `idempotency_keys` WHERE expires_at < NOW() LIMIT %s"
+            cursor.execute(sql, (limit,))
+            self.connection.commit()
+            return cursor.rowcount
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("DatabaseWrapper.purge_idempotency_keys error: %s", e)
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+
     # --- Order Packages --- #
 
     def add_order_packages(self, order_id, menu_package_id, chef_id, quantity, note, status):
         cursor = None
         try:
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             
             sql = "INSERT INTO order_packages (order_id, menu_package_id, chef_id, quantity, note, status) VALUES (%s, %s, %s, %s, %s, %s)"
             values = (order_id, menu_package_id, chef_id, quantity, note, status)
             cursor.execute(sql, values)
             
             self.connection.commit()
-            print(f"DatabaseWrapper: Order packages added: Order ID {order_id}, Menu Package ID {menu_package_id}")
+            logger.debug("DatabaseWrapper: Order packages added: Order ID %s, Menu Package ID %s", order_id, menu_package_id)
             return {"success": True, "id": cursor.lastrowid if cursor.lastrowid else None} # Return success and ID
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.add_order_packages error: {e}")
+            logger.error("DatabaseWrapper.add_order_packages error: %s", e)
         finally:
             if cursor:
                 cursor.close()
     
     def get_all_order_packages(self):
-        cursor = self.connection.cursor(dictionary=True)
-        result = []
-        sql = "SELECT * FROM order_packages"
-        cursor.execute(sql)
-        for row in cursor.fetchall():
-            result.append({
-                'order_package_id': row['order_package_id'],
-                'order_id': row['order_id'],
-                'menu_id': row['menu_id'],
-                'chef_id': row['chef_id'],
-                'quantity': row['quantity'],
-                'note': row['note'],
-                'status': row['status']
-            })
-        cursor.close()
-        return result
+        return self._select_rows('order_packages', OrderPackageRow)
+
+    def get_order_packages_page(self, limit, after=None):
+        return self._get_page('order_packages', 'order_package_id', OrderPackageRow, limit, after)
 
     def get_order_packages_orderID(self, order_id):
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            sql = "SELECT * FROM order_packages WHERE order_id = %s"
-            cursor.execute(sql, (order_id,))
-            result = cursor.fetchone()
-        except mysql.connector.Error as e:
-            print(f"Database error: {e}")
-        finally:
-            cursor.close()
-        return result or "Room not found"
-    
+        return self._select_rows('order_packages', OrderPackageRow, "WHERE order_id = %s", (order_id,))
+
     def get_order_packages_chefID(self, chef_id):
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            sql = "SELECT * FROM order_packages WHERE chef_id = %s"
-            cursor.execute(sql, (chef_id,))
-            result = cursor.fetchone()
-        except mysql.connector.Error as e:
-            print(f"Database error: {e}")
-        finally:
-            cursor.close()
-        return result or "Room not found"
-    
+        return self._select_rows('order_packages', OrderPackageRow, "WHERE chef_id = %s", (chef_id,))
+
     def change_order_packages_status(self, order_package_id, new_status):
         cursor = None
         try:
-            cursor = self.connection.cursor()
-            sql = "UPDATE `order_packages` SET `status` = %s WHERE `id` = %s"
+            cursor = self._cursor()
+            sql = "UPDATE `order_packages` SET `status` = %s WHERE `order_package_id` = %s"
             values = (new_status, order_package_id)
             cursor.execute(sql, values)
             self.connection.commit()
             if cursor.rowcount == 0:
-                print(f"Order package with ID {order_package_id} not found for status update.")
+                logger.warning("Order package with ID %s not found for status update.", order_package_id)
                 return {"success": False, "message": f"Order package {order_package_id} not found."}
             else:
-                print(f"Order package {order_package_id} status updated to {new_status}.")
+                logger.debug("Order package %s status updated to %s.", order_package_id, new_status)
                 return {"success": True, "message": f"Order package {order_package_id} status updated."}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.change_order_packages_status error: {e}")
+            logger.error("DatabaseWrapper.change_order_packages_status error: %s", e)
             raise
         finally:
             if cursor:
                 cursor.close()
 
+    def change_order_packages_status_bulk(self, order_package_ids, new_status):
+        return self._change_status_bulk('order_packages', 'order_package_id', order_package_ids, new_status)
+
     def change_order_packages_quantity(self, order_package_id, new_quantity):
         cursor = None
         try:
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             sql = "UPDATE `order_packages` SET `quantity` = %s WHERE `order_package_id` = %s"
             values = (new_quantity, order_package_id)
             cursor.execute(sql, values)
             self.connection.commit()
             if cursor.rowcount == 0:
-                print(f"Order package with ID {order_package_id} not found for quantity update.")
+                logger.warning("Order package with ID %s not found for quantity update.", order_package_id)
                 return {"success": False, "message": f"Order package {order_package_id} not found."}
             else:
-                print(f"Order package {order_package_id} quantity updated to {new_quantity}.")
+                logger.debug("Order package %s quantity updated to %s.", order_package_id, new_quantity)
                 return {"success": True, "message": f"Order package {order_package_id} quantity updated."}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.change_order_packages_quantity error: {e}")
+            logger.error("DatabaseWrapper.change_order_packages_quantity error: %s", e)
             raise
         finally:
             if cursor:
@@ -215,16 +786,20 @@ class DatabaseWrapper:
     def change_order_packages_note(self, order_package_id, new_note):
         cursor = None
         try:
-            cursor = self.connection.cursor()
-            sql = "UPDATE `order_packages` SET `note` = %s WHERE `id` = %s"
+            cursor = self._cursor()
+            sql = "UPDATE `order_packages` SET `note` = %s WHERE `order_package_id` = %s"
             values = (new_note, order_package_id)
             cursor.execute(sql, values)
             self.connection.commit()
-            print(f"Order package with ID {order_package_id} not found for note update.")
-            return {"success": False, "message": f"Order package {order_package_id} not found."}
+            if cursor.rowcount == 0:
+                logger.warning("Order package with ID %s not found for note update.", order_package_id)
+                return {"success": False, "message": f"Order package {order_package_id} not found."}
+            else:
+                logger.debug("Order package %s note updated.", order_package_id)
+                return {"success": True, "message": f"Order package {order_package_id} note updated."}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.change_order_packages_note error: {e}")
+            logger.error("DatabaseWrapper.change_order_packages_note error: %s", e)
             raise
         finally:
             if cursor:
@@ -234,117 +809,107 @@ class DatabaseWrapper:
         try:
             cursor = self.connection.cursor(dictionary=True)
             
-            sql = "DELETE FROM `order_packages` WHERE num = %s"
+            sql = "DELETE FROM `order_packages` WHERE order_package_id = %s"
             cursor.execute(sql,(order_package_id,))
             self.connection.commit()
         except mysql.connector.Error as e:
-            print(f"Database error: {e}")
+            logger.error("Database error: %s", e)
         finally:
             cursor.close()
 
 
+    def delete_order_packages_by_order_id(self, order_id):
+        cursor = None
+        try:
+            cursor = self._cursor()
+            sql = "DELETE FROM order_packages WHERE order_id = %s"
+            cursor.execute(sql, (order_id,))
+            self.connection.commit()
+            return {"success": True, "message": f"Order packages for order {order_id} deleted."}
+        except mysql.connector.Error as e:
+            self.connection.rollback()
+            logger.error("Database error: %s", e)
+            return {"success": False, "message": str(e)}
+        finally:
+            if cursor:
+                cursor.close()
+
+
     # --- Order Details --- #
 
     def add_order_details(self, order_id, menu_id, chef_id, quantity, note, status):
         cursor = None
         try:
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             
             sql = "INSERT INTO order_details (order_id, menu_id, chef_id, quantity, note, status) VALUES (%s, %s, %s, %s, %s, %s)"
             values = (order_id, menu_id, chef_id, quantity, note, status)
             cursor.execute(sql, values)
             
             self.connection.commit()
-            print(f"DatabaseWrapper: Order details added: Order ID {order_id}, Menu ID {menu_id}")
+            logger.debug("DatabaseWrapper: Order details added: Order ID %s, Menu ID %s", order_id, menu_id)
             return {"success": True, "id": cursor.lastrowid if cursor.lastrowid else None} # Return success and ID
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.add_order_details error: {e}")
+            logger.error("DatabaseWrapper.add_order_details error: %s", e)
         finally:
             if cursor:
                 cursor.close()
     
     def get_all_order_details(self):
-        cursor = self.connection.cursor(dictionary=True)
-        result = []
-        sql = "SELECT * FROM order_details"
-        cursor.execute(sql)
-        for row in cursor.fetchall():
-            result.append({
-                'order_detail_id': row['order_detail_id'],
-                'order_id': row['order_id'],
-                'menu_id': row['menu_id'],
-                'chef_id': row['chef_id'],
-                'quantity': row['quantity'],
-                'note': row['note'],
-                'status': row['status']
-            })
-        cursor.close()
-        return result
+        return self._select_rows('order_details', OrderDetailRow)
+
+    def get_order_details_page(self, limit, after=None):
+        return self._get_page('order_details', 'order_detail_id', OrderDetailRow, limit, after)
 
     def get_order_details_orderID(self, order_id):
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            sql = "SELECT * FROM order_details WHERE order_id = %s"
-            cursor.execute(sql, (order_id,))
-            result = cursor.fetchone()
-        except mysql.connector.Error as e:
-            print(f"Database error: {e}")
-        finally:
-            cursor.close()
-        return result or "Room not found"
-    
+        return self._select_rows('order_details', OrderDetailRow, "WHERE order_id = %s", (order_id,))
+
     def get_order_details_chefID(self, chef_id):
-        try:
-            cursor = self.connection.cursor(dictionary=True)
-            sql = "SELECT * FROM order_details WHERE chef_id = %s"
-            cursor.execute(sql, (chef_id,))
-            result = cursor.fetchone()
-        except mysql.connector.Error as e:
-            print(f"Database error: {e}")
-        finally:
-            cursor.close()
-        return result or "Room not found"
-    
+        return self._select_rows('order_details', OrderDetailRow, "WHERE chef_id = %s", (chef_id,))
+
     def change_order_details_status(self, order_detail_id, new_status):
         cursor = None
         try:
-            cursor = self.connection.cursor()
-            sql = "UPDATE `order_details` SET `status` = %s WHERE `id` = %s"
+            cursor = self._cursor()
+            sql = "UPDATE `order_details` SET `status` = %s WHERE `order_detail_id` = %s"
             values = (new_status, order_detail_id)
             cursor.execute(sql, values)
             self.connection.commit()
             if cursor.rowcount == 0:
-                print(f"Order detail with ID {order_detail_id} not found for status update.")
+                logger.warning("Order detail with ID %s not found for status update.", order_detail_id)
                 return {"success": False, "message": f"Order detail {order_detail_id} not found."}
             else:
-                print(f"Order detail {order_detail_id} status updated to {new_status}.")
+                logger.debug("Order detail %s status updated to %s.", order_detail_id, new_status)
                 return {"success": True, "message": f"Order detail {order_detail_id} status updated."}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.change_order_details_status error: {e}")
+            logger.error("DatabaseWrapper.change_order_details_status error: %s", e)
             raise
         finally:
             if cursor:
                 cursor.close()
 
+    def change_order_details_status_bulk(self, order_detail_ids, new_status):
+        return self._change_status_bulk('order_details', 'order_detail_id', order_detail_ids, new_status)
+
     def change_order_details_quantity(self, order_detail_id, new_quantity):
         cursor = None
         try:
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             sql = "UPDATE `order_details` SET `quantity` = %s WHERE `order_detail_id` = %s"
             values = (new_quantity, order_detail_id)
             cursor.execute(sql, values)
             self.connection.commit()
             if cursor.rowcount == 0:
-                print(f"Order detail with ID {order_detail_id} not found for quantity update.")
+                logger.warning("Order detail with ID %s not found for quantity update.", order_detail_id)
                 return {"success": False, "message": f"Order detail {order_detail_id} not found."}
             else:
-                print(f"Order detail {order_detail_id} quantity updated to {new_quantity}.")
+                logger.debug("Order detail %s quantity updated to %s.", order_detail_id, new_quantity)
                 return {"success": True, "message": f"Order detail {order_detail_id} quantity updated."}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.change_order_details_quantity error: {e}")
+            logger.error("DatabaseWrapper.change_order_details_quantity error: %s", e)
             raise
         finally:
             if cursor:
@@ -353,16 +918,20 @@ class DatabaseWrapper:
     def change_order_details_note(self, order_detail_id, new_note):
         cursor = None
         try:
-            cursor = self.connection.cursor()
-            sql = "UPDATE `order_details` SET `note` = %s WHERE `id` = %s"
+            cursor = self._cursor()
+            sql = "UPDATE `order_details` SET `note` = %s WHERE `order_detail_id` = %s"
             values = (new_note, order_detail_id)
             cursor.execute(sql, values)
             self.connection.commit()
-            print(f"Order detail with ID {order_detail_id} not found for note update.")
-            return {"success": False, "message": f"Order detail {order_detail_id} not found."}
+            if cursor.rowcount == 0:
+                logger.warning("Order detail with ID %s not found for note update.", order_detail_id)
+                return {"success": False, "message": f"Order detail {order_detail_id} not found."}
+            else:
+                logger.debug("Order detail %s note updated.", order_detail_id)
+                return {"success": True, "message": f"Order detail {order_detail_id} note updated."}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"DatabaseWrapper.change_order_details_note error: {e}")
+            logger.error("DatabaseWrapper.change_order_details_note error: %s", e)
             raise
         finally:
             if cursor:
@@ -376,21 +945,21 @@ class DatabaseWrapper:
             cursor.execute(sql,(order_detail_id,))
             self.connection.commit()
         except mysql.connector.Error as e:
-            print(f"Database error: {e}")
+            logger.error("Database error: %s", e)
         finally:
             cursor.close()
     
     def delete_order_details_by_order_id(self, order_id):
         cursor = None
         try:
-            cursor = self.connection.cursor()
+            cursor = self._cursor()
             sql = "DELETE FROM order_details WHERE order_id = %s"
             cursor.execute(sql, (order_id,))
             self.connection.commit()
             return {"success": True, "message": f"Order details for order {order_id} deleted."}
         except mysql.connector.Error as e:
             self.connection.rollback()
-            print(f"Database error: {e}")
+            logger.error("Database error: %s", e)
             return {"success": False, "message": str(e)}
         finally:
             if cursor:
@@ -398,27 +967,175 @@ class DatabaseWrapper:
 
     
 
+# DATABASE_BACKEND values in config.yml
+BACKENDS = ('mysql', 'memory')
+
+
+class ConnectionPool:
+    """
+    Idle MySQL connections of a Database, most recently used first. Unlike
+    mysql.connector's pool, which pings the server on every checkout, a
+    connection is only checked (and reconnected) when it has been idle for
+    more than idle_check seconds or a statement on it failed. The Database
+    bounds how many are in use; connections are opened on demand.
+    on_close(connection) is called for every connection the pool closes.
+    """
+
+    def __init__(self, connect, idle_check=30.0, on_close=None):
+        self.connect = connect
+        self.idle_check = idle_check
+        self.on_close = on_close
+        self.pings = 0
+        # (connection, time it came back, whether a statement on it failed)
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            entry = self._idle.pop() if self._idle else None
+        if entry is None:
+            return self.connect()
+        connection, returned, failed = entry
+        if failed or time.monotonic() - returned > self.idle_check:
+            self.pings += 1
+            try:
+                connection.ping(reconnect=True)
+            except mysql.connector.Error:
+                if self.on_close is not None:
+                    self.on_close(connection)
+                connection.close()
+                raise
+        return connection
+
+    def put(self, connection, failed=False):
+        with self._lock:
+            self._idle.append((connection, time.monotonic(), failed))
+
+
 class Database(DependencyProvider):
+    """
+    Hands every worker a wrapper of the backend chosen by DATABASE_BACKEND:
+    a pooled MySQL connection (the default) or the process-wide in-memory
+    store of memorydb. MYSQL in config.yml overrides keys of DB_CONFIG.
+    """
 
     connection_pool = None
 
-    def __init__(self):
+    def __init__(self, pool_size=10, checkout_timeout=5.0, idle_check=30.0):
+        # checkout_timeout: seconds a worker waits for a free connection
+        # idle_check: seconds idle after which a connection is pinged on checkout
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_check = idle_check
+        self.connections = {}
+
+    def setup(self):
+        config = self.container.config
+        self.backend = config.get('DATABASE_BACKEND', 'mysql')
+        if self.backend not in BACKENDS:
+            raise ValueError(f"DATABASE_BACKEND must be one of: {', '.join(BACKENDS)}")
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._stats_lock = threading.Lock()
+        # PREPARED_STATEMENTS: true in config.yml turns on prepared mode
+        self.prepared = config.get('PREPARED_STATEMENTS', False)
+        # one StatementCache per pooled connection, dropped when the pool closes it
+        self._statement_caches = {}
+        self.sql_stats = SqlStats(slow_threshold=config.get('SLOW_QUERY_MS', 200) / 1000.0)
+        self.stats = {
+            'checkouts': 0,
+            'waited': 0,
+            'exhausted': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+        }
+        if self.backend == 'memory':
+            # imported here: memorydb builds on this module
+            import memorydb
+            self.store = memorydb.shared_store()
+            self._memory_wrapper = memorydb.MemoryDatabaseWrapper
+            return
+        self.connection_pool = ConnectionPool(
+            functools.partial(mysql.connector.connect, **mysql_config(config)), self.idle_check,
+            on_close=self._drop_statements
+        )
+
+    def get_dependency(self, worker_ctx):
+        if self.backend == 'memory':
+            return self._memory_wrapper(self.store, self.sql_stats, self.get_stats)
+        connection = self._checkout()
+        statements = self._take_statements(connection) if self.prepared else None
+        wrapper = DatabaseWrapper(connection, statements, self.sql_stats, self.get_stats)
+        self.connections[worker_ctx] = wrapper
+        return wrapper
+
+    def worker_teardown(self, worker_ctx):
+        wrapper = self.connections.pop(worker_ctx, None)
+        if wrapper is not None:
+            self._checkin(wrapper.connection, wrapper.failed)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['pool_size'] = self.pool_size
+        if self.connection_pool is not None:
+            stats['pings'] = self.connection_pool.pings
+        stats['avg_wait'] = stats['total_wait'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+    def _checkout(self):
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.stats['waited'] += 1
+            if not self._slots.acquire(timeout=self.checkout_timeout):
+                with self._stats_lock:
+                    self.stats['exhausted'] += 1
+                logger.warning("Database: no free connection after %ss (pool size %s)", self.checkout_timeout, self.pool_size)
+                raise mysql.connector.errors.PoolError("Connection pool exhausted")
         try:
-            self.connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-                pool_name="database_pool",
-                pool_size=10,
-                pool_reset_session=True,
-                host='127.0.0.1',
-                port="3306",
-                database='abl_order',
-                user='root',
-                password=''
-            )
+            connection = self.connection_pool.get()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - started
+        with self._stats_lock:
+            self.stats['checkouts'] += 1
+            self.stats['total_wait'] += waited
+            self.stats['max_wait'] = max(self.stats['max_wait'], waited)
+            self.stats['in_use'] += 1
+            self.stats['peak_in_use'] = max(self.stats['peak_in_use'], self.stats['in_use'])
+        return connection
+
+    def _take_statements(self, connection):
+        # A connection the pool had to reconnect comes back with a new server
+        # session, so it starts with an empty cache. The old handles are
+        # dropped, not closed: they died with the old session, and closing
+        # them on the new one could close its own statements of the same id.
+        statements = self._statement_caches.get(connection)
+        if statements is None or statements.connection_id != connection.connection_id:
+            statements = self._statement_caches[connection] = StatementCache(connection.connection_id)
+        return statements
+
+    def _drop_statements(self, connection):
+        self._statement_caches.pop(connection, None)
+
+    def _checkin(self, connection, failed=False):
+        try:
+            # sessions are not reset on checkin, so never hand back an open transaction
+            if connection.in_transaction:
+                connection.rollback()
         except mysql.connector.Error as e:
-            print ("Error while connecting to MySQL using Connection pool:", e)
+            logger.warning("Database: connection failed on checkin, checking it before reuse: %s", e)
+            failed = True
+        finally:
+            self.connection_pool.put(connection, failed)
+            with self._stats_lock:
+                self.stats['in_use'] -= 1
+            self._slots.release()
 
-    def get_dependency(self, worker_ctx):
-        return DatabaseWrapper(self.connection_pool.get_connection())
 
 # def get_all_room_type(self):
     #     cursor = self.connection.cursor(dictionary=True)
@@ -1,7 +1,114 @@
 import json
 
+from nameko.events import BROADCAST, event_handler
 from nameko.rpc import RpcProxy
-from nameko.web.handlers import http
+from werkzeug.wrappers import Response
+
+import instrumentation
+import kitchen
+from admission import Admission, http
+from logs import get_logger
+from pagination import decode_cursor
+from serialization import dumps, loads
+
+logger = get_logger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+IDEMPOTENCY_STATUS_CODES = {
+    'in_progress': 409,
+    'key_mismatch': 422,
+}
+
+
+def get_page_args(request):
+    """
+    Returns (limit, after) when the request asks for a page via ?limit= or
+    ?after=, or None for the unpaginated listing.
+    Raises ValueError on a bad limit or cursor.
+    """
+    if 'limit' not in request.args and 'after' not in request.args:
+        return None
+    limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    if limit <= 0 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}.")
+    after = request.args.get('after')
+    if after:
+        decode_cursor(after)
+    return limit, after
+
+def get_stream_format(request):
+    """
+    Returns the requested ?stream= format, or None for a buffered response.
+    Raises ValueError on an unknown format.
+    """
+    fmt = request.args.get('stream')
+    if fmt and fmt not in STREAM_FORMATS:
+        raise ValueError(f"'stream' must be one of: {', '.join(STREAM_FORMATS)}.")
+    return fmt
+
+
+def stream_pages(fetch_page, fmt):
+    """
+    Streams a whole listing as a chunked response, walking it page by page
+    through fetch_page(limit, after) so that only one batch of rows is held
+    in memory at a time on either side of the RPC.
+    """
+    def generate():
+        after = None
+        first = True
+        if fmt == 'json':
+            yield b'['
+        while True:
+            page = fetch_page(STREAM_BATCH_SIZE, after)
+            rows = [dumps(row) for row in page['items']]
+            if rows:
+                if fmt == 'ndjson':
+                    yield b'\n'.join(rows) + b'\n'
+                else:
+                    yield (b'' if first else b',') + b','.join(rows)
+                    first = False
+            after = page['next_cursor']
+            if not after:
+                break
+        if fmt == 'json':
+            yield b']'
+
+    return Response(generate(), mimetype=STREAM_FORMATS[fmt])
+
+
+def get_etags(request):
+    """Entity tags of If-None-Match, unquoted and with any W/ prefix dropped."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return []
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tags.append(tag.strip('"'))
+    return tags
+
+
+def conditional_response(result, not_found):
+    """
+    Response for a *_if_changed RPC result: 304 with the ETag when the
+    client's copy is current, 404 when there are no rows, the rows otherwise.
+    """
+    headers = {'ETag': f'"{result["etag"]}"'}
+    if result['items'] is None:
+        return Response(status=304, headers=headers)
+    if not result['items']:
+        return 404, dumps({"message": not_found})
+    return 200, headers, dumps(result['items'])
+
 
 class GatewayService:
     name = 'gateway'
@@ -11,20 +118,115 @@ class GatewayService:
     order_detail_rpc = RpcProxy('order_detail_service')
     order_package_rpc = RpcProxy('order_package_service')
 
+    metrics = instrumentation.Metrics()
+    admission = Admission()
+    kitchen_feed = kitchen.Feed()
+
+    # Every gateway instance gets every line change for its kitchen displays
+    @event_handler('order_detail_service', 'order_lines_changed', handler_type=BROADCAST, reliable_delivery=False)
+    def on_order_detail_lines_changed(self, payload):
+        self.kitchen_feed.publish(payload)
+
+    @event_handler('order_package_service', 'order_lines_changed', handler_type=BROADCAST, reliable_delivery=False)
+    def on_order_package_lines_changed(self, payload):
+        self.kitchen_feed.publish(payload)
+
+    @event_handler('order_service', 'order_lines_changed', handler_type=BROADCAST, reliable_delivery=False)
+    def on_order_lines_changed(self, payload):
+        self.kitchen_feed.publish(payload)
+
+    # a display holds its stream for minutes without calling any backend,
+    # so streams would only starve the read class
+    @http('GET', '/kitchen/<int:chef_id>/events', route_class=None)
+    def get_kitchen_events(self, request, chef_id):
+        """
+        Server-Sent Events of a chef's order lines: a display subscribes, loads
+        /order-details/by-chef and /order-packages/by-chef once the hello event
+        has arrived, then applies the line_changed events (keyed by table and
+        line id) instead of polling. On a reset event it reloads both listings.
+        Reconnects resume from the Last-Event-ID header, or ?last_event_id= for
+        clients that cannot set it.
+        """
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        # eventlet's server holds back writes smaller than 4 KiB; frames must go out as they are made
+        request.environ['eventlet.minimum_write_chunk_size'] = 0
+        logger.debug("Gateway: kitchen display for chef %s connected (last event %s)", chef_id, last_event_id)
+        return Response(
+            kitchen.sse_stream(self.kitchen_feed, chef_id, last_event_id),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+
+    # never shed, so overload stays observable
+    @http('GET', '/metrics', route_class=None)
+    def get_metrics(self, request):
+        """
+        Prometheus metrics of the gateway and every backend service.
+        A service that does not answer is reported as order_service_up 0.
+        """
+        snapshots = [self.metrics.snapshot(admission=self.admission.snapshot(), kitchen=self.kitchen_feed.stats())]
+        up = {}
+        replies = [
+            (name, proxy.get_metrics.call_async())
+            for name, proxy in (
+                ('order_service', self.order_rpc),
+                ('order_detail_service', self.order_detail_rpc),
+                ('order_package_service', self.order_package_rpc),
+            )
+        ]
+        for name, reply in replies:
+            try:
+                snapshots.append(reply.result())
+                up[name] = 1
+            except Exception as e:
+                logger.warning("Gateway: metrics from %s unavailable - %s", name, e)
+                up[name] = 0
+
+        body = instrumentation.render_prometheus(snapshots)
+        body += '# TYPE order_service_up gauge\n' + ''.join(
+            f'order_service_up{{service="{name}"}} {value}\n' for name, value in up.items()
+        )
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
     # --- Endpoints for OrderService ---
 
     @http('GET', '/orders')
     def get_all_orders(self, request):
         """
         Retrieves all main orders.
+        Pass ?limit=N (and the returned next_cursor as ?after=) to page through them,
+        or ?stream=ndjson|json to receive everything as a chunked response.
         """
-        print("Gateway: Received GET /orders request")
+        logger.debug("Gateway: Received GET /orders request")
         try:
+            stream_format = get_stream_format(request)
+            if stream_format:
+                return stream_pages(self.order_rpc.get_orders_page, stream_format)
+            page_args = get_page_args(request)
+            if page_args:
+                return dumps(self.order_rpc.get_orders_page(*page_args))
             orders = self.order_rpc.get_all_orders()
-            return json.dumps(orders)
+            return dumps(orders)
+        except ValueError as e:
+            return 400, dumps({"error": str(e)})
+        except Exception as e:
+            logger.error("Gateway Error: get_all_orders - %s", e)
+            return 500, dumps({"error": str(e)})
+
+    @http('GET', '/orders/<int:order_id>/full')
+    def get_order_full(self, request, order_id):
+        """
+        Retrieves an order together with all of its order details and packages.
+        """
+        logger.debug("Gateway: Received GET /orders/%s/full request", order_id)
+        try:
+            order = self.order_rpc.get_order_full(order_id)
+            if order:
+                return dumps(order)
+            return 404, dumps({"message": f"Order {order_id} not found."})
         except Exception as e:
-            print(f"Gateway Error: get_all_orders - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: get_order_full - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('POST', '/orders/create_with_items')
     def create_order_with_multiple_items(self, request):
@@ -42,14 +244,21 @@ class GatewayService:
             "order_type": "...",
             "total_payment": float
         }
+        An Idempotency-Key header makes retries safe: a repeated request with
+        the same key returns the first response (marked Idempotent-Replayed)
+        instead of creating another order.
         """
-        print("Gateway: Received POST /orders/create_with_items request")
+        logger.debug("Gateway: Received POST /orders/create_with_items request")
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
 
             # Validate required fields for the overall order creation
             if 'items' not in payload or not isinstance(payload['items'], list):
-                return 400, json.dumps({"error": "Missing or invalid 'items' list in payload."})
+                return 400, dumps({"error": "Missing or invalid 'items' list in payload."})
+
+            idempotency_key = request.headers.get('Idempotency-Key')
+            if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+                return 400, dumps({"error": f"'Idempotency-Key' must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters."})
 
             # Call the RPC service
             result = self.order_rpc.create_order_with_multiple_items(
@@ -59,16 +268,46 @@ class GatewayService:
                 event_id=payload.get('event_id'),
                 voucher_id=payload.get('voucher_id'),
                 order_type=payload.get('order_type', ''),
-                total_payment=payload.get('total_payment', 0.0)
+                total_payment=payload.get('total_payment', 0.0),
+                idempotency_key=idempotency_key
             )
 
-            status_code = 200 if result.get("success") else 500
-            return status_code, json.dumps(result)
+            if result.get("success"):
+                headers = {'Idempotent-Replayed': 'true'} if result.pop("replayed", False) else {}
+                return 200, headers, dumps(result)
+            status_code = IDEMPOTENCY_STATUS_CODES.get(result.get("status"), 500)
+            if "retry_after" in result:
+                return status_code, {'Retry-After': str(result.pop("retry_after"))}, dumps(result)
+            return status_code, dumps(result)
+        except json.JSONDecodeError:
+            return 400, dumps({"error": "Invalid JSON payload."})
+        except Exception as e:
+            logger.error("Gateway Error: create_order_with_multiple_items - %s", e)
+            return 500, dumps({"error": str(e)})
+
+
+    @http('PUT', '/orders/<int:order_id>')
+    def update_order(self, request, order_id):
+        """
+        Updates the main fields of an order.
+        Expected JSON body: {"update_data": {"total_payment": float, ...}, "expected_version": int}
+        expected_version is optional; when given, a stale version gets 409 Conflict.
+        """
+        logger.debug("Gateway: Received PUT /orders/%s request", order_id)
+        try:
+            payload = loads(request.get_data())
+            update_data = payload.get('update_data')
+            if not isinstance(update_data, dict) or not update_data:
+                return 400, dumps({"error": "Missing or invalid 'update_data' in payload."})
+
+            result = self.order_rpc.update_order(order_id, update_data, payload.get('expected_version'))
+            status_codes = {"updated": 200, "not_found": 404, "conflict": 409, "invalid": 400}
+            return status_codes.get(result.get("status"), 500), dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: create_order_with_multiple_items - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: update_order - %s", e)
+            return 500, dumps({"error": str(e)})
 
 
     # --- Endpoints for OrderDetailService ---
@@ -77,44 +316,54 @@ class GatewayService:
     def get_all_order_details(self, request):
         """
         Retrieves all order details.
+        Pass ?limit=N (and the returned next_cursor as ?after=) to page through them,
+        or ?stream=ndjson|json to receive everything as a chunked response.
         """
-        print("Gateway: Received GET /order-details request")
+        logger.debug("Gateway: Received GET /order-details request")
         try:
+            stream_format = get_stream_format(request)
+            if stream_format:
+                return stream_pages(self.order_detail_rpc.get_order_details_page, stream_format)
+            page_args = get_page_args(request)
+            if page_args:
+                return dumps(self.order_detail_rpc.get_order_details_page(*page_args))
             details = self.order_detail_rpc.get_all_order_details()
-            return json.dumps(details)
+            return dumps(details)
+        except ValueError as e:
+            return 400, dumps({"error": str(e)})
         except Exception as e:
-            print(f"Gateway Error: get_all_order_details - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: get_all_order_details - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('GET', '/order-details/by-order/<int:order_id>')
     def get_order_details_by_order_id(self, request, order_id):
         """
         Retrieves order details by a specific order ID.
+        Answers If-None-Match with 304 while the ETag is still current.
         """
-        print(f"Gateway: Received GET /order-details/by-order/{order_id} request")
+        logger.debug("Gateway: Received GET /order-details/by-order/%s request", order_id)
         try:
-            details = self.order_detail_rpc.get_order_details_orderID(order_id)
-            if details:
-                return json.dumps(details)
-            return 404, json.dumps({"message": "Order details not found for this order ID."})
+            result = self.order_detail_rpc.get_order_details_orderID_if_changed(order_id, get_etags(request))
+            return conditional_response(result, "Order details not found for this order ID.")
         except Exception as e:
-            print(f"Gateway Error: get_order_details_by_order_id - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: get_order_details_by_order_id - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('GET', '/order-details/by-chef/<int:chef_id>')
     def get_order_details_by_chef_id(self, request, chef_id):
         """
         Retrieves order details by a specific chef ID.
+        Answers If-None-Match with 304 while the ETag is still current.
+        Kitchen displays load this when they first subscribe to /kitchen/<chef_id>/events
+        and after a reset event.
         """
-        print(f"Gateway: Received GET /order-details/by-chef/{chef_id} request")
+        logger.debug("Gateway: Received GET /order-details/by-chef/%s request", chef_id)
         try:
-            details = self.order_detail_rpc.get_order_details_chefID(chef_id)
-            if details:
-                return json.dumps(details)
-            return 404, json.dumps({"message": "Order details not found for this chef ID."})
+            result = self.order_detail_rpc.get_order_details_chefID_if_changed(chef_id, get_etags(request))
+            return conditional_response(result, "Order details not found for this chef ID.")
         except Exception as e:
-            print(f"Gateway Error: get_order_details_by_chef_id - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: get_order_details_by_chef_id - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('POST', '/order-details')
     def add_order_details(self, request):
@@ -122,12 +371,12 @@ class GatewayService:
         Adds new order details.
         Expected JSON body: {"order_id": "...", "menu_id": int, "chef_id": int, "quantity": int, "note": "...", "status": "..."}
         """
-        print("Gateway: Received POST /order-details request")
+        logger.debug("Gateway: Received POST /order-details request")
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             required_fields = ['order_id', 'menu_id', 'chef_id', 'quantity']
             if not all(field in payload for field in required_fields):
-                return 400, json.dumps({"error": f"Missing required fields. Required: {required_fields}"})
+                return 400, dumps({"error": f"Missing required fields. Required: {required_fields}"})
 
             # Call the RPC service
             result = self.order_detail_rpc.add_order_details(
@@ -138,12 +387,12 @@ class GatewayService:
                 note=payload.get('note'),
                 status=payload.get('status', 'PENDING') # Default status if not provided
             )
-            return 201, json.dumps(result) # 201 Created
+            return 201, dumps(result) # 201 Created
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: add_order_details - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: add_order_details - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('PUT', '/order-details/<int:order_details_id>/status')
     def change_order_details_status(self, request, order_details_id):
@@ -151,20 +400,44 @@ class GatewayService:
         Changes the status of a specific order detail.
         Expected JSON body: {"new_status": "..."}
         """
-        print(f"Gateway: Received PUT /order-details/{order_details_id}/status request")
+        logger.debug("Gateway: Received PUT /order-details/%s/status request", order_details_id)
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             new_status = payload.get('new_status')
             if not new_status:
-                return 400, json.dumps({"error": "Missing 'new_status' in payload."})
+                return 400, dumps({"error": "Missing 'new_status' in payload."})
 
             result = self.order_detail_rpc.change_order_details_status(order_details_id, new_status)
-            return json.dumps(result)
+            return dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: change_order_details_status - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: change_order_details_status - %s", e)
+            return 500, dumps({"error": str(e)})
+
+    @http('PUT', '/order-details/status')
+    def change_order_details_status_bulk(self, request):
+        """
+        Changes the status of many order details in one transaction.
+        Expected JSON body: {"ids": [int, ...], "new_status": "..."}
+        Returns a per-id outcome.
+        """
+        logger.debug("Gateway: Received PUT /order-details/status request")
+        try:
+            payload = loads(request.get_data())
+            ids = payload.get('ids')
+            new_status = payload.get('new_status')
+            if not isinstance(ids, list) or not ids or not new_status:
+                return 400, dumps({"error": "Missing 'ids' list or 'new_status' in payload."})
+
+            result = self.order_detail_rpc.change_order_details_status_bulk(ids, new_status)
+            status_code = 200 if result.get("success") else 400
+            return status_code, dumps(result)
+        except json.JSONDecodeError:
+            return 400, dumps({"error": "Invalid JSON payload."})
+        except Exception as e:
+            logger.error("Gateway Error: change_order_details_status_bulk - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('PUT', '/order-details/<int:order_details_id>/quantity')
     def change_order_details_quantity(self, request, order_details_id):
@@ -172,20 +445,20 @@ class GatewayService:
         Changes the quantity of a specific order detail.
         Expected JSON body: {"new_quantity": int}
         """
-        print(f"Gateway: Received PUT /order-details/{order_details_id}/quantity request")
+        logger.debug("Gateway: Received PUT /order-details/%s/quantity request", order_details_id)
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             new_quantity = payload.get('new_quantity')
             if new_quantity is None: # Check for None to allow 0 if applicable, but validation handles positive
-                return 400, json.dumps({"error": "Missing 'new_quantity' in payload."})
+                return 400, dumps({"error": "Missing 'new_quantity' in payload."})
 
             result = self.order_detail_rpc.change_order_details_quantity(order_details_id, new_quantity)
-            return json.dumps(result)
+            return dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: change_order_details_quantity - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: change_order_details_quantity - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('PUT', '/order-details/<int:order_details_id>/note')
     def change_order_details_note(self, request, order_details_id):
@@ -193,20 +466,20 @@ class GatewayService:
         Changes the note of a specific order detail.
         Expected JSON body: {"new_note": "..."}
         """
-        print(f"Gateway: Received PUT /order-details/{order_details_id}/note request")
+        logger.debug("Gateway: Received PUT /order-details/%s/note request", order_details_id)
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             new_note = payload.get('new_note') # Allows new_note to be null/None
             if new_note is None and 'new_note' not in payload: # Check if key exists vs value is None
-                return 400, json.dumps({"error": "Missing 'new_note' in payload."})
+                return 400, dumps({"error": "Missing 'new_note' in payload."})
 
             result = self.order_detail_rpc.change_order_details_note(order_details_id, new_note)
-            return json.dumps(result)
+            return dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: change_order_details_note - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: change_order_details_note - %s", e)
+            return 500, dumps({"error": str(e)})
 
 
     # --- Endpoints for OrderPackageService ---
@@ -215,44 +488,54 @@ class GatewayService:
     def get_all_order_packages(self, request):
         """
         Retrieves all order packages.
+        Pass ?limit=N (and the returned next_cursor as ?after=) to page through them,
+        or ?stream=ndjson|json to receive everything as a chunked response.
         """
-        print("Gateway: Received GET /order-packages request")
+        logger.debug("Gateway: Received GET /order-packages request")
         try:
+            stream_format = get_stream_format(request)
+            if stream_format:
+                return stream_pages(self.order_package_rpc.get_order_packages_page, stream_format)
+            page_args = get_page_args(request)
+            if page_args:
+                return dumps(self.order_package_rpc.get_order_packages_page(*page_args))
             packages = self.order_package_rpc.get_all_order_packages()
-            return json.dumps(packages)
+            return dumps(packages)
+        except ValueError as e:
+            return 400, dumps({"error": str(e)})
         except Exception as e:
-            print(f"Gateway Error: get_all_order_packages - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: get_all_order_packages - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('GET', '/order-packages/by-order/<int:order_id>')
     def get_order_packages_by_order_id(self, request, order_id):
         """
         Retrieves order packages by a specific order ID.
+        Answers If-None-Match with 304 while the ETag is still current.
         """
-        print(f"Gateway: Received GET /order-packages/by-order/{order_id} request")
+        logger.debug("Gateway: Received GET /order-packages/by-order/%s request", order_id)
         try:
-            packages = self.order_package_rpc.get_order_packages_orderID(order_id)
-            if packages:
-                return json.dumps(packages)
-            return 404, json.dumps({"message": "Order packages not found for this order ID."})
+            result = self.order_package_rpc.get_order_packages_orderID_if_changed(order_id, get_etags(request))
+            return conditional_response(result, "Order packages not found for this order ID.")
         except Exception as e:
-            print(f"Gateway Error: get_order_packages_by_order_id - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: get_order_packages_by_order_id - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('GET', '/order-packages/by-chef/<int:chef_id>')
     def get_order_packages_by_chef_id(self, request, chef_id):
         """
         Retrieves order packages by a specific chef ID.
+        Answers If-None-Match with 304 while the ETag is still current.
+        Kitchen displays load this when they first subscribe to /kitchen/<chef_id>/events
+        and after a reset event.
         """
-        print(f"Gateway: Received GET /order-packages/by-chef/{chef_id} request")
+        logger.debug("Gateway: Received GET /order-packages/by-chef/%s request", chef_id)
         try:
-            packages = self.order_package_rpc.get_order_packages_chefID(chef_id)
-            if packages:
-                return json.dumps(packages)
-            return 404, json.dumps({"message": "Order packages not found for this chef ID."})
+            result = self.order_package_rpc.get_order_packages_chefID_if_changed(chef_id, get_etags(request))
+            return conditional_response(result, "Order packages not found for this chef ID.")
         except Exception as e:
-            print(f"Gateway Error: get_order_packages_by_chef_id - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: get_order_packages_by_chef_id - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('POST', '/order-packages')
     def add_order_packages(self, request):
@@ -260,12 +543,12 @@ class GatewayService:
         Adds new order packages.
         Expected JSON body: {"order_id": "...", "menu_package_id": int, "chef_id": int, "quantity": int, "note": "...", "status": "..."}
         """
-        print("Gateway: Received POST /order-packages request")
+        logger.debug("Gateway: Received POST /order-packages request")
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             required_fields = ['order_id', 'menu_package_id', 'chef_id', 'quantity']
             if not all(field in payload for field in required_fields):
-                return 400, json.dumps({"error": f"Missing required fields. Required: {required_fields}"})
+                return 400, dumps({"error": f"Missing required fields. Required: {required_fields}"})
 
             result = self.order_package_rpc.add_order_packages(
                 order_id=payload['order_id'],
@@ -275,12 +558,12 @@ class GatewayService:
                 note=payload.get('note'),
                 status=payload.get('status', 'PENDING')  # Default status if not provided
             )
-            return 201, json.dumps(result)
+            return 201, dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: add_order_packages - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: add_order_packages - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('PUT', '/order-packages/<int:order_packages_id>/status')
     def change_order_packages_status(self, request, order_packages_id):
@@ -288,20 +571,44 @@ class GatewayService:
         Changes the status of a specific order package.
         Expected JSON body: {"new_status": "..."}
         """
-        print(f"Gateway: Received PUT /order-packages/{order_packages_id}/status request")
+        logger.debug("Gateway: Received PUT /order-packages/%s/status request", order_packages_id)
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             new_status = payload.get('new_status')
             if not new_status:
-                return 400, json.dumps({"error": "Missing 'new_status' in payload."})
+                return 400, dumps({"error": "Missing 'new_status' in payload."})
 
             result = self.order_package_rpc.change_order_packages_status(order_packages_id, new_status)
-            return json.dumps(result)
+            return dumps(result)
+        except json.JSONDecodeError:
+            return 400, dumps({"error": "Invalid JSON payload."})
+        except Exception as e:
+            logger.error("Gateway Error: change_order_packages_status - %s", e)
+            return 500, dumps({"error": str(e)})
+
+    @http('PUT', '/order-packages/status')
+    def change_order_packages_status_bulk(self, request):
+        """
+        Changes the status of many order packages in one transaction.
+        Expected JSON body: {"ids": [int, ...], "new_status": "..."}
+        Returns a per-id outcome.
+        """
+        logger.debug("Gateway: Received PUT /order-packages/status request")
+        try:
+            payload = loads(request.get_data())
+            ids = payload.get('ids')
+            new_status = payload.get('new_status')
+            if not isinstance(ids, list) or not ids or not new_status:
+                return 400, dumps({"error": "Missing 'ids' list or 'new_status' in payload."})
+
+            result = self.order_package_rpc.change_order_packages_status_bulk(ids, new_status)
+            status_code = 200 if result.get("success") else 400
+            return status_code, dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: change_order_packages_status - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: change_order_packages_status_bulk - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('PUT', '/order-packages/<int:order_packages_id>/quantity')
     def change_order_packages_quantity(self, request, order_packages_id):
@@ -309,20 +616,20 @@ class GatewayService:
         Changes the quantity of a specific order package.
         Expected JSON body: {"new_quantity": int}
         """
-        print(f"Gateway: Received PUT /order-packages/{order_packages_id}/quantity request")
+        logger.debug("Gateway: Received PUT /order-packages/%s/quantity request", order_packages_id)
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             new_quantity = payload.get('new_quantity')
             if new_quantity is None:
-                return 400, json.dumps({"error": "Missing 'new_quantity' in payload."})
+                return 400, dumps({"error": "Missing 'new_quantity' in payload."})
 
             result = self.order_package_rpc.change_order_packages_quantity(order_packages_id, new_quantity)
-            return json.dumps(result)
+            return dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: change_order_packages_quantity - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: change_order_packages_quantity - %s", e)
+            return 500, dumps({"error": str(e)})
 
     @http('PUT', '/order-packages/<int:order_packages_id>/note')
     def change_order_packages_note(self, request, order_packages_id):
@@ -330,17 +637,17 @@ class GatewayService:
         Changes the note of a specific order package.
         Expected JSON body: {"new_note": "..."}
         """
-        print(f"Gateway: Received PUT /order-packages/{order_packages_id}/note request")
+        logger.debug("Gateway: Received PUT /order-packages/%s/note request", order_packages_id)
         try:
-            payload = json.loads(request.get_data(as_text=True))
+            payload = loads(request.get_data())
             new_note = payload.get('new_note')
             if new_note is None and 'new_note' not in payload:
-                return 400, json.dumps({"error": "Missing 'new_note' in payload."})
+                return 400, dumps({"error": "Missing 'new_note' in payload."})
 
             result = self.order_package_rpc.change_order_packages_note(order_packages_id, new_note)
-            return json.dumps(result)
+            return dumps(result)
         except json.JSONDecodeError:
-            return 400, json.dumps({"error": "Invalid JSON payload."})
+            return 400, dumps({"error": "Invalid JSON payload."})
         except Exception as e:
-            print(f"Gateway Error: change_order_packages_note - {e}")
-            return 500, json.dumps({"error": str(e)})
+            logger.error("Gateway Error: change_order_packages_note - %s", e)
+            return 500, dumps({"error": str(e)})
@@ -0,0 +1,246 @@
+import threading
+import time
+from bisect import bisect_left
+
+from nameko.extensions import DependencyProvider
+
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # one slot per bucket plus the +Inf overflow, not cumulative
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return {
+            'buckets': list(self.buckets),
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class MetricsRegistry:
+    """
+    Per-entrypoint latency histogram, in-flight, call and error counts of one
+    service instance.
+    """
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.entrypoints = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        entry = self.entrypoints.get(name)
+        if entry is None:
+            entry = self.entrypoints[name] = {
+                'latency': Histogram(),
+                'in_flight': 0,
+                'calls': 0,
+                'errors': 0,
+            }
+        return entry
+
+    def started(self, name):
+        with self._lock:
+            self._entry(name)['in_flight'] += 1
+
+    def finished(self, name, duration, error=False):
+        with self._lock:
+            entry = self._entry(name)
+            entry['in_flight'] -= 1
+            entry['calls'] += 1
+            if error:
+                entry['errors'] += 1
+            entry['latency'].observe(duration)
+
+    def snapshot(self, **extra):
+        """
+        extra sections are passed through as is: sql (SqlStats.snapshot),
+        pool (Database.get_stats), cache (LookupCache.stats), admission
+        (AdmissionController.snapshot) and kitchen (KitchenFeed.stats).
+        """
+        with self._lock:
+            return dict(extra, **{
+                'service': self.service_name,
+                'entrypoints': {
+                    name: dict(entry, latency=entry['latency'].snapshot())
+                    for name, entry in self.entrypoints.items()
+                },
+            })
+
+
+def _is_server_error(result):
+    status = getattr(result, 'status_code', None)
+    if status is None and isinstance(result, tuple) and result and isinstance(result[0], int):
+        status = result[0]
+    return status is not None and status >= 500
+
+
+class Metrics(DependencyProvider):
+    """
+    Times every worker of the service through worker_setup/worker_result.
+    Workers get the MetricsRegistry so the service can expose snapshot().
+    """
+
+    def setup(self):
+        self.registry = MetricsRegistry(self.container.service_name)
+        self._started = {}
+
+    def get_dependency(self, worker_ctx):
+        return self.registry
+
+    def worker_setup(self, worker_ctx):
+        self._started[worker_ctx] = time.monotonic()
+        self.registry.started(worker_ctx.entrypoint.method_name)
+
+    def worker_result(self, worker_ctx, result=None, exc_info=None):
+        started = self._started.pop(worker_ctx, None)
+        if started is None:
+            return
+        error = exc_info is not None or _is_server_error(result)
+        self.registry.finished(worker_ctx.entrypoint.method_name, time.monotonic() - started, error)
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_prometheus(snapshots):
+    """
+    Prometheus text exposition of a list of MetricsRegistry snapshots.
+    """
+    latency, in_flight, calls, errors = [], [], [], []
+    for snapshot in snapshots:
+        service = snapshot['service']
+        for name, entry in sorted(snapshot['entrypoints'].items()):
+            labels = _labels(service=service, entrypoint=name)
+            histogram = entry['latency']
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+                cumulative += count
+                latency.append(f'order_entrypoint_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            latency.append(f'order_entrypoint_latency_seconds_sum{{{labels}}} {histogram["sum"]}')
+            latency.append(f'order_entrypoint_latency_seconds_count{{{labels}}} {histogram["count"]}')
+            in_flight.append(f'order_entrypoint_in_flight{{{labels}}} {entry["in_flight"]}')
+            calls.append(f'order_entrypoint_calls_total{{{labels}}} {entry["calls"]}')
+            errors.append(f'order_entrypoint_errors_total{{{labels}}} {entry["errors"]}')
+
+    lines = [
+        '# HELP order_entrypoint_latency_seconds Entrypoint latency.',
+        '# TYPE order_entrypoint_latency_seconds histogram',
+    ] + latency + [
+        '# HELP order_entrypoint_in_flight Workers currently running the entrypoint.',
+        '# TYPE order_entrypoint_in_flight gauge',
+    ] + in_flight + [
+        '# HELP order_entrypoint_calls_total Completed entrypoint calls.',
+        '# TYPE order_entrypoint_calls_total counter',
+    ] + calls + [
+        '# HELP order_entrypoint_errors_total Entrypoint calls that raised or returned a 5xx.',
+        '# TYPE order_entrypoint_errors_total counter',
+    ] + errors + _render_sql(snapshots) + _render_stats(snapshots, 'pool', 'order_db_pool', POOL_COUNTERS) \
+        + _render_stats(snapshots, 'cache', 'order_cache', CACHE_COUNTERS) \
+        + _render_stats(snapshots, 'kitchen', 'order_kitchen_feed', KITCHEN_COUNTERS) \
+        + _render_admission(snapshots)
+    return '\n'.join(lines) + '\n'
+
+
+def _render_sql(snapshots):
+    summary, calls, errors, rows = [], [], [], []
+    for snapshot in snapshots:
+        for name, stats in sorted(snapshot.get('sql', {}).items()):
+            labels = _labels(service=snapshot['service'], statement=name)
+            for label, quantile in (('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99')):
+                summary.append(f'order_sql_statement_seconds{{{labels},quantile="{quantile}"}} {stats[label]}')
+            summary.append(f'order_sql_statement_seconds_sum{{{labels}}} {stats["seconds"]}')
+            summary.append(f'order_sql_statement_seconds_count{{{labels}}} {stats["calls"]}')
+            calls.append(f'order_sql_statement_calls_total{{{labels}}} {stats["calls"]}')
+            errors.append(f'order_sql_statement_errors_total{{{labels}}} {stats["errors"]}')
+            rows.append(f'order_sql_statement_rows_total{{{labels}}} {stats["rows"]}')
+    if not calls:
+        return []
+    return [
+        '# HELP order_sql_statement_seconds DatabaseWrapper statement latency.',
+        '# TYPE order_sql_statement_seconds summary',
+    ] + summary + [
+        '# TYPE order_sql_statement_calls_total counter',
+    ] + calls + [
+        '# TYPE order_sql_statement_errors_total counter',
+    ] + errors + [
+        '# TYPE order_sql_statement_rows_total counter',
+    ] + rows
+
+
+# Keys of the stats sections that only ever grow, with their counter names
+# (rendered with a _total suffix); every other numeric key is a gauge
+POOL_COUNTERS = {
+    'checkouts': 'checkouts',
+    'waited': 'waited',
+    'exhausted': 'exhausted',
+    'pings': 'pings',
+    'total_wait': 'wait_seconds',
+}
+CACHE_COUNTERS = {'hits': 'hits', 'misses': 'misses'}
+KITCHEN_COUNTERS = {'published': 'published'}
+
+
+def _render_stats(snapshots, section, prefix, counters):
+    """One counter or gauge per numeric key of a flat stats section."""
+    metrics = {}
+    for snapshot in snapshots:
+        labels = _labels(service=snapshot['service'])
+        for key, value in sorted(snapshot.get(section, {}).items()):
+            if not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                name, kind = f'{prefix}_{counters[key]}_total', 'counter'
+            else:
+                name, kind = f'{prefix}_{key}', 'gauge'
+            metrics.setdefault((name, kind), []).append(f'{name}{{{labels}}} {value}')
+    lines = []
+    for (name, kind), samples in metrics.items():
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples)
+    return lines
+
+
+def _render_admission(snapshots):
+    """Gateway admission control (AdmissionController.snapshot) per route."""
+    in_flight, queue_depth, admitted, shed = [], [], [], []
+    for snapshot in snapshots:
+        admission = snapshot.get('admission')
+        if not admission:
+            continue
+        for route, state in sorted(admission['routes'].items()):
+            labels = _labels(service=snapshot['service'], route=route, route_class=state['class'])
+            in_flight.append(f'order_admission_in_flight{{{labels}}} {state["in_flight"]}')
+            queue_depth.append(f'order_admission_queue_depth{{{labels}}} {state["queue_depth"]}')
+            admitted.append(f'order_admission_admitted_total{{{labels}}} {state["admitted"]}')
+            for reason, count in sorted(state['shed'].items()):
+                shed.append(f'order_admission_shed_total{{{labels},reason="{reason}"}} {count}')
+    if not admitted:
+        return []
+    return [
+        '# HELP order_admission_in_flight Admitted requests currently running.',
+        '# TYPE order_admission_in_flight gauge',
+    ] + in_flight + [
+        '# HELP order_admission_queue_depth Requests waiting for a slot.',
+        '# TYPE order_admission_queue_depth gauge',
+    ] + queue_depth + [
+        '# TYPE order_admission_admitted_total counter',
+    ] + admitted + [
+        '# HELP order_admission_shed_total Requests answered 503 by admission control.',
+        '# TYPE order_admission_shed_total counter',
+    ] + shed
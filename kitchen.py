@@ -0,0 +1,180 @@
+"""
+Per-chef feed of order line changes for the kitchen displays.
+
+order_detail_service, order_package_service and order_service dispatch an
+order_lines_changed event for every added line and every status, quantity
+or note change. Each gateway instance keeps the last buffer_size events of
+every chef so that a display which reconnects with its last event id gets
+what it missed instead of reloading the by-chef listing.
+
+Event ids are "<epoch>-<sequence>". The epoch changes with every gateway
+start, so an id from another instance (or from before a restart) cannot be
+resumed and the display is told to reload instead.
+"""
+import threading
+import time
+import uuid
+from collections import deque
+
+from nameko.extensions import DependencyProvider
+
+from serialization import dumps
+
+DEFAULT_BUFFER_SIZE = 1000
+# seconds
+DEFAULT_HEARTBEAT = 15.0
+DEFAULT_MAX_STREAM_SECONDS = 300.0
+DEFAULT_RETRY = 2.0
+
+
+class KitchenFeed:
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, heartbeat=DEFAULT_HEARTBEAT,
+                 max_stream_seconds=DEFAULT_MAX_STREAM_SECONDS, retry=DEFAULT_RETRY):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.max_stream_seconds = max_stream_seconds
+        self.retry = retry
+        self.epoch = uuid.uuid4().hex[:12]
+        self.published = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        # chef_id -> deque of (seq, event)
+        self._events = {}
+        # chef_id -> seq of the newest event dropped from its buffer
+        self._dropped = {}
+        # chef_id -> Condition on _lock, notified when the chef gets events
+        self._conditions = {}
+
+    def event_id(self, seq):
+        return f'{self.epoch}-{seq}'
+
+    def publish(self, payload):
+        """
+        Appends an order_lines_changed payload to the buffer of every chef it
+        touches, one event per line. Lines without a chef are not shown.
+        """
+        with self._lock:
+            for line in payload['lines']:
+                chef_id = line.get('chef_id')
+                if chef_id is None:
+                    continue
+                self._seq += 1
+                self.published += 1
+                events = self._events.get(chef_id)
+                if events is None:
+                    events = self._events[chef_id] = deque(maxlen=self.buffer_size)
+                if len(events) == self.buffer_size:
+                    self._dropped[chef_id] = events[0][0]
+                events.append((self._seq, {'table': payload['table'], 'change': payload['change'], 'line': line}))
+                condition = self._conditions.get(chef_id)
+                if condition is not None:
+                    condition.notify_all()
+
+    def resume(self, chef_id, last_event_id):
+        """
+        Returns (seq, reset): the sequence to continue after, and whether the
+        display has to reload because last_event_id cannot be resumed. No
+        last_event_id means a fresh display, which starts from now.
+        """
+        with self._lock:
+            if not last_event_id:
+                return self._seq, False
+            epoch, _, seq = last_event_id.rpartition('-')
+            if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+                return self._seq, True
+            seq = int(seq)
+            if seq < self._dropped.get(chef_id, 0):
+                return self._seq, True
+            return seq, False
+
+    def wait(self, chef_id, seq, timeout):
+        """
+        Events of chef_id after seq as a list of (seq, event), waiting up to
+        timeout seconds for the first one. Returns None when events after seq
+        have already been dropped, so the display has to reload.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            condition = self._conditions.get(chef_id)
+            if condition is None:
+                condition = self._conditions[chef_id] = threading.Condition(self._lock)
+            while True:
+                if seq < self._dropped.get(chef_id, 0):
+                    return None
+                events = self._events.get(chef_id, ())
+                if events and events[-1][0] > seq:
+                    return [entry for entry in events if entry[0] > seq]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                condition.wait(remaining)
+
+    def head(self):
+        with self._lock:
+            return self._seq
+
+    def stats(self):
+        with self._lock:
+            return {
+                'chefs': len(self._events),
+                'buffered': sum(len(events) for events in self._events.values()),
+                'published': self.published,
+            }
+
+
+def _frame(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: '.encode() + dumps(data) + b'\n\n'
+
+
+def sse_stream(feed, chef_id, last_event_id=None):
+    """
+    Server-Sent Events of one chef: a hello event carrying the position the
+    stream starts from, a line_changed event per changed line, a reset event
+    when the display has to reload the by-chef listings, and a comment every
+    heartbeat seconds so idle connections stay open. The stream ends after
+    max_stream_seconds and the display reconnects with its Last-Event-ID.
+
+    hello gives the display a Last-Event-ID before the first change, so a
+    reconnect from a quiet stream resumes instead of starting from now.
+    """
+    yield f'retry: {int(feed.retry * 1000)}\n\n'.encode()
+    seq, reset = feed.resume(chef_id, last_event_id)
+    if not reset:
+        yield _frame(feed.event_id(seq), 'hello', {'chef_id': chef_id})
+    deadline = time.monotonic() + feed.max_stream_seconds
+    while True:
+        if reset:
+            seq = feed.head()
+            yield _frame(feed.event_id(seq), 'reset', {'chef_id': chef_id})
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        events = feed.wait(chef_id, seq, min(feed.heartbeat, remaining))
+        reset = events is None
+        if not events:
+            if not reset:
+                yield b': keep-alive\n\n'
+            continue
+        for seq, event in events:
+            yield _frame(feed.event_id(seq), 'line_changed', event)
+
+
+class Feed(DependencyProvider):
+    """
+    Gives every worker of the gateway the same KitchenFeed. Settings come
+    from KITCHEN_FEED in config.yml: buffer_size (events kept per chef),
+    heartbeat, max_stream_seconds and retry (seconds).
+    """
+
+    def setup(self):
+        config = self.container.config.get('KITCHEN_FEED', {})
+        self.feed = KitchenFeed(
+            config.get('buffer_size', DEFAULT_BUFFER_SIZE),
+            config.get('heartbeat', DEFAULT_HEARTBEAT),
+            config.get('max_stream_seconds', DEFAULT_MAX_STREAM_SECONDS),
+            config.get('retry', DEFAULT_RETRY),
+        )
+
+    def get_dependency(self, worker_ctx):
+        return self.feed
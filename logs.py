@@ -0,0 +1,43 @@
+import logging
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records per message template and level every
+    `per` seconds. The first record after a quiet window reports how many
+    were dropped.
+    """
+
+    def __init__(self, rate=10, per=60.0):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self._windows = {}
+
+    def filter(self, record):
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.per:
+            suppressed = window[2] if window else 0
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+            return True
+        if window[1] < self.rate:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+def get_logger(name):
+    """
+    Module logger with rate limiting. Log with %-style arguments so that
+    repeated messages share a template.
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(f, RateLimitFilter) for f in logger.filters):
+        logger.addFilter(RateLimitFilter())
+    return logger
@@ -0,0 +1,380 @@
+"""
+In-memory backend with the DatabaseWrapper interface, selected with
+DATABASE_BACKEND: memory. Lines are indexed by order_id and chef_id with
+hash indexes. The store lives in the process, so every service that should
+see the same data has to run in it (tests, benchmarks, the load test).
+"""
+import threading
+import time
+from collections import defaultdict
+
+from dependencies import (
+    ORDER_UPDATABLE_COLUMNS,
+    OrderDetailRow,
+    OrderPackageRow,
+    OrderRow,
+    instrument_statements,
+)
+from pagination import decode_cursor, encode_cursor
+
+
+class MemoryTable:
+
+    def __init__(self, key, row_type, indexed=True):
+        self.key = key
+        self.row_type = row_type
+        self.indexed = indexed
+        self.rows = {}
+        self.next_id = 1
+        self.by_order = defaultdict(set)
+        self.by_chef = defaultdict(set)
+
+    def insert(self, values):
+        row_id = self.next_id
+        self.next_id += 1
+        row = dict(values, **{self.key: row_id})
+        self.rows[row_id] = row
+        if not self.indexed:
+            return row_id
+        self.by_order[row['order_id']].add(row_id)
+        if row.get('chef_id') is not None:
+            self.by_chef[row['chef_id']].add(row_id)
+        return row_id
+
+    def delete(self, row_id):
+        row = self.rows.pop(row_id, None)
+        if row is None or not self.indexed:
+            return row
+        self.by_order[row['order_id']].discard(row_id)
+        if row.get('chef_id') is not None:
+            self.by_chef[row['chef_id']].discard(row_id)
+        return row
+
+    def select_dicts(self, ids):
+        """The rows of ids in id order, as dicts of row_type's columns."""
+        return [{column: self.rows[row_id][column] for column in self.row_type._fields}
+                for row_id in sorted(ids)]
+
+
+class MemoryStore:
+    """
+    The tables, shared by every wrapper (and every service) that is
+    handed the same store.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.orders = MemoryTable('order_id', OrderRow, indexed=False)
+        self.order_details = MemoryTable('order_detail_id', OrderDetailRow)
+        self.order_packages = MemoryTable('order_package_id', OrderPackageRow)
+        # idempotency_key -> {request_hash, status, response, expires_at}
+        self.idempotency_keys = {}
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def shared_store():
+    """The store every Database provider of this process uses."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = MemoryStore()
+        return _shared_store
+
+
+@instrument_statements
+class MemoryDatabaseWrapper:
+
+    def __init__(self, store, sql_stats=None, pool_stats=None):
+        self.store = store
+        self.sql_stats = sql_stats
+        self.pool_stats = pool_stats if pool_stats is not None else dict
+
+    def _table(self, name):
+        return getattr(self.store, name)
+
+    def _page(self, table, limit, after):
+        start = decode_cursor(after) if after else 0
+        with self.store.lock:
+            # ids are handed out in increasing order, so walk forward from the
+            # cursor instead of sorting the whole table
+            ids = []
+            for row_id in range(start + 1, table.next_id):
+                if row_id in table.rows:
+                    ids.append(row_id)
+                    if len(ids) > limit:
+                        break
+            rows = table.select_dicts(ids)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][table.key])
+        return {"items": rows, "next_cursor": next_cursor}
+
+    def get_affected_keys(self, table, column, value):
+        lines = self._table(table)
+        with self.store.lock:
+            if column == 'order_id':
+                rows = [lines.rows[row_id] for row_id in lines.by_order.get(value, ())]
+            else:
+                rows = [lines.rows[value]] if value in lines.rows else []
+        return {
+            'order_ids': sorted({row['order_id'] for row in rows}),
+            'chef_ids': sorted({row['chef_id'] for row in rows if row['chef_id'] is not None}),
+        }
+
+    def _change_status_bulk(self, table, ids, new_status):
+        lines = self._table(table)
+        ids = list(dict.fromkeys(ids))
+        with self.store.lock:
+            found = {row_id: lines.rows[row_id] for row_id in ids if row_id in lines.rows}
+            for row in found.values():
+                row['status'] = new_status
+        return {
+            "success": True,
+            "results": [
+                {"id": row_id, "success": True, "message": f"Status updated to {new_status}."}
+                if row_id in found else
+                {"id": row_id, "success": False, "message": "Not found."}
+                for row_id in ids
+            ],
+            "order_ids": sorted({row['order_id'] for row in found.values()}),
+            "chef_ids": sorted({row['chef_id'] for row in found.values() if row['chef_id'] is not None}),
+            "lines": [[row_id, row['order_id'], row['chef_id']] for row_id, row in found.items()],
+        }
+
+    def _change_column(self, table, row_id, column, value, label):
+        lines = self._table(table)
+        with self.store.lock:
+            row = lines.rows.get(row_id)
+            if row is None:
+                return {"success": False, "message": f"{label} {row_id} not found."}
+            row[column] = value
+        return {"success": True, "message": f"{label} {row_id} {column} updated."}
+
+    # ---     Order      --- #
+
+    def get_all_orders(self):
+        with self.store.lock:
+            return self.store.orders.select_dicts(self.store.orders.rows)
+
+    def get_orders_page(self, limit, after=None):
+        return self._page(self.store.orders, limit, after)
+
+    def get_order_full(self, order_id):
+        with self.store.lock:
+            order = self.store.orders.rows.get(order_id)
+            if order is None:
+                return None
+            details = self.store.order_details.select_dicts(self.store.order_details.by_order.get(order_id, ()))
+            packages = self.store.order_packages.select_dicts(self.store.order_packages.by_order.get(order_id, ()))
+        return {
+            'order': {column: order[column] for column in OrderRow._fields},
+            'order_details': details,
+            'order_packages': packages,
+        }
+
+    def _insert_order(self, user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at):
+        return self.store.orders.insert(dict(
+            user_id=user_id, reservasi_id=reservasi_id, event_id=event_id, voucher_id=voucher_id,
+            order_type=order_type, total_payment=total_payment, created_at=created_at, version=0
+        ))
+
+    def add_order(self, user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at):
+        with self.store.lock:
+            order_id = self._insert_order(user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at)
+        return {"success": True, "order_id": order_id}
+
+    def add_order_with_items(self, user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at, details, packages):
+        with self.store.lock:
+            order_id = self._insert_order(user_id, reservasi_id, event_id, voucher_id, order_type, total_payment, created_at)
+            detail_ids = [
+                self.store.order_details.insert(dict(
+                    order_id=order_id, menu_id=menu_id, chef_id=chef_id, quantity=quantity, note=note, status=status
+                ))
+                for menu_id, chef_id, quantity, note, status in details
+            ]
+            package_ids = [
+                self.store.order_packages.insert(dict(
+                    order_id=order_id, menu_package_id=menu_package_id, chef_id=chef_id, quantity=quantity, note=note, status=status
+                ))
+                for menu_package_id, chef_id, quantity, note, status in packages
+            ]
+        return {"success": True, "order_id": order_id, "detail_ids": detail_ids, "package_ids": package_ids}
+
+    def update_order(self, order_id, update_data, expected_version=None):
+        invalid = [key for key in update_data if key not in ORDER_UPDATABLE_COLUMNS]
+        if invalid:
+            raise ValueError(f"Columns cannot be updated: {', '.join(invalid)}")
+        if not update_data:
+            raise ValueError("Nothing to update.")
+        with self.store.lock:
+            order = self.store.orders.rows.get(order_id)
+            if order is None:
+                return {"success": False, "status": "not_found", "version": None}
+            if expected_version is not None and order['version'] != expected_version:
+                return {"success": False, "status": "conflict", "version": order['version']}
+            order.update(update_data)
+            order['version'] += 1
+            return {"success": True, "status": "updated", "version": order['version']}
+
+    def delete_order(self, order_id):
+        return self.delete_orders([order_id])["deleted"] > 0
+
+    def delete_orders(self, order_ids):
+        chef_ids = {}
+        deleted = 0
+        with self.store.lock:
+            for name in ('order_details', 'order_packages'):
+                lines = self._table(name)
+                chefs = set()
+                for order_id in order_ids:
+                    for row_id in list(lines.by_order.get(order_id, ())):
+                        row = lines.delete(row_id)
+                        if row['chef_id'] is not None:
+                            chefs.add(row['chef_id'])
+                chef_ids[name] = sorted(chefs)
+            for order_id in set(order_ids):
+                if self.store.orders.delete(order_id) is not None:
+                    deleted += 1
+        return {
+            "success": True,
+            "deleted": deleted,
+            "detail_chef_ids": chef_ids['order_details'],
+            "package_chef_ids": chef_ids['order_packages'],
+        }
+
+    # --- Idempotency keys --- #
+
+    def claim_idempotency_key(self, key, request_hash, lease_seconds):
+        now = time.time()
+        with self.store.lock:
+            entry = self.store.idempotency_keys.get(key)
+            if entry is None or entry['expires_at'] < now:
+                self.store.idempotency_keys[key] = dict(
+                    request_hash=request_hash, status='in_flight', response=None, expires_at=now + lease_seconds
+                )
+                return {"claimed": True}
+            return {"claimed": False, "status": entry['status'], "request_hash": entry['request_hash'],
+                    "response": entry['response']}
+
+    def get_idempotency_key(self, key):
+        with self.store.lock:
+            entry = self.store.idempotency_keys.get(key)
+            if entry is None or entry['expires_at'] < time.time():
+                return None
+            return {"status": entry['status'], "request_hash": entry['request_hash'], "response": entry['response']}
+
+    def complete_idempotency_key(self, key, response, ttl_seconds):
+        with self.store.lock:
+            entry = self.store.idempotency_keys.get(key)
+            if entry is not None:
+                entry.update(status='done', response=response, expires_at=time.time() + ttl_seconds)
+
+    def release_idempotency_key(self, key):
+        with self.store.lock:
+            entry = self.store.idempotency_keys.get(key)
+            if entry is not None and entry['status'] == 'in_flight':
+                del self.store.idempotency_keys[key]
+
+    def purge_idempotency_keys(self, limit=1000):
+        now = time.time()
+        with self.store.lock:
+            expired = [key for key, entry in self.store.idempotency_keys.items() if entry['expires_at'] < now][:limit]
+            for key in expired:
+                del self.store.idempotency_keys[key]
+        return len(expired)
+
+    # --- Order Packages --- #
+
+    def add_order_packages(self, order_id, menu_package_id, chef_id, quantity, note, status):
+        with self.store.lock:
+            row_id = self.store.order_packages.insert(dict(
+                order_id=order_id, menu_package_id=menu_package_id, chef_id=chef_id, quantity=quantity, note=note, status=status
+            ))
+        return {"success": True, "id": row_id}
+
+    def get_all_order_packages(self):
+        with self.store.lock:
+            return self.store.order_packages.select_dicts(self.store.order_packages.rows)
+
+    def get_order_packages_page(self, limit, after=None):
+        return self._page(self.store.order_packages, limit, after)
+
+    def get_order_packages_orderID(self, order_id):
+        with self.store.lock:
+            return self.store.order_packages.select_dicts(self.store.order_packages.by_order.get(order_id, ()))
+
+    def get_order_packages_chefID(self, chef_id):
+        with self.store.lock:
+            return self.store.order_packages.select_dicts(self.store.order_packages.by_chef.get(chef_id, ()))
+
+    def change_order_packages_status(self, order_package_id, new_status):
+        return self._change_column('order_packages', order_package_id, 'status', new_status, 'Order package')
+
+    def change_order_packages_status_bulk(self, order_package_ids, new_status):
+        return self._change_status_bulk('order_packages', order_package_ids, new_status)
+
+    def change_order_packages_quantity(self, order_package_id, new_quantity):
+        return self._change_column('order_packages', order_package_id, 'quantity', new_quantity, 'Order package')
+
+    def change_order_packages_note(self, order_package_id, new_note):
+        return self._change_column('order_packages', order_package_id, 'note', new_note, 'Order package')
+
+    def delete_order_package(self, order_package_id):
+        with self.store.lock:
+            self.store.order_packages.delete(order_package_id)
+
+    def delete_order_packages_by_order_id(self, order_id):
+        with self.store.lock:
+            for row_id in list(self.store.order_packages.by_order.get(order_id, ())):
+                self.store.order_packages.delete(row_id)
+        return {"success": True, "message": f"Order packages for order {order_id} deleted."}
+
+    # --- Order Details --- #
+
+    def add_order_details(self, order_id, menu_id, chef_id, quantity, note, status):
+        with self.store.lock:
+            row_id = self.store.order_details.insert(dict(
+                order_id=order_id, menu_id=menu_id, chef_id=chef_id, quantity=quantity, note=note, status=status
+            ))
+        return {"success": True, "id": row_id}
+
+    def get_all_order_details(self):
+        with self.store.lock:
+            return self.store.order_details.select_dicts(self.store.order_details.rows)
+
+    def get_order_details_page(self, limit, after=None):
+        return self._page(self.store.order_details, limit, after)
+
+    def get_order_details_orderID(self, order_id):
+        with self.store.lock:
+            return self.store.order_details.select_dicts(self.store.order_details.by_order.get(order_id, ()))
+
+    def get_order_details_chefID(self, chef_id):
+        with self.store.lock:
+            return self.store.order_details.select_dicts(self.store.order_details.by_chef.get(chef_id, ()))
+
+    def change_order_details_status(self, order_detail_id, new_status):
+        return self._change_column('order_details', order_detail_id, 'status', new_status, 'Order detail')
+
+    def change_order_details_status_bulk(self, order_detail_ids, new_status):
+        return self._change_status_bulk('order_details', order_detail_ids, new_status)
+
+    def change_order_details_quantity(self, order_detail_id, new_quantity):
+        return self._change_column('order_details', order_detail_id, 'quantity', new_quantity, 'Order detail')
+
+    def change_order_details_note(self, order_detail_id, new_note):
+        return self._change_column('order_details', order_detail_id, 'note', new_note, 'Order detail')
+
+    def delete_order_detail(self, order_detail_id):
+        with self.store.lock:
+            self.store.order_details.delete(order_detail_id)
+
+    def delete_order_details_by_order_id(self, order_id):
+        with self.store.lock:
+            for row_id in list(self.store.order_details.by_order.get(order_id, ())):
+                self.store.order_details.delete(row_id)
+        return {"success": True, "message": f"Order details for order {order_id} deleted."}
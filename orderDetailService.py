@@ -1,34 +1,123 @@
+from nameko.events import BROADCAST, EventDispatcher, event_handler
 from nameko.rpc import rpc
+import caching
 import dependencies
+import instrumentation
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+VALID_STATUSES = ['PENDING', 'ON DELIVERY', 'COMPLETED']
+MAX_BULK_IDS = 500
 
 class orderDetailsService:
 
     name = 'order_detail_service'
 
     database = dependencies.Database()
+    cache = caching.Cache()
+    dispatch = EventDispatcher()
+    metrics = instrumentation.Metrics()
+
+    def _invalidate(self, order_ids, chef_ids):
+        """
+        Drops the affected entries locally and tells every other instance to do the same
+        """
+        self.cache.invalidate(order_ids, chef_ids)
+        self.dispatch('cache_invalidated', {
+            'table': 'order_details',
+            'order_ids': list(order_ids),
+            'chef_ids': list(chef_ids),
+        })
+
+    def _publish(self, change, lines):
+        """
+        Tells the gateway's kitchen feed which lines changed: change is added,
+        status, quantity or note, lines are dicts with id, order_id, chef_id
+        and the new values.
+        """
+        if lines:
+            self.dispatch('order_lines_changed', {'table': 'order_details', 'change': change, 'lines': lines})
+
+    @staticmethod
+    def _line(line_id, keys, **values):
+        """The single line behind get_affected_keys, or none when it does not exist."""
+        if not keys['order_ids']:
+            return []
+        chef_id = keys['chef_ids'][0] if keys['chef_ids'] else None
+        return [dict(values, id=line_id, order_id=keys['order_ids'][0], chef_id=chef_id)]
+
+    @event_handler('order_detail_service', 'cache_invalidated', handler_type=BROADCAST, reliable_delivery=False)
+    def on_cache_invalidated(self, payload):
+        self.cache.invalidate(payload['order_ids'], payload['chef_ids'])
+
+    @event_handler('order_service', 'cache_invalidated', handler_type=BROADCAST, reliable_delivery=False)
+    def on_order_cache_invalidated(self, payload):
+        if payload['table'] == 'order_details':
+            self.cache.invalidate(payload['order_ids'], payload['chef_ids'])
+
+    @rpc
+    def get_cache_stats(self):
+        return self.cache.stats()
+
+    @rpc
+    def get_metrics(self):
+        return self.metrics.snapshot(
+            sql=self.database.sql_stats.snapshot(),
+            pool=self.database.pool_stats(),
+            cache=self.cache.stats()
+        )
 
     @rpc
     def get_all_order_details(self):
         """
         Retrieves all Order Detail
         """
-        orders = self.database.get_all_order_details()
-        return orders
+        return self.database.get_all_order_details()
+
+    @rpc
+    def get_order_details_page(self, limit, after=None):
+        """
+        Retrieves one page of Order Detail, ordered by ID
+        """
+        return self.database.get_order_details_page(limit, after)
+
+    @rpc
+    def get_order_details_orderID_if_changed(self, order_id, etags=()):
+        """
+        Conditional get_order_details_orderID: returns {"etag", "items"}, with items None
+        when the current ETag is among etags, so the rows are not sent.
+        """
+        orders, etag = self.cache.get_tagged(('order', order_id), lambda: self.database.get_order_details_orderID(order_id))
+        if etag in etags or '*' in etags:
+            return {"etag": etag, "items": None}
+        return {"etag": etag, "items": orders}
 
     @rpc
     def get_order_details_orderID(self, order_id):
         """
         Retrieves all Order Detail by Order ID
         """
-        orders = self.database.get_order_details_orderID(order_id)
+        orders = self.cache.get_or_load(('order', order_id), lambda: self.database.get_order_details_orderID(order_id))
         return orders
     
+    @rpc
+    def get_order_details_chefID_if_changed(self, chef_id, etags=()):
+        """
+        Conditional get_order_details_chefID: returns {"etag", "items"}, with items None
+        when the current ETag is among etags, so the rows are not sent.
+        """
+        orders, etag = self.cache.get_tagged(('chef', chef_id), lambda: self.database.get_order_details_chefID(chef_id))
+        if etag in etags or '*' in etags:
+            return {"etag": etag, "items": None}
+        return {"etag": etag, "items": orders}
+
     @rpc
     def get_order_details_chefID(self, chef_id):
         """
         Retrieves all Order Detail by Chef ID
         """
-        orders = self.database.get_order_details_chefID(chef_id)
+        orders = self.cache.get_or_load(('chef', chef_id), lambda: self.database.get_order_details_chefID(chef_id))
         return orders
     
     @rpc 
@@ -38,11 +127,28 @@ class orderDetailsService:
         Expected data: Order_id, Menu_id, Chef_id, Quantity 
         New order with empty status automatically becomes PENDING
         """
-        self.database.add_order_details(order_id, menu_id, chef_id, quantity, note, status)
+        try:
+            order_id, chef_id = dependencies.to_id(order_id), dependencies.to_id(chef_id)
+        except (TypeError, ValueError):
+            return {"success": False, "error": "order_id and chef_id must be integers."}
+        try:
+            result = self.database.add_order_details(order_id, menu_id, chef_id, quantity, note, status)
+        finally:
+            self._invalidate([order_id], [chef_id] if chef_id is not None else [])
+        if result and result.get('success'):
+            self._publish('added', [dict(
+                id=result['id'], order_id=order_id, menu_id=menu_id, chef_id=chef_id,
+                quantity=quantity, note=note, status=status
+            )])
+        return result
 
     @rpc
     def delete_order_details_by_order_id(self, order_id):
-        return self.database.delete_order_details_by_order_id(order_id)
+        keys = self.database.get_affected_keys('order_details', 'order_id', order_id)
+        try:
+            return self.database.delete_order_details_by_order_id(order_id)
+        finally:
+            self._invalidate([order_id], keys['chef_ids'])
 
 
     @rpc
@@ -51,16 +157,45 @@ class orderDetailsService:
         Changes status of a specific Order Detail
         Expected data: Order_Detail_ID, new_status
         """
-        if new_status not in ['PENDING', 'ON DELIVERY', 'COMPLETED']:
-            return {"success": False, "error": "New status must be one of these: 'PENDING', 'ON DELIVERY', 'COMPLETED"}
+        if new_status not in VALID_STATUSES:
+            return {"success": False, "error": f"New status must be one of these: {VALID_STATUSES}"}
         
         try:
+            keys = self.database.get_affected_keys('order_details', 'order_detail_id', order_details_id)
             result = self.database.change_order_details_status(order_details_id, new_status)
+            self._invalidate(keys['order_ids'], keys['chef_ids'])
+            if result.get('success'):
+                self._publish('status', self._line(order_details_id, keys, status=new_status))
             return result
         except Exception as e:
-            print(f"Error changing order detail status: {e}")
+            logger.error("Error changing order detail status: %s", e)
             return {"success": False, "error": f"Failed to change status: {e}"}
 
+    @rpc
+    def change_order_details_status_bulk(self, order_details_ids: list, new_status):
+        """
+        Changes status of many Order Details in one transaction
+        Expected data: list of Order_Detail_IDs, new_status
+        """
+        if new_status not in VALID_STATUSES:
+            return {"success": False, "error": f"New status must be one of these: {VALID_STATUSES}"}
+        if not isinstance(order_details_ids, list) or not order_details_ids or not all(isinstance(i, int) for i in order_details_ids):
+            return {"success": False, "error": "IDs must be a non-empty list of integers."}
+        if len(order_details_ids) > MAX_BULK_IDS:
+            return {"success": False, "error": f"At most {MAX_BULK_IDS} IDs per request."}
+
+        try:
+            result = self.database.change_order_details_status_bulk(order_details_ids, new_status)
+            self._invalidate(result.pop('order_ids'), result.pop('chef_ids'))
+            self._publish('status', [
+                dict(id=line_id, order_id=order_id, chef_id=chef_id, status=new_status)
+                for line_id, order_id, chef_id in result.pop('lines')
+            ])
+            return result
+        except Exception as e:
+            logger.error("Error changing order detail statuses: %s", e)
+            return {"success": False, "error": f"Failed to change statuses: {e}"}
+
     @rpc
     def change_order_details_quantity(self, order_details_id: int, new_quantity: int):
         """
@@ -71,10 +206,14 @@ class orderDetailsService:
             return {"success": False, "error": "New quantity must be a positive integer."}
         
         try:
+            keys = self.database.get_affected_keys('order_details', 'order_detail_id', order_details_id)
             result = self.database.change_order_details_quantity(order_details_id, new_quantity)
+            self._invalidate(keys['order_ids'], keys['chef_ids'])
+            if result.get('success'):
+                self._publish('quantity', self._line(order_details_id, keys, quantity=new_quantity))
             return result
         except Exception as e:
-            print(f"Error changing order detail quantity: {e}")
+            logger.error("Error changing order detail quantity: %s", e)
             return {"success": False, "error": f"Failed to change quantity: {e}"}
 
     @rpc
@@ -87,8 +226,12 @@ class orderDetailsService:
             return {"success": False, "error": "New note must be a string."}
         
         try:
+            keys = self.database.get_affected_keys('order_details', 'order_detail_id', order_details_id)
             result = self.database.change_order_details_note(order_details_id, new_note)
+            self._invalidate(keys['order_ids'], keys['chef_ids'])
+            if result.get('success'):
+                self._publish('note', self._line(order_details_id, keys, note=new_note))
             return result
         except Exception as e:
-            print(f"Error changing order detail note: {e}")
+            logger.error("Error changing order detail note: %s", e)
             return {"success": False, "error": f"Failed to change note: {e}"}
\ No newline at end of file
@@ -1,25 +1,108 @@
+from nameko.events import BROADCAST, EventDispatcher, event_handler
 from nameko.rpc import rpc
+import caching
 import dependencies
+import instrumentation
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+VALID_STATUSES = ['PENDING', 'ON DELIVERY', 'COMPLETED']
+MAX_BULK_IDS = 500
 
 class orderPackagesService:
 
     name = 'order_package_service'
 
     database = dependencies.Database()
+    cache = caching.Cache()
+    dispatch = EventDispatcher()
+    metrics = instrumentation.Metrics()
+
+    def _invalidate(self, order_ids, chef_ids):
+        self.cache.invalidate(order_ids, chef_ids)
+        self.dispatch('cache_invalidated', {
+            'table': 'order_packages',
+            'order_ids': list(order_ids),
+            'chef_ids': list(chef_ids),
+        })
+
+    def _publish(self, change, lines):
+        """
+        Tells the gateway's kitchen feed which lines changed: change is added,
+        status, quantity or note, lines are dicts with id, order_id, chef_id
+        and the new values.
+        """
+        if lines:
+            self.dispatch('order_lines_changed', {'table': 'order_packages', 'change': change, 'lines': lines})
+
+    @staticmethod
+    def _line(line_id, keys, **values):
+        """The single line behind get_affected_keys, or none when it does not exist."""
+        if not keys['order_ids']:
+            return []
+        chef_id = keys['chef_ids'][0] if keys['chef_ids'] else None
+        return [dict(values, id=line_id, order_id=keys['order_ids'][0], chef_id=chef_id)]
+
+    @event_handler('order_package_service', 'cache_invalidated', handler_type=BROADCAST, reliable_delivery=False)
+    def on_cache_invalidated(self, payload):
+        self.cache.invalidate(payload['order_ids'], payload['chef_ids'])
+
+    @event_handler('order_service', 'cache_invalidated', handler_type=BROADCAST, reliable_delivery=False)
+    def on_order_cache_invalidated(self, payload):
+        if payload['table'] == 'order_packages':
+            self.cache.invalidate(payload['order_ids'], payload['chef_ids'])
+
+    @rpc
+    def get_cache_stats(self):
+        return self.cache.stats()
+
+    @rpc
+    def get_metrics(self):
+        return self.metrics.snapshot(
+            sql=self.database.sql_stats.snapshot(),
+            pool=self.database.pool_stats(),
+            cache=self.cache.stats()
+        )
 
     @rpc
     def get_all_order_packages(self):
-        orders = self.database.get_all_order_packages()
-        return orders
+        return self.database.get_all_order_packages()
     
+    @rpc
+    def get_order_packages_page(self, limit, after=None):
+        return self.database.get_order_packages_page(limit, after)
+
+    @rpc
+    def get_order_packages_orderID_if_changed(self, order_id, etags=()):
+        """
+        Conditional get_order_packages_orderID: returns {"etag", "items"}, with items None
+        when the current ETag is among etags, so the rows are not sent.
+        """
+        orders, etag = self.cache.get_tagged(('order', order_id), lambda: self.database.get_order_packages_orderID(order_id))
+        if etag in etags or '*' in etags:
+            return {"etag": etag, "items": None}
+        return {"etag": etag, "items": orders}
+
     @rpc
     def get_order_packages_orderID(self, order_id):
-        orders = self.database.get_order_packages_orderID(order_id)
+        orders = self.cache.get_or_load(('order', order_id), lambda: self.database.get_order_packages_orderID(order_id))
         return orders
     
+    @rpc
+    def get_order_packages_chefID_if_changed(self, chef_id, etags=()):
+        """
+        Conditional get_order_packages_chefID: returns {"etag", "items"}, with items None
+        when the current ETag is among etags, so the rows are not sent.
+        """
+        orders, etag = self.cache.get_tagged(('chef', chef_id), lambda: self.database.get_order_packages_chefID(chef_id))
+        if etag in etags or '*' in etags:
+            return {"etag": etag, "items": None}
+        return {"etag": etag, "items": orders}
+
     @rpc
     def get_order_packages_chefID(self, chef_id):
-        orders = self.database.get_order_packages_chefID(chef_id)
+        orders = self.cache.get_or_load(('chef', chef_id), lambda: self.database.get_order_packages_chefID(chef_id))
         return orders
     
     @rpc 
@@ -27,32 +110,72 @@ class orderPackagesService:
         """
         Adds a new order package. Updated to accept all fields.
         """
-        print(f"OrderPackagesService: Adding package for order {order_id}, package {menu_package_id}...")
+        logger.debug("OrderPackagesService: Adding package for order %s, package %s...", order_id, menu_package_id)
+        try:
+            order_id, chef_id = dependencies.to_id(order_id), dependencies.to_id(chef_id)
+        except (TypeError, ValueError):
+            return {"success": False, "error": "order_id and chef_id must be integers."}
         try:
             # Calls DatabaseWrapper.add_order_packages with all parameters
             result = self.database.add_order_packages(order_id, menu_package_id, chef_id, quantity, note, status)
-            print(f"Order package added result: {result}")
+            logger.debug("Order package added result: %s", result)
+            if result and result.get('success'):
+                self._publish('added', [dict(
+                    id=result['id'], order_id=order_id, menu_package_id=menu_package_id, chef_id=chef_id,
+                    quantity=quantity, note=note, status=status
+                )])
             return result
         except Exception as e:
-            print(f"Error adding order package: {e}")
+            logger.error("Error adding order package: %s", e)
             return {"success": False, "error": f"Failed to add order package: {e}"}
+        finally:
+            self._invalidate([order_id], [chef_id] if chef_id is not None else [])
 
     @rpc
     def delete_order_packages_by_order_id(self, order_id):
-        return self.database.delete_order_packages_by_order_id(order_id)
+        keys = self.database.get_affected_keys('order_packages', 'order_id', order_id)
+        try:
+            return self.database.delete_order_packages_by_order_id(order_id)
+        finally:
+            self._invalidate([order_id], keys['chef_ids'])
 
     @rpc
     def change_order_packages_status(self, order_packages_id, new_status):
-        if new_status not in ['PENDING', 'ON DELIVERY', 'COMPLETED']:
-            return {"success": False, "error": "New status must be one of these: 'PENDING', 'ON DELIVERY', 'COMPLETED', 'PACKED'"}
+        if new_status not in VALID_STATUSES:
+            return {"success": False, "error": f"New status must be one of these: {VALID_STATUSES}"}
         
         try:
+            keys = self.database.get_affected_keys('order_packages', 'order_package_id', order_packages_id)
             result = self.database.change_order_packages_status(order_packages_id, new_status)
+            self._invalidate(keys['order_ids'], keys['chef_ids'])
+            if result.get('success'):
+                self._publish('status', self._line(order_packages_id, keys, status=new_status))
             return result
         except Exception as e:
-            print(f"Error changing order package status: {e}")
+            logger.error("Error changing order package status: %s", e)
             return {"success": False, "error": f"Failed to change status: {e}"}
 
+    @rpc
+    def change_order_packages_status_bulk(self, order_packages_ids: list, new_status):
+        if new_status not in VALID_STATUSES:
+            return {"success": False, "error": f"New status must be one of these: {VALID_STATUSES}"}
+        if not isinstance(order_packages_ids, list) or not order_packages_ids or not all(isinstance(i, int) for i in order_packages_ids):
+            return {"success": False, "error": "IDs must be a non-empty list of integers."}
+        if len(order_packages_ids) > MAX_BULK_IDS:
+            return {"success": False, "error": f"At most {MAX_BULK_IDS} IDs per request."}
+
+        try:
+            result = self.database.change_order_packages_status_bulk(order_packages_ids, new_status)
+            self._invalidate(result.pop('order_ids'), result.pop('chef_ids'))
+            self._publish('status', [
+                dict(id=line_id, order_id=order_id, chef_id=chef_id, status=new_status)
+                for line_id, order_id, chef_id in result.pop('lines')
+            ])
+            return result
+        except Exception as e:
+            logger.error("Error changing order package statuses: %s", e)
+            return {"success": False, "error": f"Failed to change statuses: {e}"}
+
     @rpc
     def change_order_packages_quantity(self, order_packages_id: int, new_quantity: int):
         """
@@ -62,10 +185,14 @@ class orderPackagesService:
             return {"success": False, "error": "New quantity must be a positive integer."}
         
         try:
+            keys = self.database.get_affected_keys('order_packages', 'order_package_id', order_packages_id)
             result = self.database.change_order_packages_quantity(order_packages_id, new_quantity)
+            self._invalidate(keys['order_ids'], keys['chef_ids'])
+            if result.get('success'):
+                self._publish('quantity', self._line(order_packages_id, keys, quantity=new_quantity))
             return result
         except Exception as e:
-            print(f"Error changing order package quantity: {e}")
+            logger.error("Error changing order package quantity: %s", e)
             return {"success": False, "error": f"Failed to change quantity: {e}"}
 
     @rpc
@@ -77,8 +204,12 @@ class orderPackagesService:
             return {"success": False, "error": "New note must be a string."}
         
         try:
+            keys = self.database.get_affected_keys('order_packages', 'order_package_id', order_packages_id)
             result = self.database.change_order_packages_note(order_packages_id, new_note)
+            self._invalidate(keys['order_ids'], keys['chef_ids'])
+            if result.get('success'):
+                self._publish('note', self._line(order_packages_id, keys, note=new_note))
             return result
         except Exception as e:
-            print(f"Error changing order package note: {e}")
+            logger.error("Error changing order package note: %s", e)
             return {"success": False, "error": f"Failed to change note: {e}"}
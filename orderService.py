@@ -1,8 +1,30 @@
+from collections import deque
+import hashlib
+import json
+import time
+
+import eventlet
+from nameko.dependency_providers import Config
+from nameko.events import EventDispatcher
 from nameko.rpc import rpc
 from nameko.rpc import RpcProxy
+from nameko.timer import timer
 from datetime import datetime  # ← tambahkan ini
 
 import dependencies
+import instrumentation
+from logs import get_logger
+from serialization import dumps, loads
+
+logger = get_logger(__name__)
+
+# seconds between reads while a retry waits on the original request,
+# doubling up to the max
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+IDEMPOTENCY_MAX_POLL_INTERVAL = 1.0
+# Retry-After (seconds) sent with in_progress
+IDEMPOTENCY_RETRY_AFTER = 1
+IDEMPOTENCY_PURGE_INTERVAL = 300
 
 class OrdersService:
 
@@ -11,11 +33,25 @@ class OrdersService:
     order_package_rpc = RpcProxy('order_package_service')
 
     database = dependencies.Database()
+    dispatch = EventDispatcher()
+    config = Config()
+    metrics = instrumentation.Metrics()
+
+    @rpc
+    def get_metrics(self):
+        return self.metrics.snapshot(sql=self.database.sql_stats.snapshot(), pool=self.database.pool_stats())
 
     @rpc
     def get_all_orders(self):
-        orders = self.database.get_all_orders()
-        return orders
+        return self.database.get_all_orders()
+
+    @rpc
+    def get_order_full(self, order_id):
+        return self.database.get_order_full(order_id)
+
+    @rpc
+    def get_orders_page(self, limit, after=None):
+        return self.database.get_orders_page(limit, after)
 
     @rpc
     def create_order_with_multiple_items(
@@ -26,9 +62,69 @@ class OrdersService:
         event_id: int = None,
         voucher_id: int = None,
         order_type: int = 1,
-        total_payment: float = 0.0
+        total_payment: float = 0.0,
+        idempotency_key: str = None
     ):
-        print(f"Received request to create order with {len(items)} items.")
+        """
+        With an idempotency_key the order is created at most once per key: a
+        retry while the first call is still running waits for it (up to
+        IDEMPOTENCY_WAIT seconds, then status "in_progress" with retry_after),
+        and a retry after it finished gets the stored response back with
+        "replayed": True. Reusing a key for a different request is refused
+        with status "key_mismatch".
+        """
+        args = (items, user_id, reservasi_id, event_id, voucher_id, order_type, total_payment)
+        if idempotency_key is None:
+            return self._create_order_with_items(*args)
+
+        request_hash = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()
+        lease = self.config.get('IDEMPOTENCY_LEASE', 60)
+        deadline = time.monotonic() + self.config.get('IDEMPOTENCY_WAIT', 10.0)
+        entry = self.database.claim_idempotency_key(idempotency_key, request_hash, lease)
+        delay = IDEMPOTENCY_POLL_INTERVAL
+        while not entry["claimed"]:
+            if entry["request_hash"] != request_hash:
+                return {"success": False, "status": "key_mismatch",
+                        "error": "Idempotency key was already used for a different request."}
+            if entry["status"] == "done":
+                logger.debug("Replaying stored response for idempotency key %s", idempotency_key)
+                return dict(loads(entry["response"]), replayed=True)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {"success": False, "status": "in_progress", "retry_after": IDEMPOTENCY_RETRY_AFTER,
+                        "error": "A request with this idempotency key is still being processed."}
+            # wait on the original with reads only; claim again just when its
+            # entry is gone (released after a failure, or its lease ran out)
+            eventlet.sleep(min(delay, remaining))
+            delay = min(delay * 2, IDEMPOTENCY_MAX_POLL_INTERVAL)
+            entry = self.database.get_idempotency_key(idempotency_key)
+            if entry is None:
+                entry = self.database.claim_idempotency_key(idempotency_key, request_hash, lease)
+            else:
+                entry = dict(entry, claimed=False)
+
+        try:
+            result = self._create_order_with_items(*args)
+        except Exception:
+            self.database.release_idempotency_key(idempotency_key)
+            raise
+        if result.get("success"):
+            self.database.complete_idempotency_key(
+                idempotency_key, dumps(result).decode(), self.config.get('IDEMPOTENCY_TTL', 86400)
+            )
+        else:
+            # failures are not stored, a retry runs the request again
+            self.database.release_idempotency_key(idempotency_key)
+        return result
+
+    @timer(interval=IDEMPOTENCY_PURGE_INTERVAL)
+    def purge_idempotency_keys(self):
+        purged = self.database.purge_idempotency_keys()
+        if purged:
+            logger.debug("Purged %s expired idempotency keys", purged)
+
+    def _create_order_with_items(self, items, user_id, reservasi_id, event_id, voucher_id, order_type, total_payment):
+        logger.debug("Received request to create order with %s items.", len(items))
 
         if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
             return {"success": False, "error": "Items must be a list of dictionaries."}
@@ -39,24 +135,8 @@ class OrdersService:
             # ✅ Tambahkan timestamp created_at
             created_at = datetime.now()
 
-            # 1. Create the main order
-            main_order_result = self.database.add_order(
-                user_id=user_id,
-                reservasi_id=reservasi_id,
-                event_id=event_id,
-                voucher_id=voucher_id,
-                order_type=order_type,
-                total_payment=total_payment,
-                created_at=created_at  # ← kirim created_at ke database
-            )
-
-            if not main_order_result.get("success"):
-                raise Exception(f"Failed to create main order: {main_order_result.get('error', 'Unknown error')}")
-
-            new_order_id = main_order_result.get("order_id")
-            print(f"Main order created with ID: {new_order_id}")
-
-            # 2. Iterate through items and create order details/packages
+            # 1. Validate items and split them into detail and package rows
+            details, packages = [], []
             details_results = []
             for item in items:
                 item_type = item.get("type")
@@ -64,95 +144,232 @@ class OrdersService:
                 item_quantity = item.get("quantity")
 
                 if not all([item_type, item_id, item_quantity]):
-                    print(f"Skipping invalid item: {item}. Missing type, id, or quantity.")
+                    logger.warning("Skipping invalid item: %s. Missing type, id, or quantity.", item)
                     details_results.append({"success": False, "item": item, "error": "Missing type, id, or quantity for item."})
                     continue
 
-                item_note = item.get('note')
-                item_status = item.get('status', 'PENDING')
-                item_chef_id = item.get('chef_id')
-
-                item_result = None
+                try:
+                    chef_id = dependencies.to_id(item.get('chef_id'))
+                except (TypeError, ValueError):
+                    details_results.append({"success": False, "item": item, "error": "chef_id must be an integer."})
+                    continue
+                row = (item_id, chef_id, item_quantity, item.get('note'), item.get('status', 'PENDING'))
                 if item_type == "menu_item":
-                    print(f"Adding menu item detail for order {new_order_id}: menu_id={item_id}, qty={item_quantity}")
-                    item_result = self.order_detail_rpc.add_order_details(
-                        order_id=new_order_id,
-                        menu_id=item_id,
-                        chef_id=item_chef_id,
-                        quantity=item_quantity,
-                        note=item_note,
-                        status=item_status
-                    )
+                    details.append(row)
                 elif item_type == "menu_package":
-                    print(f"Adding menu package detail for order {new_order_id}: package_id={item_id}, qty={item_quantity}")
-                    item_result = self.order_package_rpc.add_order_packages(
-                        order_id=new_order_id,
-                        menu_package_id=item_id,
-                        chef_id=item_chef_id,
-                        quantity=item_quantity,
-                        note=item_note,
-                        status=item_status
-                    )
+                    packages.append(row)
                 else:
-                    print(f"Unknown item type: {item_type} for item: {item}. Skipping.")
+                    logger.warning("Unknown item type: %s for item: %s. Skipping.", item_type, item)
                     details_results.append({"success": False, "item": item, "error": f"Unknown item type: {item_type}"})
                     continue
 
-                details_results.append({"item": item, "result": item_result})
+                details_results.append({"item": item, "result": None})
 
-                if not item_result or not item_result.get("success"):
-                    print(f"Warning: Failed to process item {item_id} (type: {item_type}). Result: {item_result}")
+            if self.config.get('ORDER_ITEM_WRITES', 'batched') == 'rpc':
+                return self._create_order_via_services(
+                    details_results, user_id, reservasi_id, event_id, voucher_id,
+                    order_type, total_payment, created_at
+                )
 
-            print(f"All items processed for order ID {new_order_id}.")
+            # 2. Write the header and every item row in one transaction
+            main_order_result = self.database.add_order_with_items(
+                user_id=user_id,
+                reservasi_id=reservasi_id,
+                event_id=event_id,
+                voucher_id=voucher_id,
+                order_type=order_type,
+                total_payment=total_payment,
+                created_at=created_at,  # ← kirim created_at ke database
+                details=details,
+                packages=packages
+            )
+
+            new_order_id = main_order_result.get("order_id")
+            logger.debug("Main order created with ID: %s", new_order_id)
+
+            # The item rows bypass the detail/package services, so their caches
+            # have to be told about the new order here
+            for table, rows in (('order_details', details), ('order_packages', packages)):
+                if rows:
+                    self.dispatch('cache_invalidated', {
+                        'table': table,
+                        'order_ids': [new_order_id],
+                        'chef_ids': sorted({row[1] for row in rows if row[1] is not None}),
+                    })
+
+            # ... and the kitchen feed about the new lines
+            for table, menu_column, rows, ids in (
+                ('order_details', 'menu_id', details, main_order_result.get("detail_ids", [])),
+                ('order_packages', 'menu_package_id', packages, main_order_result.get("package_ids", [])),
+            ):
+                if rows:
+                    self.dispatch('order_lines_changed', {'table': table, 'change': 'added', 'lines': [
+                        {'id': line_id, 'order_id': new_order_id, menu_column: menu_id, 'chef_id': chef_id,
+                         'quantity': quantity, 'note': note, 'status': status}
+                        for line_id, (menu_id, chef_id, quantity, note, status) in zip(ids, rows)
+                    ]})
+
+            # 3. Hand the generated ids back to the items in input order
+            detail_ids = iter(main_order_result.get("detail_ids", []))
+            package_ids = iter(main_order_result.get("package_ids", []))
+            for entry in details_results:
+                if "result" not in entry:
+                    continue
+                ids = detail_ids if entry["item"].get("type") == "menu_item" else package_ids
+                entry["result"] = {"success": True, "id": next(ids)}
 
             return {
                 "success": True,
                 "order_id": new_order_id,
                 "items_processing_results": details_results,
-                "message": "Order and all specified items processing initiated."
+                "message": "Order and all specified items created."
             }
 
         except Exception as e:
-            print(f"Error creating order with multiple items: {e}")
+            logger.error("Error creating order with multiple items: %s", e)
             return {"success": False, "error": str(e)}
 
+    def _create_order_via_services(self, details_results, user_id, reservasi_id, event_id,
+                                   voucher_id, order_type, total_payment, created_at):
+        """
+        ORDER_ITEM_WRITES: rpc — the header is written here and every item goes
+        through order_detail_service / order_package_service, sent concurrently.
+        """
+        main_order_result = self.database.add_order(
+            user_id=user_id,
+            reservasi_id=reservasi_id,
+            event_id=event_id,
+            voucher_id=voucher_id,
+            order_type=order_type,
+            total_payment=total_payment,
+            created_at=created_at
+        )
+        new_order_id = main_order_result.get("order_id")
+        logger.debug("Main order created with ID: %s", new_order_id)
+
+        entries = [entry for entry in details_results if "result" in entry]
+        calls = []
+        for entry in entries:
+            item = entry["item"]
+            kwargs = dict(
+                order_id=new_order_id,
+                chef_id=item.get('chef_id'),
+                quantity=item.get('quantity'),
+                note=item.get('note'),
+                status=item.get('status', 'PENDING')
+            )
+            if item.get("type") == "menu_item":
+                calls.append((self.order_detail_rpc.add_order_details, dict(kwargs, menu_id=item.get("id"))))
+            else:
+                calls.append((self.order_package_rpc.add_order_packages, dict(kwargs, menu_package_id=item.get("id"))))
+
+        for entry, item_result in zip(entries, self._call_concurrently(calls)):
+            entry["result"] = item_result
+            if not item_result or not item_result.get("success"):
+                logger.warning("Failed to process item %s. Result: %s", entry['item'].get('id'), item_result)
+
+        return {
+            "success": True,
+            "order_id": new_order_id,
+            "items_processing_results": details_results,
+            "message": "Order and all specified items processing initiated."
+        }
+
+    def _call_concurrently(self, calls):
+        """
+        Sends (method, kwargs) RPCs with call_async, keeping at most
+        ITEM_RPC_MAX_IN_FLIGHT outstanding, and returns the replies in input
+        order. Anything not answered by ITEM_RPC_DEADLINE seconds is reported
+        as timed out (the call itself may still complete later).
+        """
+        max_in_flight = self.config.get('ITEM_RPC_MAX_IN_FLIGHT', 10)
+        deadline = time.monotonic() + self.config.get('ITEM_RPC_DEADLINE', 10.0)
+        timed_out = {"success": False, "error": "Timed out waiting for item RPC."}
+        results = [None] * len(calls)
+        pending = deque()
+
+        def collect(index, reply):
+            try:
+                with eventlet.Timeout(max(deadline - time.monotonic(), 0)):
+                    results[index] = reply.result()
+            except eventlet.Timeout:
+                results[index] = timed_out
+            except Exception as e:
+                results[index] = {"success": False, "error": str(e)}
+
+        for index, (method, kwargs) in enumerate(calls):
+            if len(pending) >= max_in_flight:
+                collect(*pending.popleft())
+            if time.monotonic() >= deadline:
+                results[index] = timed_out
+                continue
+            pending.append((index, method.call_async(**kwargs)))
+        while pending:
+            collect(*pending.popleft())
+        return results
+
     @rpc
-    def update_order(self, order_id, update_data: dict):
+    def update_order(self, order_id, update_data: dict, expected_version: int = None):
         """
         Memperbarui data utama dari sebuah order berdasarkan order_id.
         update_data bisa berisi: user_id, reservasi_id, event_id, voucher_id, order_type, total_payment
+        expected_version (opsional) menolak update jika order sudah diubah orang lain.
         """
         try:
-            # Cek apakah order ada
-            orders = self.database.get_all_orders()
-            if not any(o["order_id"] == order_id for o in orders):
-                return {"success": False, "message": f"Order with ID {order_id} not found."}
-
-            result = self.database.update_order(order_id, update_data)
-            return {"success": result, "message": "Order updated successfully." if result else "Update failed."}
+            result = self.database.update_order(order_id, update_data, expected_version)
+        except ValueError as e:
+            return {"success": False, "status": "invalid", "message": str(e)}
         except Exception as e:
             return {"success": False, "message": str(e)}
 
+        messages = {
+            "updated": "Order updated successfully.",
+            "not_found": f"Order with ID {order_id} not found.",
+            "conflict": f"Order {order_id} was modified by someone else (current version {result['version']}).",
+        }
+        result["message"] = messages[result["status"]]
+        return result
+
 
     @rpc
     def delete_order(self, order_id):
         """
-        Menghapus order beserta detail dan paketnya.
+        Menghapus order beserta detail dan paketnya (ON DELETE CASCADE).
         """
         try:
-            # Hapus semua order details
-            deleted_details = self.order_detail_rpc.delete_order_details_by_order_id(order_id)
-            deleted_packages = self.order_package_rpc.delete_order_packages_by_order_id(order_id)
-
-            # Hapus order utama
-            success = self.database.delete_order(order_id)
-
+            result = self._delete_orders([order_id])
+            success = result["deleted"] > 0
             return {
                 "success": success,
-                "message": "Order deleted successfully." if success else "Failed to delete order.",
-                "details_deleted": deleted_details,
-                "packages_deleted": deleted_packages
+                "message": "Order deleted successfully." if success else f"Order with ID {order_id} not found."
+            }
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    @rpc
+    def delete_orders(self, order_ids: list):
+        """
+        Menghapus banyak order sekaligus dalam satu transaksi.
+        """
+        if not isinstance(order_ids, list) or not order_ids:
+            return {"success": False, "message": "order_ids must be a non-empty list."}
+        try:
+            result = self._delete_orders(order_ids)
+            return {
+                "success": True,
+                "deleted": result["deleted"],
+                "message": f"{result['deleted']} of {len(order_ids)} orders deleted."
             }
         except Exception as e:
             return {"success": False, "message": str(e)}
 
+    def _delete_orders(self, order_ids):
+        result = self.database.delete_orders(order_ids)
+        # The cascade bypasses the detail/package services, so tell their caches
+        for table, chef_ids in (('order_details', result["detail_chef_ids"]), ('order_packages', result["package_chef_ids"])):
+            self.dispatch('cache_invalidated', {
+                'table': table,
+                'order_ids': list(order_ids),
+                'chef_ids': chef_ids,
+            })
+        return result
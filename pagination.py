@@ -0,0 +1,14 @@
+import base64
+
+
+def encode_cursor(last_id):
+    """Opaque pagination token for the last primary key of a page."""
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor. Raises ValueError on a malformed token."""
+    try:
+        return int(base64.urlsafe_b64decode(token.encode()).decode())
+    except Exception:
+        raise ValueError(f"Invalid pagination cursor: {token}")
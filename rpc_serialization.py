@@ -0,0 +1,43 @@
+"""
+msgpack serializer for inter-service RPC and event traffic, with extension
+types for Decimal and date/time values. It is registered with kombu by
+nameko through the SERIALIZERS section of config.yml.
+"""
+import datetime
+from decimal import Decimal
+
+import msgpack
+
+CONTENT_TYPE = 'application/x-order-msgpack'
+
+EXT_DECIMAL = 1
+EXT_DATETIME = 2
+EXT_DATE = 3
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, datetime.datetime):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, datetime.date):
+        return msgpack.ExtType(EXT_DATE, obj.isoformat().encode())
+    raise TypeError(f"Object of type {type(obj).__name__} is not msgpack serializable")
+
+
+def _ext_hook(code, data):
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == EXT_DATETIME:
+        return datetime.datetime.fromisoformat(data.decode())
+    if code == EXT_DATE:
+        return datetime.date.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj):
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def loads(data):
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
@@ -0,0 +1,349 @@
+"""
+Versioned schema for the order tables, plus a query-plan check for every
+statement DatabaseWrapper issues.
+
+    python schema.py migrate        # bring the database up to the latest version
+    python schema.py check-plans    # EXPLAIN every wrapper statement, exit 1 on a full scan
+
+Connection settings are those of the services: DB_CONFIG with the MYSQL
+overrides of config.yml (or of the config file given after the command).
+"""
+import inspect
+import os
+import sys
+
+import mysql.connector
+import yaml
+
+import dependencies
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.yml')
+
+
+# The application's tables predate these migrations and are not created
+# here; migrations only change them. A new (e.g. benchmark) database gets
+# them from an existing one with clone_schema().
+BASE_TABLES = ('orders', 'order_details', 'order_packages')
+
+def _refuse_orphan_lines(cursor):
+    """
+    Stops migration 3 while order_details or order_packages hold lines of
+    orders that no longer exist: the constraints cannot be added over them,
+    and whether they go or their orders come back is not for a migration to
+    decide.
+    """
+    orphans = {}
+    for table in ('order_details', 'order_packages'):
+        cursor.execute(f"SELECT COUNT(*) FROM `{table}` WHERE `order_id` NOT IN (SELECT `order_id` FROM `orders`)")
+        count = cursor.fetchone()[0]
+        if count:
+            orphans[table] = count
+    if orphans:
+        counts = ', '.join(f"{count} in {table}" for table, count in orphans.items())
+        raise RuntimeError(
+            f"Lines without an order ({counts}) block the order foreign keys: "
+            f"restore their orders or remove them, then migrate again"
+        )
+
+
+# (version, description, statements). A statement is SQL or a function
+# called with the cursor, for checks. Never edit a released migration,
+# append a new one instead.
+MIGRATIONS = [
+    (1, "indexes for the order lookups", [
+        """
+        ALTER TABLE `order_details`
+            ADD KEY `idx_order_details_order` (`order_id`),
+            ADD KEY `idx_order_details_chef_status` (`chef_id`, `status`)
+        """,
+        """
+        ALTER TABLE `order_packages`
+            ADD KEY `idx_order_packages_order` (`order_id`),
+            ADD KEY `idx_order_packages_chef_status` (`chef_id`, `status`)
+        """,
+    ]),
+    (2, "optimistic concurrency version on orders", [
+        "ALTER TABLE `orders` ADD COLUMN `version` INT NOT NULL DEFAULT 0",
+    ]),
+    (3, "cascade order deletes to details and packages", [
+        _refuse_orphan_lines,
+        """
+        ALTER TABLE `order_details` ADD CONSTRAINT `fk_order_details_order`
+            FOREIGN KEY (`order_id`) REFERENCES `orders` (`order_id`) ON DELETE CASCADE
+        """,
+        """
+        ALTER TABLE `order_packages` ADD CONSTRAINT `fk_order_packages_order`
+            FOREIGN KEY (`order_id`) REFERENCES `orders` (`order_id`) ON DELETE CASCADE
+        """,
+    ]),
+    (4, "idempotency keys for order creation", [
+        """
+        CREATE TABLE IF NOT EXISTS `idempotency_keys` (
+            `idempotency_key` VARCHAR(255) NOT NULL,
+            `request_hash` CHAR(64) NOT NULL,
+            `status` VARCHAR(16) NOT NULL,
+            `response` MEDIUMTEXT NULL,
+            `expires_at` DATETIME NOT NULL,
+            PRIMARY KEY (`idempotency_key`),
+            KEY `idx_idempotency_keys_expires` (`expires_at`)
+        ) ENGINE=InnoDB
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS `schema_version` (
+                `version` INT NOT NULL,
+                `description` VARCHAR(255) NOT NULL,
+                `applied_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (`version`)
+            ) ENGINE=InnoDB
+        """)
+        cursor.execute("SELECT MAX(`version`) FROM `schema_version`")
+        return cursor.fetchone()[0] or 0
+    finally:
+        cursor.close()
+
+
+def load_mysql_config(path=CONFIG_FILE):
+    """The connection settings Database.setup uses, read from the config file at path."""
+    with open(path) as f:
+        return dependencies.mysql_config(yaml.safe_load(f) or {})
+
+
+def _tables(connection, database=None):
+    cursor = connection.cursor()
+    try:
+        if database is None:
+            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")
+        else:
+            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s", (database,))
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def clone_schema(connection, source):
+    """
+    Gives the connection's database, when it has none of BASE_TABLES yet, the
+    table definitions and schema version of the source database, so that
+    its columns are exactly those of the real tables. Returns the tables
+    created.
+    """
+    source_tables = _tables(connection, source)
+    if _tables(connection) & set(BASE_TABLES):
+        return []
+    missing = [table for table in BASE_TABLES if table not in source_tables]
+    if missing:
+        raise RuntimeError(f"Database {source} has no {', '.join(missing)} table to clone")
+    tables = list(BASE_TABLES) + [table for table in ('idempotency_keys', 'schema_version') if table in source_tables]
+    cursor = connection.cursor()
+    try:
+        # the foreign keys reference tables that may not have been created yet
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in tables:
+            cursor.execute(f"SHOW CREATE TABLE `{source}`.`{table}`")
+            cursor.execute(cursor.fetchone()[1])
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        if 'schema_version' in tables:
+            cursor.execute(f"INSERT INTO `schema_version` SELECT * FROM `{source}`.`schema_version`")
+        connection.commit()
+    finally:
+        cursor.close()
+    return tables
+
+
+def migrate(connection, target=LATEST_VERSION):
+    """
+    Applies every migration above the recorded version up to target.
+    Returns the list of versions applied.
+    """
+    missing = [table for table in BASE_TABLES if table not in _tables(connection)]
+    if missing:
+        raise RuntimeError(f"Missing table(s) {', '.join(missing)}: load the application schema first")
+    applied = []
+    version = current_version(connection)
+    cursor = connection.cursor()
+    try:
+        for number, description, statements in MIGRATIONS:
+            if number <= version or number > target:
+                continue
+            print(f"Applying schema migration {number}: {description}")
+            for sql in statements:
+                if callable(sql):
+                    sql(cursor)
+                else:
+                    cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO `schema_version` (`version`, `description`) VALUES (%s, %s)",
+                (number, description)
+            )
+            connection.commit()
+            applied.append(number)
+    except mysql.connector.Error as e:
+        connection.rollback()
+        print(f"Schema migration error: {e}")
+        raise
+    finally:
+        cursor.close()
+    return applied
+
+
+# --- Query plan check --- #
+
+# Methods that read a whole table on purpose
+FULL_SCAN_ALLOWED = {
+    'get_all_orders',
+    'get_all_order_details',
+    'get_all_order_packages',
+}
+
+SAMPLE_ITEM = (1, 1, 1, 'note', 'PENDING')
+
+# Arguments for methods whose parameters are not plain ids
+SAMPLE_CALLS = {
+    'add_order_with_items': [dict(
+        user_id=1, reservasi_id=1, event_id=1, voucher_id=1, order_type=1, total_payment=0,
+        created_at='2024-01-01 00:00:00', details=[SAMPLE_ITEM], packages=[SAMPLE_ITEM]
+    )],
+    'change_order_details_status_bulk': [dict(order_detail_ids=[1, 2, 3], new_status='COMPLETED')],
+    'change_order_packages_status_bulk': [dict(order_package_ids=[1, 2, 3], new_status='COMPLETED')],
+    'delete_orders': [dict(order_ids=[1, 2, 3])],
+    'update_order': [dict(order_id=1, update_data={'total_payment': 0}, expected_version=0)],
+    'get_orders_page': [dict(limit=10, after=None)],
+    'get_order_details_page': [dict(limit=10, after=None)],
+    'get_order_packages_page': [dict(limit=10, after=None)],
+    'claim_idempotency_key': [dict(key='sample-key', request_hash='0' * 64, lease_seconds=60)],
+    'get_idempotency_key': [dict(key='sample-key')],
+    'complete_idempotency_key': [dict(key='sample-key', response='{}', ttl_seconds=60)],
+    'release_idempotency_key': [dict(key='sample-key')],
+    'purge_idempotency_keys': [dict(limit=1000)],
+    'get_affected_keys': [
+        dict(table='order_details', column='order_id', value=1),
+        dict(table='order_details', column='order_detail_id', value=1),
+        dict(table='order_packages', column='order_id', value=1),
+        dict(table='order_packages', column='order_package_id', value=1),
+    ],
+}
+
+SAMPLE_STRINGS = {'note', 'new_note', 'status', 'new_status'}
+
+# What the stand-in cursor fetches for methods that only go on to their
+# writes when a read finds rows: (id, order_id, chef_id) of the locked lines
+SAMPLE_ROWS = {
+    'change_order_details_status_bulk': [(1, 1, 1), (2, 1, 1), (3, 1, 1)],
+    'change_order_packages_status_bulk': [(1, 1, 1), (2, 1, 1), (3, 1, 1)],
+}
+
+
+class _ExplainCursor:
+    """
+    Stands in for a wrapper cursor: every statement is EXPLAINed instead of
+    executed, fetchall returns the given rows and every other fetch nothing.
+    """
+
+    lastrowid = 0
+    rowcount = 0
+
+    def __init__(self, connection, plans, rows=()):
+        self._connection = connection
+        self._plans = plans
+        self._rows = rows
+
+    def execute(self, sql, params=()):
+        cursor = self._connection.cursor(dictionary=True)
+        try:
+            cursor.execute("EXPLAIN " + sql, params)
+            self._plans.append((" ".join(sql.split()), cursor.fetchall()))
+        finally:
+            cursor.close()
+
+    def executemany(self, sql, seq_params):
+        self.execute(sql, seq_params[0])
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchmany(self, size=1):
+        return []
+
+    def close(self):
+        pass
+
+
+class _ExplainConnection:
+
+    in_transaction = False
+
+    def __init__(self, connection, rows=()):
+        self._connection = connection
+        self._rows = rows
+        self.plans = []
+
+    def cursor(self, *args, **kwargs):
+        return _ExplainCursor(self._connection, self.plans, self._rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def _sample_calls(name, method):
+    if name in SAMPLE_CALLS:
+        return SAMPLE_CALLS[name]
+    params = inspect.signature(method).parameters
+    return [{p: ('PENDING' if p in SAMPLE_STRINGS else 1) for p in params if p != 'self'}]
+
+
+def check_plans(connection):
+    """
+    EXPLAINs every statement of every public DatabaseWrapper method.
+    Returns a list of (method, sql, table, access type) for each full table
+    or full index scan outside FULL_SCAN_ALLOWED.
+    """
+    failures = []
+    for name, method in inspect.getmembers(dependencies.DatabaseWrapper, inspect.isfunction):
+        if name.startswith('_'):
+            continue
+        for kwargs in _sample_calls(name, method):
+            explain_connection = _ExplainConnection(connection, SAMPLE_ROWS.get(name, ()))
+            getattr(dependencies.DatabaseWrapper(explain_connection), name)(**kwargs)
+            for sql, plan in explain_connection.plans:
+                if sql.startswith('INSERT'):
+                    continue
+                for row in plan:
+                    access = row.get('type')
+                    print(f"{name}: {row.get('table')} type={access} key={row.get('key')}")
+                    if access in ('ALL', 'index') and row.get('table') and name not in FULL_SCAN_ALLOWED:
+                        failures.append((name, sql, row.get('table'), access))
+    return failures
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+    connection = mysql.connector.connect(**load_mysql_config(sys.argv[2] if len(sys.argv) > 2 else CONFIG_FILE))
+    try:
+        if command == 'migrate':
+            applied = migrate(connection)
+            print(f"Schema at version {LATEST_VERSION}, applied: {applied or 'nothing'}")
+        elif command == 'check-plans':
+            failures = check_plans(connection)
+            for name, sql, table, access in failures:
+                print(f"FULL SCAN in {name} on {table} (type={access}): {sql}")
+            sys.exit(1 if failures else 0)
+        else:
+            print(f"Unknown command: {command}")
+            sys.exit(2)
+    finally:
+        connection.close()
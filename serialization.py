@@ -0,0 +1,42 @@
+"""
+JSON encoding for gateway responses. Uses orjson when it is installed and
+falls back to the stdlib otherwise; both handle Decimal and datetime.
+dumps() always returns bytes.
+"""
+import datetime
+import json
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    # Decimal goes out as a string, the same form it has after an RPC hop
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    ENCODER = 'orjson'
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(data):
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        return orjson.loads(data)
+else:
+    ENCODER = 'json'
+    _encoder = json.JSONEncoder(default=_default, separators=(',', ':'))
+
+    def dumps(obj):
+        return _encoder.encode(obj).encode()
+
+    def loads(data):
+        return json.loads(data)
@@ -0,0 +1,32 @@
+# nameko runs on eventlet; patch before anything else imports socket or threading
+import eventlet
+eventlet.monkey_patch()  # noqa: E402
+
+import os
+import sys
+
+import pytest
+
+BENCHMARKS = os.path.join(os.path.dirname(__file__), '..', 'benchmarks')
+sys.path.insert(0, BENCHMARKS)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+@pytest.fixture(scope='module')
+def gateway_url():
+    """
+    Base URL of a gateway whose services run in this process on the memory
+    backend and broker (as in benchmarks/loadtest.py), with a few orders.
+    """
+    import loadtest
+    import memorydb
+    from dataset import Dataset, load_memory
+
+    store = memorydb.shared_store()
+    if not store.orders.rows:
+        load_memory(store, Dataset(500))
+    port = loadtest.free_port()
+    containers = loadtest.start_services(loadtest.load_config('memory://', port))
+    yield f'http://127.0.0.1:{port}'
+    for container in containers:
+        container.kill()
@@ -0,0 +1,275 @@
+"""
+Connection handling of the Database dependency without a MySQL server:
+checkout limits and exhaustion on a pool of FakeConnections, when those
+connections are pinged, their prepared statement caches, and concurrent
+workers on the memory backend.
+
+    python -m pytest tests/test_database_pool.py
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mysql.connector  # noqa: E402
+
+import dependencies  # noqa: E402
+
+_connection_ids = itertools.count(1)
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.closed = False
+
+    def execute(self, sql, params=()):
+        if self.connection.fail_next:
+            self.connection.fail_next = False
+            raise mysql.connector.errors.OperationalError("Lost connection to MySQL server during query")
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    """Stands in for a mysql.connector connection; counts pings and reconnects."""
+
+    in_transaction = False
+
+    def __init__(self):
+        self.connection_id = next(_connection_ids)
+        self.pings = 0
+        self.fail_next = False
+        self.unreachable = False
+        self.closed = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.unreachable:
+            raise mysql.connector.errors.InterfaceError("Can't connect to MySQL server")
+        if reconnect:
+            self.connection_id = next(_connection_ids)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnector:
+
+    def __init__(self):
+        self.opened = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        connection = FakeConnection()
+        with self._lock:
+            self.opened.append(connection)
+        return connection
+
+
+def make_database(backend='mysql', idle_check=60.0, prepared=False, **kwargs):
+    database = dependencies.Database(**kwargs)
+    database.container = SimpleNamespace(config={'DATABASE_BACKEND': backend, 'PREPARED_STATEMENTS': prepared})
+    database.setup()
+    connector = None
+    if backend == 'mysql':
+        connector = FakeConnector()
+        database.connection_pool = dependencies.ConnectionPool(connector, idle_check, database._drop_statements)
+    return database, connector
+
+
+class CheckoutTest(unittest.TestCase):
+
+    def test_exhausted_pool_raises_after_checkout_timeout(self):
+        database, connector = make_database(pool_size=2, checkout_timeout=0.05)
+        workers = [object(), object()]
+        for worker in workers:
+            database.get_dependency(worker)
+
+        started = time.monotonic()
+        with self.assertRaises(mysql.connector.errors.PoolError):
+            database.get_dependency(object())
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+        stats = database.get_stats()
+        self.assertEqual((stats['in_use'], stats['waited'], stats['exhausted']), (2, 1, 1))
+
+        database.worker_teardown(workers[0])
+        database.get_dependency(object())
+        self.assertEqual(len(connector.opened), 2)
+
+    def test_waiting_worker_gets_the_released_connection(self):
+        database, connector = make_database(pool_size=1, checkout_timeout=2.0)
+        holder = object()
+        database.get_dependency(holder)
+        timer = threading.Timer(0.05, database.worker_teardown, (holder,))
+        timer.start()
+
+        wrapper = database.get_dependency(object())
+        timer.join()
+
+        self.assertIs(wrapper.connection, connector.opened[0])
+        stats = database.get_stats()
+        self.assertEqual((stats['waited'], stats['exhausted']), (1, 0))
+        self.assertGreater(stats['max_wait'], 0.0)
+
+    def test_concurrent_workers_stay_within_pool_size(self):
+        database, connector = make_database(pool_size=4, checkout_timeout=5.0)
+        errors = []
+
+        def work():
+            try:
+                for _ in range(50):
+                    worker = object()
+                    database.get_dependency(worker)
+                    time.sleep(0.0005)
+                    database.worker_teardown(worker)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = database.get_stats()
+        self.assertEqual(stats['checkouts'], 16 * 50)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertLessEqual(stats['peak_in_use'], 4)
+        self.assertLessEqual(len(connector.opened), 4)
+
+
+class ConnectionCheckTest(unittest.TestCase):
+
+    def test_recently_used_connection_is_not_pinged(self):
+        database, connector = make_database(pool_size=2)
+        for _ in range(5):
+            worker = object()
+            database.get_dependency(worker)
+            database.worker_teardown(worker)
+
+        self.assertEqual(len(connector.opened), 1)
+        self.assertEqual(connector.opened[0].pings, 0)
+        self.assertEqual(database.get_stats()['pings'], 0)
+
+    def test_idle_connection_is_pinged(self):
+        database, connector = make_database(pool_size=2, idle_check=0.0)
+        worker = object()
+        database.get_dependency(worker)
+        database.worker_teardown(worker)
+        time.sleep(0.01)
+
+        database.get_dependency(object())
+        self.assertEqual(connector.opened[0].pings, 1)
+
+    def test_connection_is_reconnected_after_a_failed_statement(self):
+        database, connector = make_database(pool_size=1)
+        worker = object()
+        wrapper = database.get_dependency(worker)
+        connection = wrapper.connection
+        connection_id = connection.connection_id
+        connection.fail_next = True
+        with self.assertRaises(mysql.connector.Error):
+            wrapper.get_order_details_orderID(1)
+        database.worker_teardown(worker)
+
+        wrapper = database.get_dependency(object())
+        self.assertIs(wrapper.connection, connection)
+        self.assertEqual(connection.pings, 1)
+        self.assertNotEqual(connection.connection_id, connection_id)
+
+
+class StatementCacheTest(unittest.TestCase):
+
+    def test_connection_keeps_its_statements_across_checkouts(self):
+        database, connector = make_database(pool_size=2, prepared=True)
+        worker = object()
+        database.get_dependency(worker).get_order_details_orderID(1)
+        database.worker_teardown(worker)
+
+        statements = database.get_dependency(object()).statements
+        self.assertEqual(len(statements.cursors), 1)
+        self.assertFalse(any(cursor.closed for cursor in statements.cursors.values()))
+
+    def test_reconnected_connection_starts_with_new_statements(self):
+        database, connector = make_database(pool_size=1, prepared=True)
+        for _ in range(5):
+            worker = object()
+            wrapper = database.get_dependency(worker)
+            wrapper.get_order_details_orderID(1)
+            old = list(wrapper.statements.cursors.values())
+            wrapper.connection.fail_next = True
+            with self.assertRaises(mysql.connector.Error):
+                wrapper.get_order_details_chefID(1)
+            database.worker_teardown(worker)
+
+            worker = object()
+            statements = database.get_dependency(worker).statements
+            self.assertEqual(statements.connection_id, connector.opened[0].connection_id)
+            self.assertEqual(statements.cursors, {})
+            # the old session's handles are not closed on the new session
+            self.assertFalse(any(cursor.closed for cursor in old))
+            database.worker_teardown(worker)
+
+        self.assertEqual(len(database._statement_caches), 1)
+
+    def test_statements_go_with_their_connection(self):
+        database, connector = make_database(pool_size=1, idle_check=0.0, prepared=True)
+        worker = object()
+        database.get_dependency(worker).get_order_details_orderID(1)
+        database.worker_teardown(worker)
+        connector.opened[0].unreachable = True
+        time.sleep(0.01)
+
+        # the pool closes a connection it cannot reconnect
+        with self.assertRaises(mysql.connector.Error):
+            database.get_dependency(object())
+        self.assertTrue(connector.opened[0].closed)
+        self.assertEqual(database._statement_caches, {})
+
+
+class MemoryBackendTest(unittest.TestCase):
+
+    def test_concurrent_workers_share_the_store(self):
+        database, _ = make_database('memory', pool_size=1)
+        order_id = database.get_dependency(object()).add_order(1, None, None, None, 1, 0, None)['order_id']
+
+        def work():
+            for _ in range(25):
+                worker = object()
+                wrapper = database.get_dependency(worker)
+                wrapper.add_order_details(order_id, 1, 7, 1, None, 'PENDING')
+                database.worker_teardown(worker)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        details = database.get_dependency(object()).get_order_details_orderID(order_id)
+        self.assertEqual(len(details), 8 * 25)
+        # the memory backend takes no connections, so the pool size does not limit it
+        self.assertEqual(database.get_stats()['checkouts'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
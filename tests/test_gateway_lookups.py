@@ -0,0 +1,23 @@
+"""
+Cached by-order lookups through the gateway: the rows, their ETag and the
+304 while the rows are unchanged.
+"""
+import requests
+
+import memorydb
+
+
+def test_cached_lookup_answers_if_none_match(gateway_url):
+    store = memorydb.shared_store()
+    order_id = next(iter(store.order_details.by_order))
+    url = f'{gateway_url}/order-details/by-order/{order_id}'
+
+    first = requests.get(url)
+    second = requests.get(url)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert {row['order_id'] for row in first.json()} == {order_id}
+    assert len(first.json()) == len(store.order_details.by_order[order_id])
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert requests.get(url, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
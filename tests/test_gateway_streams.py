@@ -0,0 +1,33 @@
+"""
+Streamed listings through the gateway's admission control and compression.
+"""
+import re
+
+import requests
+
+import memorydb
+
+
+def admission_in_flight(gateway_url, route):
+    metrics = requests.get(f'{gateway_url}/metrics').text
+    match = re.search(rf'^order_admission_in_flight{{[^}}]*route="{re.escape(route)}"[^}}]*}} (\d+)$', metrics, re.M)
+    return int(match.group(1)) if match else 0
+
+
+def test_head_of_compressed_stream_releases_admission_slot(gateway_url):
+    # the body of a HEAD response is closed without ever being iterated
+    for _ in range(3):
+        response = requests.head(f'{gateway_url}/orders?stream=ndjson', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+
+    assert admission_in_flight(gateway_url, 'GET /orders') == 0
+    assert requests.get(f'{gateway_url}/orders?limit=1').status_code == 200
+
+
+def test_compressed_stream_releases_admission_slot(gateway_url):
+    response = requests.get(f'{gateway_url}/orders?stream=ndjson', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == len(memorydb.shared_store().orders.rows)
+    assert admission_in_flight(gateway_url, 'GET /orders') == 0
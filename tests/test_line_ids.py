@@ -0,0 +1,46 @@
+"""
+Ids that JSON clients send as strings must reach the caches and the
+kitchen feed as the ints they are keyed by.
+"""
+from nameko.testing.services import worker_factory
+
+from orderDetailService import orderDetailsService
+from orderPackageService import orderPackagesService
+
+
+def published_lines(service):
+    return [line for event, payload in (call[0] for call in service.dispatch.call_args_list)
+            if event == 'order_lines_changed' for line in payload['lines']]
+
+
+def test_add_order_details_coerces_ids():
+    service = worker_factory(orderDetailsService)
+    service.database.add_order_details.return_value = {'success': True, 'id': 5}
+
+    service.add_order_details('12', 3, '7', 1)
+
+    service.database.add_order_details.assert_called_once_with(12, 3, 7, 1, 'None', 'PENDING')
+    service.cache.invalidate.assert_called_once_with([12], [7])
+    [line] = published_lines(service)
+    assert (line['order_id'], line['chef_id']) == (12, 7)
+
+
+def test_add_order_packages_coerces_ids():
+    service = worker_factory(orderPackagesService)
+    service.database.add_order_packages.return_value = {'success': True, 'id': 5}
+
+    service.add_order_packages('12', 3, '7', 1)
+
+    service.cache.invalidate.assert_called_once_with([12], [7])
+    [line] = published_lines(service)
+    assert (line['order_id'], line['chef_id']) == (12, 7)
+
+
+def test_add_order_details_rejects_non_integer_ids():
+    service = worker_factory(orderDetailsService)
+
+    result = service.add_order_details('twelve', 3, None, 1)
+
+    assert result['success'] is False
+    service.database.add_order_details.assert_not_called()
+    service.cache.invalidate.assert_not_called()
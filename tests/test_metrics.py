@@ -0,0 +1,26 @@
+"""
+Prometheus rendering of the pool, cache and kitchen feed stats.
+"""
+from instrumentation import render_prometheus
+
+
+def test_monotonic_stats_are_counters():
+    text = render_prometheus([{
+        'service': 'order_detail_service',
+        'entrypoints': {},
+        'pool': {'checkouts': 7, 'waited': 1, 'exhausted': 0, 'pings': 2, 'total_wait': 0.5,
+                 'in_use': 3, 'peak_in_use': 4, 'pool_size': 10, 'max_wait': 0.2, 'avg_wait': 0.07},
+        'cache': {'entries': 5, 'hits': 9, 'misses': 3, 'hit_rate': 0.75},
+        'kitchen': {'chefs': 2, 'buffered': 6, 'published': 11},
+    }])
+
+    for name in ('order_db_pool_checkouts_total', 'order_db_pool_waited_total', 'order_db_pool_exhausted_total',
+                 'order_db_pool_pings_total', 'order_db_pool_wait_seconds_total',
+                 'order_cache_hits_total', 'order_cache_misses_total', 'order_kitchen_feed_published_total'):
+        assert f'# TYPE {name} counter' in text
+    assert 'order_cache_hits_total{service="order_detail_service"} 9' in text
+    for name in ('order_db_pool_in_use', 'order_db_pool_peak_in_use', 'order_db_pool_pool_size',
+                 'order_db_pool_max_wait', 'order_cache_entries', 'order_cache_hit_rate',
+                 'order_kitchen_feed_buffered'):
+        assert f'# TYPE {name} gauge' in text
+    assert '# TYPE order_cache_hits gauge' not in text
@@ -0,0 +1,51 @@
+"""
+Resident memory while stream_pages sends a large listing: it has to stay
+flat, as only one page of rows is held at a time. Linux only (reads /proc).
+"""
+import gc
+import os
+
+import pytest
+
+import memorydb
+from gateway import stream_pages
+
+ROWS = 1000000
+# a buffered listing of ROWS orders takes several hundred MiB
+MAX_GROWTH = 32 * 1024 * 1024
+
+pytestmark = pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason="reads /proc")
+
+
+def rss():
+    """Resident set size of this process in bytes."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+@pytest.fixture(scope='module')
+def large_store():
+    # a store of its own, so the other tests keep their small shared one
+    store = memorydb.MemoryStore()
+    for i in range(ROWS):
+        store.orders.insert(dict(
+            user_id=i % 500, reservasi_id=None, event_id=None, voucher_id=None,
+            order_type=1, total_payment=125000, created_at=None, version=0
+        ))
+    return store
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'json'])
+def test_streamed_listing_keeps_resident_memory_flat(large_store, fmt):
+    database = memorydb.MemoryDatabaseWrapper(large_store)
+    gc.collect()
+    baseline = peak = rss()
+
+    rows = 0
+    for chunk in stream_pages(database.get_orders_page, fmt).response:
+        # every chunk is a whole page of rows
+        rows += chunk.count(b'"order_id":')
+        peak = max(peak, rss())
+
+    assert rows == ROWS
+    assert peak - baseline < MAX_GROWTH
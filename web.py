@@ -0,0 +1,24 @@
+"""
+The gateway's http entrypoint. It is nameko's, except that a route may
+return serialization.dumps() output (bytes) as its payload, which nameko's
+handler rejects; such payloads are sent as application/json.
+"""
+from nameko.web.handlers import HttpRequestHandler
+from werkzeug.wrappers import Response
+
+
+class JsonHttpRequestHandler(HttpRequestHandler):
+
+    def response_from_result(self, result):
+        if isinstance(result, Response):
+            return result
+        if isinstance(result, tuple):
+            status, headers, payload = result if len(result) == 3 else (result[0], None, result[1])
+        else:
+            status, headers, payload = 200, None, result
+        if isinstance(payload, bytes):
+            return Response(payload, status=status, headers=headers, mimetype='application/json')
+        return super().response_from_result(result)
+
+
+http = JsonHttpRequestHandler.decorator